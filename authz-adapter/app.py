@@ -1,13 +1,113 @@
+import ctypes
+import ctypes.util
+import functools
+import hashlib
+import heapq
+import hmac
+import http.cookiejar
+import json
+import logging
+import math
 import os
+import random
+import re
+import select
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import Counter, OrderedDict
 import requests
-from flask import Flask, request, make_response
+import requests.adapters
+from flask import Blueprint, Flask, current_app, jsonify, request, make_response
 
 FENCE_BASE = os.environ.get("FENCE_BASE", "https://calypr-dev.ohsu.edu/user")
 USERINFO_URL = FENCE_BASE.rstrip("/") + "/user"
 TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "3.0"))
 SERVICE_TOKEN = os.environ.get("FENCE_SERVICE_TOKEN", "")
+# Bearer token required on /admin/* endpoints; admin endpoints are disabled when unset.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
 
-app = Flask(__name__)
+# Decision cache: fresh entries are served for CACHE_TTL_SECONDS, then kept for
+# CACHE_STALE_SECONDS more so they can be served if Fence is unreachable. Entries
+# with an ETag or Last-Modified outlive that window (until LRU eviction) so they
+# can still be revalidated with a conditional request, but are never served.
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "300"))
+CACHE_STALE_SECONDS = float(os.environ.get("CACHE_STALE_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+
+# Adaptive concurrency limit on Fence-bound requests (cache hits are never limited).
+# The limit grows additively while Fence answers within FENCE_LATENCY_TARGET_MS
+# and shrinks multiplicatively when it is slower or failing.
+FENCE_CONCURRENCY_INITIAL = int(os.environ.get("FENCE_CONCURRENCY_INITIAL", "16"))
+FENCE_CONCURRENCY_MIN = int(os.environ.get("FENCE_CONCURRENCY_MIN", "2"))
+FENCE_CONCURRENCY_MAX = int(os.environ.get("FENCE_CONCURRENCY_MAX", "64"))
+FENCE_LATENCY_TARGET_MS = float(os.environ.get("FENCE_LATENCY_TARGET_MS", "500"))
+FENCE_QUEUE_SIZE = int(os.environ.get("FENCE_QUEUE_SIZE", "32"))
+FENCE_QUEUE_TIMEOUT = float(os.environ.get("FENCE_QUEUE_TIMEOUT", "1.0"))
+SHED_STATUS_CODE = int(os.environ.get("SHED_STATUS_CODE", "503"))
+ERR_OVERLOADED = "overloaded"
+
+# Token-bucket rate limits on Fence-bound requests per client IP and per token
+# hash. A rate of 0 disables that limit. Buckets live in a fixed-size sketch of
+# RATE_LIMIT_DEPTH rows x RATE_LIMIT_WIDTH cells, so memory is constant.
+RATE_LIMIT_IP_PER_SEC = float(os.environ.get("RATE_LIMIT_IP_PER_SEC", "200"))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "400"))
+RATE_LIMIT_TOKEN_PER_SEC = float(os.environ.get("RATE_LIMIT_TOKEN_PER_SEC", "5"))
+RATE_LIMIT_TOKEN_BURST = float(os.environ.get("RATE_LIMIT_TOKEN_BURST", "10"))
+RATE_LIMIT_WIDTH = int(os.environ.get("RATE_LIMIT_WIDTH", "4096"))
+RATE_LIMIT_DEPTH = int(os.environ.get("RATE_LIMIT_DEPTH", "2"))
+ERR_THROTTLED = "rate limited"
+
+# Revoked tokens: one SHA-256 hex digest of a raw token per line ('#' comments allowed).
+REVOCATION_FILE = os.environ.get("REVOCATION_FILE", "")
+REVOCATION_CAPACITY = int(os.environ.get("REVOCATION_CAPACITY", "100000"))
+REVOCATION_ERROR_RATE = float(os.environ.get("REVOCATION_ERROR_RATE", "0.001"))
+# Hashes revoked through POST /admin/revocations are appended to this file, which
+# every worker loads at startup and reloads on change like REVOCATION_FILE. On a
+# volume shared by all replicas, an admin revocation reaches every replica and
+# survives restarts. Unset, it applies only to the worker process that received it.
+ADMIN_REVOCATION_FILE = os.environ.get("ADMIN_REVOCATION_FILE", "")
+ERR_REVOKED = "token revoked"
+
+# JSON list of repoRegistrations ({name, repoUrl, tenant[, fenceResource]}) used to
+# map Fence resource paths to tenant workflow namespaces.
+REGISTRATIONS_FILE = os.environ.get("REGISTRATIONS_FILE", "")
+
+# Reload REGISTRATIONS_FILE and REVOCATION_FILE when they change (ConfigMap updates).
+# inotify is used where available; CONFIG_POLL_INTERVAL is the mtime polling period.
+CONFIG_WATCH = os.environ.get("CONFIG_WATCH", "true").lower() == "true"
+CONFIG_POLL_INTERVAL = float(os.environ.get("CONFIG_POLL_INTERVAL", "5"))
+
+# Startup warm-up: before /readyz reports ready, a worker resolves the
+# FENCE_SERVICE_TOKEN identity and restores the hottest decisions from
+# CACHE_SNAPSHOT_FILE, which it rewrites every CACHE_SNAPSHOT_INTERVAL seconds.
+# The snapshot holds token hashes, reduced decisions and expiries, never raw tokens.
+CACHE_SNAPSHOT_FILE = os.environ.get("CACHE_SNAPSHOT_FILE", "")
+CACHE_SNAPSHOT_INTERVAL = float(os.environ.get("CACHE_SNAPSHOT_INTERVAL", "60"))
+CACHE_SNAPSHOT_ENTRIES = int(os.environ.get("CACHE_SNAPSHOT_ENTRIES", "1000"))
+
+# Sampling profiler. /debug/profile (admin only) samples every thread for N seconds.
+# /check requests carrying PROFILE_HEADER are sampled individually with
+# probability PROFILE_SAMPLE_RATE; 0 disables this and costs nothing per request.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+PROFILE_HEADER = "X-Authz-Profile"
+
+# Allocation tracing for /debug/memory. tracemalloc starts at import when
+# TRACEMALLOC_FRAMES > 0, or on demand via POST /debug/memory. Tracing slows
+# every allocation while it is on, so it is off by default.
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "0"))
+TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+logger = logging.getLogger(__name__)
 
 
 def decide_groups(
@@ -73,52 +173,1535 @@ def decide_groups(
     return groups
 
 
-def fetch_user_doc(auth_header):
+def token_hash(authorization):
+    """
+    Hash the token in an Authorization header value for use as a key.
+
+    The 'Bearer ' scheme prefix is stripped first, so the digest equals
+    `printf %s "$TOKEN" | sha256sum` and can be used directly in the revocation
+    list. Raw tokens are never stored; every in-process structure keyed by
+    caller identity uses this digest instead.
+
+    Examples:
+        >>> token_hash("Bearer abc") == hashlib.sha256(b"abc").hexdigest()
+        True
+    """
+    if authorization[:7].lower() == "bearer ":
+        authorization = authorization[7:]
+    return hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+
+
+def registration_namespace(registration):
+    """
+    Workflow namespace for a repoRegistration.
+
+    Mirrors the `argo-stack.repoRegistration.namespace` Helm helper:
+    https://github.com/<org>/<repo>.git becomes wf-<org>-<repo>, falling back
+    to wf-<name> when the URL has no org/repo pair.
+
+    Examples:
+        >>> registration_namespace({"repoUrl": "https://github.com/bwalsh/nextflow-hello.git"})
+        'wf-bwalsh-nextflow-hello'
+    """
+    cleaned = (registration.get("repoUrl") or "").removesuffix(".git")
+    for prefix in ("https://", "http://", "github.com/"):
+        cleaned = cleaned.removeprefix(prefix)
+    parts = cleaned.split("/")
+    if len(parts) >= 2:
+        return f"wf-{parts[0]}-{parts[1]}"
+    return f"wf-{registration.get('name', '')}"
+
+
+def registration_resource(registration):
+    """
+    Fence resource path that grants access to a repoRegistration.
+
+    Uses an explicit `fenceResource` when present; otherwise a tenant of the
+    form 'program/project' maps to /programs/<program>/projects/<project> and
+    a bare org code maps to /programs/<org>. Returns None without a tenant.
+
+    Examples:
+        >>> registration_resource({"tenant": "ohsu/lung"})
+        '/programs/ohsu/projects/lung'
+        >>> registration_resource({"tenant": "myorg"})
+        '/programs/myorg'
+    """
+    resource = registration.get("fenceResource")
+    if resource:
+        return "/" + resource.strip("/")
+    tenant = (registration.get("tenant") or "").strip("/")
+    if not tenant:
+        return None
+    if "/" in tenant:
+        program, project = tenant.split("/", 1)
+        return f"/programs/{program}/projects/{project}"
+    return f"/programs/{tenant}"
+
+
+class NamespaceIndex:
+    """
+    Precomputed map from Fence resource paths to tenant workflow namespaces.
+
+    Every ancestor of a registration's resource path is indexed too, since a
+    Fence grant on /programs/<p> covers all of its projects. Reducing a user
+    document is then one dict lookup per granted path instead of a scan of
+    the registrations.
+
+    Examples:
+        >>> index = NamespaceIndex([
+        ...     {"repoUrl": "https://github.com/ohsu/lung-wf.git", "tenant": "ohsu/lung"},
+        ... ])
+        >>> sorted(index.namespaces_for({"/programs/ohsu": [{"method": "read"}]})[0])
+        ['wf-ohsu-lung-wf']
+    """
+
+    RUNNER_METHODS = ("create", "*")
+
+    def __init__(self, registrations=()):
+        by_resource = {}
+        for registration in registrations:
+            resource = registration_resource(registration)
+            if not resource:
+                continue
+            namespace = registration_namespace(registration)
+            segments = resource.strip("/").split("/")
+            for depth in range(1, len(segments) + 1):
+                prefix = "/" + "/".join(segments[:depth])
+                by_resource.setdefault(prefix, set()).add(namespace)
+        self._by_resource = {path: frozenset(ns) for path, ns in by_resource.items()}
+        mapping = sorted((path, sorted(ns)) for path, ns in self._by_resource.items())
+        self.fingerprint = hashlib.sha256(json.dumps(mapping).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def from_file(cls, path):
+        """Build an index from a JSON file holding a list of repoRegistrations."""
+        with open(path, encoding="utf-8") as f:
+            registrations = json.load(f) or []
+        return cls(registrations)
+
+    def namespaces_for(self, authz):
+        """
+        Compute the namespaces a Fence authz mapping grants.
+
+        Args:
+            authz: The 'authz' mapping from a Fence user document
+
+        Returns:
+            Tuple of (namespaces, runner_namespaces) frozensets: namespaces with
+            any grant, and those whose grant includes create or '*'.
+        """
+        readable, runnable = set(), set()
+        for path, permissions in authz.items():
+            namespaces = self._by_resource.get(path.rstrip("/"))
+            if not namespaces:
+                continue
+            readable |= namespaces
+            if any(p.get("method") in self.RUNNER_METHODS for p in permissions):
+                runnable |= namespaces
+        return frozenset(readable), frozenset(runnable)
+
+    def changed_resources(self, other):
+        """
+        Resource paths whose namespace mapping differs between self and other.
+
+        Only cached decisions that hold a grant on one of these paths can be
+        affected by replacing self with other.
+        """
+        mine, theirs = self._by_resource, other._by_resource
+        return frozenset(
+            path for path in mine.keys() | theirs.keys() if mine.get(path) != theirs.get(path)
+        )
+
+    def __len__(self):
+        return len(self._by_resource)
+
+
+class Decision:
+    """
+    Reduced authorization result for one token.
+
+    Holds only what /check needs to answer (identity, groups and the tenant
+    namespaces the user may read or run in), the Fence resource paths the
+    namespaces were derived from, the freshness bounds used by DecisionCache,
+    how often it has been served and the userinfo validators (ETag,
+    Last-Modified) used to revalidate it; the Fence document is discarded.
     """
-    Fetch user authorization document from Fence userinfo endpoint.
 
-    Validates the provided authorization token by calling the Fence /user endpoint.
-    Falls back to using a service token if no user token is provided.
+    __slots__ = (
+        "email", "groups", "expires_at", "stale_until", "namespaces", "runner_namespaces",
+        "resources", "hits", "validators",
+    )
+
+    def __init__(
+            self,
+            email,
+            groups,
+            expires_at=0.0,
+            stale_until=0.0,
+            namespaces=frozenset(),
+            runner_namespaces=frozenset(),
+            resources=frozenset(),
+    ):
+        self.email = email
+        self.groups = groups
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.namespaces = namespaces
+        self.runner_namespaces = runner_namespaces
+        self.resources = resources
+        self.hits = 0
+        self.validators = None
+
+    def renew(self, now=None, ttl=CACHE_TTL_SECONDS, stale=CACHE_STALE_SECONDS):
+        """Restart the freshness window, e.g. after Fence answered 304 Not Modified."""
+        if now is None:
+            now = time.monotonic()
+        self.expires_at = now + ttl
+        self.stale_until = self.expires_at + stale
+
+    def groups_for_namespace(self, namespace):
+        """
+        Groups for a request scoped to one tenant namespace.
+
+        Returns:
+            [] when the namespace is not granted, the decision's groups without
+            'argo-runner' when only read access is granted, else all groups.
+        """
+        if namespace not in self.namespaces:
+            return []
+        if namespace in self.runner_namespaces:
+            return self.groups
+        return [g for g in self.groups if g != "argo-runner"]
+
+
+def reduce_user_doc(doc, now=None, index=None, ttl=CACHE_TTL_SECONDS, stale=CACHE_STALE_SECONDS):
+    """
+    Reduce a Fence user document to a cacheable Decision.
 
     Args:
-        auth_header: Authorization header value (e.g., 'Bearer <token>')
+        doc: User authorization document from Fence
+        now: Monotonic timestamp used to compute expiry (defaults to time.monotonic())
+        index: NamespaceIndex to resolve namespaces with (defaults to the
+            default adapter's index)
+        ttl: Seconds the decision is fresh (default: CACHE_TTL_SECONDS)
+        stale: Further seconds it may be served while Fence is failing
+            (default: CACHE_STALE_SECONDS)
 
     Returns:
-        Tuple of (user_doc, error):
-            - user_doc: Dictionary containing user info and authz data, or None on error
-            - error: Error message string, or None on success
+        Decision with email, groups, allowed namespaces and expiry set from
+        ttl and stale. Inactive users yield a Decision with no groups or
+        namespaces.
+    """
+    if now is None:
+        now = time.monotonic()
+    if index is None:
+        index = ADAPTER.namespace_index
+    email = doc.get("email") or doc.get("name") or doc.get("username") or "unknown"
+    groups = decide_groups(doc)
+    namespaces, runner_namespaces, resources = frozenset(), frozenset(), frozenset()
+    if groups:
+        authz = doc.get("authz") or {}
+        namespaces, runner_namespaces = index.namespaces_for(authz)
+        resources = frozenset(path.rstrip("/") for path in authz)
+    expires_at = now + ttl
+    return Decision(
+        email, groups, expires_at, expires_at + stale,
+        namespaces, runner_namespaces, resources,
+    )
+
+
+class DecisionCache:
+    """
+    Bounded, thread-safe LRU cache of Decisions keyed by token hash.
+
+    Lookups report one of these statuses:
+        - 'hit': entry is fresh and can be served as-is
+        - 'stale': entry expired but is still inside its stale window; callers
+          may serve it only if Fence cannot be reached
+        - 'expired': entry is past its stale window but holds validators;
+          callers may use it only to revalidate, never serve it
+        - 'miss': no usable entry
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """Return (decision, status) for key; decision is None on a miss."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, "miss"
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                return entry, "hit"
+            if now < entry.stale_until:
+                entry.hits += 1
+                return entry, "stale"
+            if entry.validators:
+                return entry, "expired"
+            del self._entries[key]
+            return None, "miss"
+
+    def set(self, key, decision):
+        """Store decision under key, evicting the least recently used entry when full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = decision
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        """Remove key if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_resources(self, resources):
+        """
+        Drop every entry whose Decision holds a grant on one of resources.
+
+        Returns:
+            Number of entries removed.
+        """
+        if not resources:
+            return 0
+        with self._lock:
+            doomed = [
+                key for key, entry in self._entries.items()
+                if not entry.resources.isdisjoint(resources)
+            ]
+            for key in doomed:
+                del self._entries[key]
+        return len(doomed)
+
+    def hottest(self, limit, now=None):
+        """Return up to limit (key, decision) pairs inside their stale window, most hit first."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            live = [(key, entry) for key, entry in self._entries.items() if now < entry.stale_until]
+        return heapq.nlargest(limit, live, key=lambda item: item[1].hits)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheSnapshot:
+    """
+    Compact file holding the hottest cached decisions, used to warm a restarted worker.
+
+    Each entry is a token hash with its reduced Decision and expiry. Expiries
+    are stored as wall-clock times, since monotonic clocks do not survive a
+    restart. Raw tokens are never written. The file is replaced atomically,
+    is readable by its owner only, and is tagged with the NamespaceIndex
+    fingerprint so decisions are not restored against changed registrations.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, max_entries=CACHE_SNAPSHOT_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+
+    def write(self, cache, index):
+        """
+        Write the hottest entries of cache.
+
+        Returns:
+            Number of entries written.
+        """
+        mono, wall = time.monotonic(), time.time()
+        offset = wall - mono
+        entries = [
+            [
+                key, d.email, d.groups,
+                round(d.expires_at + offset, 3), round(d.stale_until + offset, 3),
+                sorted(d.namespaces), sorted(d.runner_namespaces), sorted(d.resources), d.hits,
+                d.validators,
+            ]
+            for key, d in cache.hottest(self.max_entries, mono)
+        ]
+        payload = {"version": self.VERSION, "index": index.fingerprint, "entries": entries}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        return len(entries)
+
+    def load(self, cache, index, revoked=()):
+        """
+        Restore unexpired, unrevoked entries into cache.
+
+        A missing, unreadable or outdated file (other version or registrations)
+        restores nothing.
+
+        Returns:
+            Number of entries restored.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning("ignoring cache snapshot %s: %s", self.path, e)
+            return 0
+        if payload.get("version") != self.VERSION or payload.get("index") != index.fingerprint:
+            logger.info("cache snapshot %s is for other registrations; not restoring", self.path)
+            return 0
+        mono, wall = time.monotonic(), time.time()
+        restored = 0
+        # Coldest first, so the hottest entries end up most recently used.
+        for entry in reversed(payload.get("entries") or []):
+            try:
+                key, email, groups, expires_at, stale_until, ns, runner, resources, hits = entry[:9]
+                validators = entry[9] if len(entry) > 9 else None
+            except (TypeError, ValueError):
+                continue
+            if stale_until <= wall or not RevocationList.is_valid_hash(key) or key in revoked:
+                continue
+            decision = Decision(
+                email, groups, expires_at - wall + mono, stale_until - wall + mono,
+                frozenset(ns), frozenset(runner), frozenset(resources),
+            )
+            decision.hits = hits
+            if validators:
+                decision.validators = tuple(validators)
+            cache.set(key, decision)
+            restored += 1
+        return restored
+
+
+class _Flight:
+    """A Fence lookup in progress that concurrent callers for the same key can wait on."""
+
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = (None, "timeout", None)
+
+
+class RequestTiming:
+    """
+    Per-request phase timer rendered as Server-Timing and X-Authz-* headers.
+
+    Phases are accumulated in milliseconds from time.perf_counter() deltas so
+    attribution costs a handful of clock reads per request.
+    """
+
+    __slots__ = ("start", "phases", "cache_status")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.cache_status = "miss"
+
+    def record(self, phase, started):
+        """Add the time elapsed since `started` (a perf_counter value) to `phase`."""
+        self.phases[phase] = self.phases.get(phase, 0.0) + (time.perf_counter() - started) * 1000.0
+
+    def headers(self):
+        """Return the Server-Timing, X-Authz-Cache and X-Authz-Duration-Ms headers."""
+        total = (time.perf_counter() - self.start) * 1000.0
+        cache = f'cache;desc="{self.cache_status}"'
+        if "cache" in self.phases:
+            cache += f";dur={self.phases['cache']:.3f}"
+        metrics = [cache]
+        metrics.extend(
+            f"{name};dur={dur:.3f}" for name, dur in self.phases.items() if name != "cache"
+        )
+        metrics.append(f"total;dur={total:.3f}")
+        return {
+            "Server-Timing": ", ".join(metrics),
+            "X-Authz-Cache": self.cache_status,
+            "X-Authz-Duration-Ms": f"{total:.3f}",
+        }
+
+    def apply(self, resp):
+        """Set the diagnostic headers on a Flask response."""
+        resp.headers.update(self.headers())
+        return resp
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter with a bounded wait queue.
+
+    Callers that find the limit reached wait in a queue of at most `max_queue`
+    entries for up to `queue_timeout` seconds; when the queue is full they are
+    rejected immediately. After each call the limit is adjusted from the
+    observed latency: +1/limit on success within `latency_target_ms`, and
+    multiplied by `backoff` on a slow or failed call.
+
+    Examples:
+        >>> limiter = AdaptiveLimiter(initial=1, max_queue=0)
+        >>> limiter.acquire()
+        True
+        >>> limiter.acquire()
+        False
+        >>> limiter.release(latency_ms=10.0, ok=True)
+    """
+
+    def __init__(
+            self,
+            initial=FENCE_CONCURRENCY_INITIAL,
+            min_limit=FENCE_CONCURRENCY_MIN,
+            max_limit=FENCE_CONCURRENCY_MAX,
+            latency_target_ms=FENCE_LATENCY_TARGET_MS,
+            max_queue=FENCE_QUEUE_SIZE,
+            queue_timeout=FENCE_QUEUE_TIMEOUT,
+            backoff=0.9,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_target_ms = latency_target_ms
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.inflight = 0
+        self.waiting = 0
+        self.shed = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if needed. Returns False when shed."""
+        with self._cond:
+            if self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.inflight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.inflight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, latency_ms, ok):
+        """Return a slot and adapt the limit from the call's latency and outcome."""
+        with self._cond:
+            self.inflight -= 1
+            if ok and latency_ms <= self.latency_target_ms:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._cond.notify()
+
+
+class TokenBucketSketch:
+    """
+    Fixed-size token-bucket rate limiter in the shape of a count-min sketch.
+
+    Each key maps to one bucket in each of `depth` rows of `width` cells. A
+    request is allowed while any of its buckets still holds a token, and then
+    draws a token from all of them, so hash collisions can only make limits
+    looser for the colliding keys, never throttle an idle key. Memory is
+    2 * width * depth doubles regardless of how many distinct keys are seen.
+
+    Examples:
+        >>> limiter = TokenBucketSketch(rate=1.0, burst=2, width=64, depth=2)
+        >>> [limiter.allow("10.0.0.1", now=0.0) for _ in range(3)]
+        [True, True, False]
+        >>> limiter.allow("10.0.0.1", now=1.0)
+        True
+    """
+
+    def __init__(self, rate, burst, width=RATE_LIMIT_WIDTH, depth=RATE_LIMIT_DEPTH):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.width = max(width, 1)
+        self.depth = max(depth, 1)
+        cells = self.width * self.depth
+        self._tokens = array("d", [self.burst]) * cells
+        self._stamps = array("d", [0.0]) * cells
+        self._lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        """Consume one token for key; return False if the key is over its rate."""
+        if self.rate <= 0:
+            return True
+        if now is None:
+            now = time.monotonic()
+        cells = [row * self.width + hash((row, key)) % self.width for row in range(self.depth)]
+        with self._lock:
+            tokens, stamps = self._tokens, self._stamps
+            best = 0.0
+            for cell in cells:
+                level = min(self.burst, tokens[cell] + (now - stamps[cell]) * self.rate)
+                tokens[cell] = level
+                stamps[cell] = now
+                best = max(best, level)
+            if best < 1.0:
+                return False
+            for cell in cells:
+                tokens[cell] = max(0.0, tokens[cell] - 1.0)
+            return True
+
+
+class RevocationList:
+    """
+    Set of revoked token hashes fronted by a Bloom filter.
+
+    Membership tests hash nothing: the bit positions are taken directly from
+    the SHA-256 digest (double hashing over two 64-bit slices), so a negative
+    answer costs k bit reads. Bloom positives are confirmed against an exact
+    set, so false positives never reject a valid token. The filter is resized
+    when the set grows past its capacity.
+
+    Examples:
+        >>> revoked = RevocationList(capacity=100)
+        >>> revoked.add(token_hash("Bearer stolen"))
+        True
+        >>> token_hash("Bearer stolen") in revoked, token_hash("Bearer fine") in revoked
+        (True, False)
+    """
+
+    _HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+    def __init__(self, capacity=REVOCATION_CAPACITY, error_rate=REVOCATION_ERROR_RATE):
+        self.error_rate = error_rate
+        self.capacity = max(capacity, 1)
+        self._exact = set()
+        self._lock = threading.Lock()
+        self._filter = self._build(self.capacity)
+
+    def _build(self, capacity):
+        """
+        A filter sized for capacity hashes, holding every hash added so far.
+
+        The filter is one (num_bits, num_hashes, bits) tuple so a resize can
+        publish it with a single assignment; lookups take one snapshot of it
+        and never see a bit array paired with another size.
+        """
+        num_bits = max(64, int(-capacity * math.log(self.error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        bloom = (num_bits, num_hashes, bytearray((num_bits + 7) // 8))
+        for digest in self._exact:
+            self._set_bits(bloom, digest)
+        return bloom
+
+    @staticmethod
+    def _positions(digest, num_bits, num_hashes):
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        return ((h1 + i * h2) % num_bits for i in range(num_hashes))
+
+    @classmethod
+    def _set_bits(cls, bloom, digest):
+        num_bits, num_hashes, bits = bloom
+        for pos in cls._positions(digest, num_bits, num_hashes):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    @property
+    def num_bits(self):
+        return self._filter[0]
+
+    @property
+    def num_hashes(self):
+        return self._filter[1]
+
+    @classmethod
+    def is_valid_hash(cls, digest):
+        """Return True if digest is a lowercase SHA-256 hex string."""
+        return isinstance(digest, str) and bool(cls._HASH_RE.match(digest))
+
+    def __contains__(self, digest):
+        num_bits, num_hashes, bits = self._filter
+        for pos in self._positions(digest, num_bits, num_hashes):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return digest in self._exact
+
+    def add(self, digest):
+        """Add a token hash. Returns False if it was already present."""
+        with self._lock:
+            if digest in self._exact:
+                return False
+            self._exact.add(digest)
+            if len(self._exact) > self.capacity:
+                self._filter = self._build(self.capacity * 2)
+                self.capacity *= 2
+            else:
+                self._set_bits(self._filter, digest)
+            return True
+
+    def load_file(self, path):
+        """
+        Add every hash listed in path (one per line, '#' starts a comment).
+
+        Returns:
+            Number of new hashes added. Malformed lines are logged and skipped.
+        """
+        return sum(self.add(digest) for digest in read_revocation_file(path))
+
+    def __len__(self):
+        return len(self._exact)
+
+
+def read_revocation_file(path):
+    """Yield the token hashes listed in a revocation file, logging and skipping malformed lines."""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            digest = line.split("#", 1)[0].strip().lower()
+            if not digest:
+                continue
+            if not RevocationList.is_valid_hash(digest):
+                logger.warning("ignoring malformed revocation entry at %s:%d", path, lineno)
+                continue
+            yield digest
+
+
+class ConfigWatcher:
+    """
+    Background watcher that reloads config files when they change.
+
+    Kubernetes updates mounted ConfigMaps by swapping a '..data' symlink, so
+    files are compared by the (inode, mtime, size) of their resolved target
+    rather than by events on the file itself. On Linux the watched directories
+    are observed with inotify and a change is picked up within ~100ms;
+    elsewhere, or if inotify is unavailable, files are polled every
+    `poll_interval` seconds. Loaders run on the watcher thread, never on the
+    request path.
 
     Examples:
-        >>> doc, err = fetch_user_doc("Bearer valid-token")
-        >>> if err:
-        ...     print(f"Error: {err}")
-        ... else:
-        ...     print(doc.get("email"))
+        >>> watcher = ConfigWatcher(poll_interval=1.0)
+        >>> watcher.watch("/etc/authz-adapter/registrations/registrations.json", print)
+        >>> watcher.start()  # doctest: +SKIP
+    """
+
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x002, 0x004, 0x008
+    IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x080, 0x100, 0x200
+
+    def __init__(self, poll_interval=CONFIG_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._watches = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._wake = None
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def watch(self, path, loader):
+        """Call loader(path) whenever path's content changes after this call."""
+        self._watches.append([path, loader, self._signature(path)])
+
+    def check(self):
+        """Reload every watched file whose signature changed. Returns the paths reloaded."""
+        reloaded = []
+        for watch in self._watches:
+            path, loader, previous = watch
+            current = self._signature(path)
+            if current == previous:
+                continue
+            watch[2] = current
+            if current is None:
+                logger.warning("watched config %s disappeared; keeping last loaded version", path)
+                continue
+            try:
+                loader(path)
+                reloaded.append(path)
+                logger.info("reloaded config %s", path)
+            except Exception:
+                logger.exception("failed to reload config %s; keeping last loaded version", path)
+        return reloaded
+
+    def _inotify(self):
+        """Return an inotify fd watching the parent directories, or None."""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = (
+            self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE
+            | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        )
+        watched = 0
+        for directory in {os.path.dirname(os.path.abspath(w[0])) for w in self._watches}:
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) >= 0:
+                watched += 1
+        if not watched:
+            os.close(fd)
+            return None
+        return fd
+
+    def _run(self):
+        fd = self._inotify()
+        try:
+            while not self._stop.is_set():
+                if fd is None:
+                    self._stop.wait(self.poll_interval)
+                else:
+                    readable, _, _ = select.select([fd, self._wake[0]], [], [], self.poll_interval)
+                    if fd in readable:
+                        # Let the symlink swap settle, then drain queued events.
+                        self._stop.wait(0.1)
+                        try:
+                            while os.read(fd, 65536):
+                                pass
+                        except BlockingIOError:
+                            pass
+                if not self._stop.is_set():
+                    self.check()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def start(self):
+        """Start the watcher thread (daemon). No-op if nothing is watched."""
+        if self._watches and self._thread is None:
+            self._stop.clear()
+            self._wake = os.pipe()
+            self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread and wait for it to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            os.write(self._wake[1], b"x")
+            self._thread.join()
+            self._thread = None
+            for end in self._wake:
+                os.close(end)
+            self._wake = None
+
+
+def collapse_stack(frame, limit=64):
+    """
+    Render a frame and its callers as one collapsed-stack line, root first.
+
+    Frames are 'module:qualname' joined by ';', the format read by
+    flamegraph.pl, speedscope and similar tools.
+    """
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Statistical profiler that samples Python thread stacks.
+
+    Every interval the sampler reads sys._current_frames() and counts each
+    collapsed stack, so the cost is paid by the sampler thread and scales
+    with the sampling rate rather than with the traced code. The threads
+    doing the sampling are never counted.
+
+    Examples:
+        >>> sampler = StackSampler(interval=0.005)
+        >>> sampler.run_for(10.0)
+        >>> print(sampler.collapsed())
+        app:check;app:authorize;app:resolve_decision 42
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def sample(self, thread_ids=None, exclude=()):
+        """Take one sample of thread_ids (all threads when None)."""
+        frames = sys._current_frames()
+        stacks = [
+            collapse_stack(frame) for ident, frame in frames.items()
+            if ident not in exclude and (thread_ids is None or ident in thread_ids)
+        ]
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += 1
+
+    def run_for(self, seconds, stop=None):
+        """Sample every thread except the caller for `seconds` or until stop is set."""
+        stop = stop or threading.Event()
+        exclude = {threading.get_ident()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not stop.is_set():
+            self.sample(exclude=exclude)
+            stop.wait(self.interval)
+
+    def collapsed(self, clear=False):
+        """Return the counted stacks as 'frame;frame;frame count' lines, hottest first."""
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+            if clear:
+                self.stacks.clear()
+                self.samples = 0
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+class RequestProfiler(StackSampler):
+    """
+    Samples only the threads currently serving profiled requests.
+
+    A single sampler thread runs while at least one request is being
+    profiled and exits when none are, so nothing runs between profiled
+    requests. Stacks from all profiled requests accumulate until collected.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000.0):
+        super().__init__(interval)
+        self._active = set()
+        self._thread = None
+
+    def begin(self):
+        """Start sampling the calling thread."""
+        with self._lock:
+            self._active.add(threading.get_ident())
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="request-profiler", daemon=True
+                )
+                self._thread.start()
+
+    def end(self):
+        """Stop sampling the calling thread."""
+        with self._lock:
+            self._active.discard(threading.get_ident())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = frozenset(self._active)
+                if not active:
+                    self._thread = None
+                    return
+            self.sample(thread_ids=active)
+            time.sleep(self.interval)
+
 
-    Raises:
-        No exceptions are raised; errors are returned in the tuple
+def top_allocations(snapshot, previous=None, limit=20, key_type="lineno"):
     """
-    headers = {}
-    if auth_header and auth_header.lower().startswith("bearer "):
-        headers["Authorization"] = auth_header
-    elif SERVICE_TOKEN:
-        headers["Authorization"] = "Bearer " + SERVICE_TOKEN
+    Summarize a tracemalloc snapshot by allocation site.
+
+    Args:
+        snapshot: tracemalloc.Snapshot to summarize
+        previous: Earlier snapshot; when given, sites are ranked by growth
+            since it and each row carries size_diff_bytes and count_diff
+        limit: Maximum number of sites returned
+        key_type: 'lineno', 'filename' or 'traceback'
+
+    Returns:
+        List of dicts with site, size_bytes and count, largest first. With
+        key_type 'traceback' each row also lists its frames, innermost last.
+    """
+    snapshot = snapshot.filter_traces(TRACEMALLOC_FILTERS)
+    if previous is not None:
+        stats = snapshot.compare_to(previous.filter_traces(TRACEMALLOC_FILTERS), key_type)
     else:
-        return None, "no token"
+        stats = snapshot.statistics(key_type)
+    rows = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[-1] if key_type == "traceback" else stat.traceback[0]
+        site = frame.filename if key_type == "filename" else f"{frame.filename}:{frame.lineno}"
+        row = {"site": site, "size_bytes": stat.size, "count": stat.count}
+        if previous is not None:
+            row["size_diff_bytes"] = stat.size_diff
+            row["count_diff"] = stat.count_diff
+        if key_type == "traceback":
+            row["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+        rows.append(row)
+    return rows
 
-    try:
-        r = requests.get(USERINFO_URL, headers=headers, timeout=TIMEOUT)
-        if r.status_code != 200:
-            return None, f"userinfo status {r.status_code}"
-        return r.json(), None
-    except requests.exceptions.Timeout:
-        return None, "timeout"
-    except requests.exceptions.ConnectionError:
-        return None, "connection error"
-    except requests.exceptions.RequestException as e:
-        return None, f"request error: {e}"
-    except Exception as e:
-        return None, f"unexpected error: {e}"
+
+def client_ip(req):
+    """
+    Determine the client address for rate limiting.
+
+    Prefers X-Real-IP (set by the ingress from $remote_addr), then the last
+    X-Forwarded-For hop, which was appended by the nearest proxy, and finally
+    the socket peer address.
+    """
+    real_ip = req.headers.get("X-Real-IP", "").strip()
+    if real_ip:
+        return real_ip
+    forwarded = req.headers.get("X-Forwarded-For", "")
+    if forwarded:
+        hop = forwarded.rsplit(",", 1)[-1].strip()
+        if hop:
+            return hop
+    return req.remote_addr or "unknown"
+
+
+# Process-wide state shared by every adapter instance: the profiler samples all
+# threads and tracemalloc traces the whole interpreter.
+REQUEST_PROFILER = RequestProfiler()
+_profile_lock = threading.Lock()
+if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+# Snapshot taken by the previous GET /debug/memory, for growth since then.
+_memory_baseline = {"snapshot": None}
+_memory_lock = threading.Lock()
+
+
+def identity_headers(email, groups):
+    """Build the X-Auth-Request-* headers forwarded to upstream services."""
+    return {
+        "X-Auth-Request-User": email,
+        "X-Auth-Request-Email": email,
+        "X-Auth-Request-Groups": ",".join(groups),
+        "X-Allowed": "true",
+    }
+
+
+class AuthzAdapter:
+    """
+    One authz-adapter instance: its settings, Fence session pool and state.
+
+    Everything a decision depends on (Fence URL, timeout and service token,
+    the pooled HTTP session, decision cache, namespace index, revocation
+    list, limiters, cache snapshot and config watcher) belongs to the
+    instance, so several adapters with different settings can run in one
+    process. create_app() attaches one to each Flask app.
+
+    Args:
+        config: Mapping of setting names to values, using the environment
+            variable names listed at the end of this file (FENCE_BASE,
+            HTTP_TIMEOUT, CACHE_TTL_SECONDS, ...). Unset names fall back to
+            the environment and then to the defaults.
+
+    Examples:
+        >>> adapter = AuthzAdapter({"FENCE_BASE": "https://fence.example.com/user",
+        ...                         "CACHE_MAX_ENTRIES": 100, "CONFIG_WATCH": "false"})
+        >>> adapter.userinfo_url, adapter.cache.max_entries
+        ('https://fence.example.com/user/user', 100)
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+
+        def setting(name, default, cast=str):
+            value = config.get(name)
+            return default if value is None else cast(value)
+
+        self.userinfo_url = setting("FENCE_BASE", FENCE_BASE).rstrip("/") + "/user"
+        self.timeout = setting("HTTP_TIMEOUT", TIMEOUT, float)
+        self.service_token = setting("FENCE_SERVICE_TOKEN", SERVICE_TOKEN)
+        self.admin_token = setting("ADMIN_TOKEN", ADMIN_TOKEN)
+        self.cache_ttl = setting("CACHE_TTL_SECONDS", CACHE_TTL_SECONDS, float)
+        self.cache_stale = setting("CACHE_STALE_SECONDS", CACHE_STALE_SECONDS, float)
+        self.shed_status_code = setting("SHED_STATUS_CODE", SHED_STATUS_CODE, int)
+        self.queue_timeout = setting("FENCE_QUEUE_TIMEOUT", FENCE_QUEUE_TIMEOUT, float)
+        concurrency_max = setting("FENCE_CONCURRENCY_MAX", FENCE_CONCURRENCY_MAX, int)
+
+        # Keep-alive connections to Fence, one pool slot per allowed concurrent
+        # call. Cookies are never stored: the session is shared by every caller.
+        self.session = requests.Session()
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        pool = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(concurrency_max, 1)
+        )
+        self.session.mount("https://", pool)
+        self.session.mount("http://", pool)
+
+        self.cache = DecisionCache(setting("CACHE_MAX_ENTRIES", CACHE_MAX_ENTRIES, int))
+        registrations_file = setting("REGISTRATIONS_FILE", REGISTRATIONS_FILE)
+        self.namespace_index = NamespaceIndex()
+        if registrations_file and os.path.exists(registrations_file):
+            self.namespace_index = NamespaceIndex.from_file(registrations_file)
+        revocation_file = setting("REVOCATION_FILE", REVOCATION_FILE)
+        self.revocation_capacity = setting("REVOCATION_CAPACITY", REVOCATION_CAPACITY, int)
+        self.revocation_error_rate = setting("REVOCATION_ERROR_RATE", REVOCATION_ERROR_RATE, float)
+        self.revocations = RevocationList(self.revocation_capacity, self.revocation_error_rate)
+        if revocation_file and os.path.exists(revocation_file):
+            self.revocations.load_file(revocation_file)
+        self.admin_revoked = set()
+        self.admin_revocation_file = setting("ADMIN_REVOCATION_FILE", ADMIN_REVOCATION_FILE)
+        self._admin_file_lock = threading.Lock()
+        # Loaded before warm-up, so a snapshot written before a revocation
+        # cannot bring the revoked token's decision back.
+        if self.admin_revocation_file and os.path.exists(self.admin_revocation_file):
+            self.load_admin_revocations(self.admin_revocation_file)
+
+        self.fence_limiter = AdaptiveLimiter(
+            initial=setting("FENCE_CONCURRENCY_INITIAL", FENCE_CONCURRENCY_INITIAL, int),
+            min_limit=setting("FENCE_CONCURRENCY_MIN", FENCE_CONCURRENCY_MIN, int),
+            max_limit=concurrency_max,
+            latency_target_ms=setting("FENCE_LATENCY_TARGET_MS", FENCE_LATENCY_TARGET_MS, float),
+            max_queue=setting("FENCE_QUEUE_SIZE", FENCE_QUEUE_SIZE, int),
+            queue_timeout=self.queue_timeout,
+        )
+        width = setting("RATE_LIMIT_WIDTH", RATE_LIMIT_WIDTH, int)
+        depth = setting("RATE_LIMIT_DEPTH", RATE_LIMIT_DEPTH, int)
+        self.ip_rate_limiter = TokenBucketSketch(
+            setting("RATE_LIMIT_IP_PER_SEC", RATE_LIMIT_IP_PER_SEC, float),
+            setting("RATE_LIMIT_IP_BURST", RATE_LIMIT_IP_BURST, float),
+            width, depth,
+        )
+        self.token_rate_limiter = TokenBucketSketch(
+            setting("RATE_LIMIT_TOKEN_PER_SEC", RATE_LIMIT_TOKEN_PER_SEC, float),
+            setting("RATE_LIMIT_TOKEN_BURST", RATE_LIMIT_TOKEN_BURST, float),
+            width, depth,
+        )
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+        snapshot_file = setting("CACHE_SNAPSHOT_FILE", CACHE_SNAPSHOT_FILE)
+        self.cache_snapshot = CacheSnapshot(
+            snapshot_file, setting("CACHE_SNAPSHOT_ENTRIES", CACHE_SNAPSHOT_ENTRIES, int)
+        ) if snapshot_file else None
+        self.snapshot_interval = setting("CACHE_SNAPSHOT_INTERVAL", CACHE_SNAPSHOT_INTERVAL, float)
+        # Set once warm-up has finished; start_warm_up() clears it until then.
+        self.ready = threading.Event()
+        self.ready.set()
+        self._snapshot_stop = threading.Event()
+
+        self.config_watcher = ConfigWatcher(
+            setting("CONFIG_POLL_INTERVAL", CONFIG_POLL_INTERVAL, float)
+        )
+        if setting("CONFIG_WATCH", CONFIG_WATCH, lambda v: str(v).lower() == "true"):
+            if registrations_file:
+                self.config_watcher.watch(registrations_file, self.reload_registrations)
+            if revocation_file:
+                self.config_watcher.watch(revocation_file, self.reload_revocations)
+            if self.admin_revocation_file:
+                self.config_watcher.watch(self.admin_revocation_file, self.load_admin_revocations)
+            self.config_watcher.start()
+
+    def close(self):
+        """Stop background threads and close pooled Fence connections."""
+        self._snapshot_stop.set()
+        self.config_watcher.stop()
+        self.session.close()
+
+    def userinfo_authorization(self, auth_header):
+        """
+        Choose the Authorization header value to send to Fence.
+
+        Args:
+            auth_header: Incoming Authorization header value (may be None or empty)
+
+        Returns:
+            The caller's bearer header, 'Bearer <FENCE_SERVICE_TOKEN>' when the
+            caller sent no bearer token and a service token is configured, or
+            None otherwise.
+        """
+        if auth_header and auth_header.lower().startswith("bearer "):
+            return auth_header
+        if self.service_token:
+            return "Bearer " + self.service_token
+        return None
+
+    def fetch_user_doc(self, auth_header):
+        """
+        Fetch user authorization document from Fence userinfo endpoint.
+
+        Validates the provided authorization token by calling the Fence /user endpoint.
+        Falls back to using a service token if no user token is provided.
+
+        Args:
+            auth_header: Authorization header value (e.g., 'Bearer <token>')
+
+        Returns:
+            Tuple of (user_doc, error):
+                - user_doc: Dictionary containing user info and authz data, or None on error
+                - error: Error message string, or None on success
+
+        Examples:
+            >>> doc, err = fetch_user_doc("Bearer valid-token")
+            >>> if err:
+            ...     print(f"Error: {err}")
+            ... else:
+            ...     print(doc.get("email"))
+
+        Raises:
+            No exceptions are raised; errors are returned in the tuple
+        """
+        authorization = self.userinfo_authorization(auth_header)
+        if authorization is None:
+            return None, "no token"
+        doc, err, _, _ = self._get_userinfo(authorization)
+        return doc, err
+
+    def _get_userinfo(self, authorization, validators=None):
+        """
+        Call the Fence userinfo endpoint with a prepared Authorization value.
+
+        Args:
+            authorization: Authorization header value to send
+            validators: Optional (etag, last_modified) from an earlier response,
+                sent as If-None-Match / If-Modified-Since so Fence can answer 304
+                instead of resending an unchanged document
+
+        Returns:
+            Tuple of (user_doc, error, status_code, validators). status_code is None
+            when no HTTP response was received (timeout, connection or decoding
+            error). On 304, user_doc and error are None. validators is the
+            (etag, last_modified) pair to revalidate with next time.
+        """
+        headers = {"Authorization": authorization}
+        if validators:
+            etag, last_modified = validators
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        try:
+            r = self.session.get(self.userinfo_url, headers=headers, timeout=self.timeout)
+            if r.status_code == 304 and validators:
+                etag, last_modified = validators
+                fresh = (
+                    r.headers.get("ETag") or etag,
+                    r.headers.get("Last-Modified") or last_modified,
+                )
+                return None, None, 304, fresh
+            if r.status_code != 200:
+                return None, f"userinfo status {r.status_code}", r.status_code, None
+            fresh = (r.headers.get("ETag"), r.headers.get("Last-Modified"))
+            return r.json(), None, r.status_code, fresh if any(fresh) else None
+        except requests.exceptions.Timeout:
+            return None, "timeout", None, None
+        except requests.exceptions.ConnectionError:
+            return None, "connection error", None, None
+        except requests.exceptions.RequestException as e:
+            return None, f"request error: {e}", None, None
+        except Exception as e:
+            return None, f"unexpected error: {e}", None, None
+
+    def reload_registrations(self, path):
+        """
+        Rebuild the namespace index from path and publish it with one reference swap.
+
+        The new index is fully built before it replaces the old one, so requests
+        never see a partial index. Only cached decisions holding a grant on a
+        resource whose mapping changed are invalidated.
+
+        Returns:
+            Number of cache entries invalidated.
+        """
+        fresh = NamespaceIndex.from_file(path)
+        changed = self.namespace_index.changed_resources(fresh)
+        self.namespace_index = fresh
+        return self.cache.invalidate_resources(changed)
+
+    def reload_revocations(self, path):
+        """
+        Rebuild the revocation list from path plus admin-added hashes and swap it in.
+
+        Revocations are checked before the cache, so no cache invalidation is needed.
+        """
+        fresh = RevocationList(self.revocation_capacity, self.revocation_error_rate)
+        fresh.load_file(path)
+        for digest in list(self.admin_revoked):
+            fresh.add(digest)
+        self.revocations = fresh
+        # Catch hashes added through the admin endpoint while the list was rebuilt.
+        for digest in list(self.admin_revoked):
+            fresh.add(digest)
+
+    def load_admin_revocations(self, path):
+        """
+        Apply the hashes in ADMIN_REVOCATION_FILE, including ones other workers appended.
+
+        The file only grows, so its hashes are added to the current list and
+        kept with the admin-added hashes across reloads of REVOCATION_FILE.
+
+        Returns:
+            Number of hashes newly revoked in this process.
+        """
+        added = 0
+        for digest in read_revocation_file(path):
+            self.admin_revoked.add(digest)
+            if self.revocations.add(digest):
+                self.cache.discard(digest)
+                added += 1
+        return added
+
+    def record_revocations(self, digests):
+        """
+        Append hashes to ADMIN_REVOCATION_FILE and sync it to disk.
+
+        Returns:
+            True once written, False when no file is configured.
+
+        Raises:
+            OSError: If the file cannot be written.
+        """
+        if not self.admin_revocation_file:
+            return False
+        new = [digest for digest in dict.fromkeys(digests) if digest not in self.admin_revoked]
+        if new:
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            lines = "".join(f"{digest}  # revoked {stamp}\n" for digest in new)
+            with self._admin_file_lock:
+                with open(self.admin_revocation_file, "a", encoding="utf-8") as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+        return True
+
+    def revoke(self, digest):
+        """Revoke a token hash in this process and evict its cached decision; True if new."""
+        self.admin_revoked.add(digest)
+        added = self.revocations.add(digest)
+        self.cache.discard(digest)
+        return added
+
+    def _fetch_decision(self, key, authorization, timing, cached=None):
+        """
+        Fetch and reduce the Fence document for one token, caching successful results.
+
+        When cached (an expired Decision for the same token) holds validators, the
+        request is conditional and a 304 renews cached without parsing or reducing.
+        """
+        started = time.perf_counter()
+        index = self.namespace_index
+        doc, err, status, validators = self._get_userinfo(
+            authorization, cached.validators if cached is not None else None
+        )
+        timing.record("fence", started)
+        if status == 304:
+            cached.validators = validators
+            cached.renew(ttl=self.cache_ttl, stale=self.cache_stale)
+            self.cache.set(key, cached)
+            if self.namespace_index is not index:
+                self.cache.discard(key)
+            return cached, None, status
+        if err or not doc:
+            return None, err or "empty userinfo document", status
+        started = time.perf_counter()
+        decision = reduce_user_doc(doc, index=index, ttl=self.cache_ttl, stale=self.cache_stale)
+        decision.validators = validators
+        timing.record("decision", started)
+        self.cache.set(key, decision)
+        if self.namespace_index is not index:
+            # The index was swapped while reducing; don't keep a decision built on the old one.
+            self.cache.discard(key)
+        return decision, None, status
+
+    def resolve_decision(self, auth_header, timing, client=None):
+        """
+        Resolve the Decision for an Authorization header via the cache or Fence.
+
+        Concurrent misses for the same token are coalesced onto a single Fence
+        request, which must be admitted by the Fence limiter; if it is shed the
+        error is ERR_OVERLOADED. When Fence fails with a timeout, connection
+        error or 5xx, or the request is shed, an entry still inside its stale
+        window is served instead. An expired entry, even one past its stale
+        window, is revalidated with a conditional request when Fence supplied
+        an ETag or Last-Modified for it.
+
+        Revoked tokens are rejected with ERR_REVOKED before the cache is
+        consulted. Before any Fence request, the token hash and the client address are
+        checked against their rate limits; a throttled caller gets ERR_THROTTLED
+        (or its stale entry) without Fence being contacted.
+
+        Args:
+            auth_header: Incoming Authorization header value
+            timing: RequestTiming updated with phase durations and cache status
+            client: Client address used for the per-IP limit (None skips it)
+
+        Returns:
+            Tuple of (decision, error); decision is None when error is set.
+        """
+        authorization = self.userinfo_authorization(auth_header)
+        if authorization is None:
+            return None, "no token"
+        key = token_hash(authorization)
+        if key in self.revocations:
+            timing.cache_status = "revoked"
+            return None, ERR_REVOKED
+
+        started = time.perf_counter()
+        cached, status = self.cache.get(key)
+        timing.record("cache", started)
+        if status == "hit":
+            timing.cache_status = "hit"
+            return cached, None
+        # An 'expired' entry only supplies validators; it is never served.
+        stale = cached if status == "stale" else None
+
+        if not (self.token_rate_limiter.allow(key)
+                and (client is None or self.ip_rate_limiter.allow(client))):
+            if stale is not None:
+                timing.cache_status = "stale"
+                return stale, None
+            timing.cache_status = "throttled"
+            return None, ERR_THROTTLED
+
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if leader:
+            try:
+                started = time.perf_counter()
+                admitted = self.fence_limiter.acquire()
+                timing.record("queue", started)
+                if admitted:
+                    started = time.perf_counter()
+                    ok = False
+                    try:
+                        flight.result = self._fetch_decision(key, authorization, timing, cached)
+                        http_status = flight.result[2]
+                        ok = http_status is not None and http_status < 500
+                    finally:
+                        self.fence_limiter.release(
+                            (time.perf_counter() - started) * 1000.0, ok=ok
+                        )
+                else:
+                    flight.result = (None, ERR_OVERLOADED, None)
+            finally:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+                flight.done.set()
+            if not admitted:
+                timing.cache_status = "shed"
+            elif flight.result[2] == 304:
+                timing.cache_status = "revalidated"
+            else:
+                timing.cache_status = "miss"
+        else:
+            started = time.perf_counter()
+            flight.done.wait(self.timeout + self.queue_timeout + 1.0)
+            timing.record("fence", started)
+            timing.cache_status = "coalesced"
+
+        decision, err, http_status = flight.result
+        if decision is None and stale is not None and (http_status is None or http_status >= 500):
+            timing.cache_status = "stale"
+            return stale, None
+        return decision, err
+
+    def authorize(self, auth_header, timing, client=None, namespace=None):
+        """
+        Decide an auth request independently of the transport it arrived on.
+
+        Shared by the HTTP /check endpoint and the Envoy ext_authz gRPC service
+        (ext_authz.py) so both apply the same cache, limits and group mapping.
+
+        Args:
+            auth_header: Incoming Authorization header value
+            timing: RequestTiming updated with phase durations and cache status
+            client: Client address used for the per-IP limit (None skips it)
+            namespace: Optional tenant workflow namespace to scope groups to
+
+        Returns:
+            Tuple of (status_code, body, headers). On 200, headers are the
+            identity headers; throttled and shed responses carry Retry-After.
+
+        Examples:
+            >>> status, body, headers = authorize("Bearer valid-token", RequestTiming())
+            >>> status, headers.get("X-Auth-Request-Groups")
+            (200, 'argo-runner,argo-viewer')
+        """
+        decision, err = self.resolve_decision(auth_header, timing, client)
+        if err == ERR_OVERLOADED:
+            return self.shed_status_code, "authz overloaded", {"Retry-After": "1"}
+        if err == ERR_THROTTLED:
+            return 429, "too many requests", {"Retry-After": "1"}
+        if err or not decision:
+            return 401, f"authz fetch failed: {err}", {}
+        groups = decision.groups_for_namespace(namespace) if namespace else decision.groups
+        if not groups:
+            return 403, "forbidden", {}
+        return 200, "", identity_headers(decision.email, groups)
+
+    def warm_up(self):
+        """
+        Prime the decision cache before the worker reports ready.
+
+        Restores decisions from CACHE_SNAPSHOT_FILE, then resolves the
+        FENCE_SERVICE_TOKEN identity through the normal path (a cache hit if it
+        was restored). Failures are logged and do not block readiness.
+
+        Returns:
+            Number of decisions restored from the snapshot.
+        """
+        restored = 0
+        if self.cache_snapshot is not None:
+            restored = self.cache_snapshot.load(self.cache, self.namespace_index, self.revocations)
+        if self.service_token:
+            _, err = self.resolve_decision("Bearer " + self.service_token, RequestTiming())
+            if err:
+                logger.warning("warm-up could not resolve the service token: %s", err)
+        logger.info("warm-up restored %d cached decisions", restored)
+        return restored
+
+    def write_cache_snapshot(self):
+        """Write the cache to CACHE_SNAPSHOT_FILE; returns entries written (0 if disabled)."""
+        if self.cache_snapshot is None:
+            return 0
+        try:
+            return self.cache_snapshot.write(self.cache, self.namespace_index)
+        except OSError as e:
+            logger.warning("could not write cache snapshot %s: %s", self.cache_snapshot.path, e)
+            return 0
+
+    def start_warm_up(self):
+        """
+        Run warm_up() in the background, then write snapshots periodically.
+
+        /readyz answers 503 until warm-up finishes. Called from gunicorn's
+        post_worker_init hook (see gunicorn.conf.py).
+        """
+        self.ready.clear()
+        self._snapshot_stop.clear()
+
+        def run():
+            try:
+                self.warm_up()
+            except Exception:
+                logger.exception("warm-up failed")
+            finally:
+                self.ready.set()
+            if self.cache_snapshot is not None:
+                while not self._snapshot_stop.wait(self.snapshot_interval):
+                    self.write_cache_snapshot()
+
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+    def stop_cache_snapshots(self):
+        """Stop periodic snapshot writes and write a final one (gunicorn worker_exit hook)."""
+        self._snapshot_stop.set()
+        return self.write_cache_snapshot()
+
+
+views = Blueprint("authz", __name__)
+
+
+def current_adapter():
+    """The AuthzAdapter of the Flask app handling the current request."""
+    return current_app.extensions["authz_adapter"]
 
 
 def get_debugging_vars():
@@ -144,7 +1727,7 @@ def get_debugging_vars():
     return email, groups
 
 
-@app.route("/check", methods=["GET"])
+@views.route("/check", methods=["GET"])
 def check():
     """
     Authorization check endpoint for nginx auth_request.
@@ -155,17 +1738,36 @@ def check():
     Expected Headers:
         Authorization: Bearer token or service token fallback
 
+    Query Parameters:
+        namespace: Optional tenant workflow namespace (e.g. wf-<org>-<repo>). When
+            set, access requires a Fence grant on the namespace's registered
+            resource, and argo-runner requires create or '*' on it.
+
     Response Headers (on success):
         X-Auth-Request-User: User identifier (email/name/username)
         X-Auth-Request-Email: User email
         X-Auth-Request-Groups: Comma-separated list of groups
         X-Allowed: 'true' to signal authorization success
 
+    Diagnostic Headers (on every response):
+        Server-Timing: cache status plus cache, fence, decision and total durations (ms)
+        X-Authz-Cache: hit, stale, miss, revalidated (Fence answered 304),
+            coalesced, shed, throttled, revoked or bypass (debug override)
+        X-Authz-Duration-Ms: Time spent in the adapter for this request
+
+    Profiling:
+        With PROFILE_SAMPLE_RATE > 0, a request carrying X-Authz-Profile is
+        stack-sampled with that probability; see /debug/profile/requests.
+
     Returns:
         HTTP Response:
             - 200: User authorized, headers set
-            - 401: Authentication failed (invalid/missing token)
-            - 403: User authenticated but not authorized (no groups)
+            - 401: Authentication failed (invalid, missing or revoked token)
+            - 403: User authenticated but not authorized (no groups, or no
+              grant for the requested namespace)
+            - 429: Per-token or per-client-IP rate limit exceeded (Fence not called)
+            - SHED_STATUS_CODE (503 or 429): Fence-bound request shed by the
+              concurrency limiter and no stale decision was available
 
     Examples:
         GET /check
@@ -175,27 +1777,261 @@ def check():
         X-Auth-Request-User: user@example.com
         X-Auth-Request-Groups: argo-runner,argo-viewer
     """
+    if PROFILE_SAMPLE_RATE and request.headers.get(PROFILE_HEADER) and (
+        random.random() < PROFILE_SAMPLE_RATE
+    ):
+        REQUEST_PROFILER.begin()
+        try:
+            return _check()
+        finally:
+            REQUEST_PROFILER.end()
+    return _check()
+
+
+def _check():
+    """Answer /check for the current request (see check())."""
+    timing = RequestTiming()
     # Check for debugging overrides via query parameters or environment variables
     email,  groups = get_debugging_vars()
     # no debugging override, do real authz
     if not (email and groups):
-        auth = request.headers.get("Authorization", "")
-        doc, err = fetch_user_doc(auth)
-        if err or not doc:
-            return make_response(f"authz fetch failed: {err}", 401)
-        email = doc.get("email") or doc.get("name") or doc.get("username") or "unknown"
-        groups = decide_groups(doc)
-        if not groups:
-            return make_response("forbidden", 403)
-    resp = make_response("", 200)
-    resp.headers["X-Auth-Request-User"] = email
-    resp.headers["X-Auth-Request-Email"] = email
-    resp.headers["X-Auth-Request-Groups"] = ",".join(groups)
-    resp.headers["X-Allowed"] = "true"
+        status, body, headers = current_adapter().authorize(
+            request.headers.get("Authorization", ""),
+            timing,
+            client_ip(request),
+            request.args.get("namespace"),
+        )
+    else:
+        timing.cache_status = "bypass"
+        status, body, headers = 200, "", identity_headers(email, groups)
+    resp = make_response(body, status)
+    resp.headers.update(headers)
+    return timing.apply(resp)
+
+
+def require_admin(view):
+    """
+    Guard an endpoint with the app's ADMIN_TOKEN bearer token.
+
+    Responds 404 when ADMIN_TOKEN is not configured, so admin endpoints do not
+    exist unless explicitly enabled, and 401 when the token does not match.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        admin_token = current_adapter().admin_token
+        if not admin_token:
+            return make_response("not found", 404)
+        supplied = request.headers.get("Authorization", "").encode("utf-8")
+        if not hmac.compare_digest(supplied, ("Bearer " + admin_token).encode("utf-8")):
+            return make_response("unauthorized", 401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@views.route("/admin/revocations", methods=["GET", "POST"])
+@require_admin
+def admin_revocations():
+    """
+    Inspect or extend the revoked-token list.
+
+    POST accepts JSON with 'hashes' (SHA-256 hex digests of raw tokens) and/or
+    'tokens' (raw tokens, hashed on arrival and never stored). Newly revoked
+    tokens are also evicted from the decision cache.
+
+    With ADMIN_REVOCATION_FILE set, hashes are appended to that file before
+    they are applied. Every worker that watches the file picks them up, and
+    they are reloaded after a restart. The response's 'scope' is then
+    'shared'. Without the file, 'scope' is 'worker': the revocation applies
+    only to the worker process that received the request, until it exits.
+
+    Returns:
+        JSON with the current count; POST also returns the number added and
+        the scope. 503 if ADMIN_REVOCATION_FILE cannot be written; the hashes
+        are still revoked in this worker. 400 if the body is not a JSON
+        object, 'hashes' or 'tokens' is not a list, or any hash is malformed.
+
+    Examples:
+        POST /admin/revocations
+        Authorization: Bearer <ADMIN_TOKEN>
+        {"hashes": ["9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"]}
+
+        Response: 200 OK
+        {"added": 1, "count": 1, "scope": "shared"}
+    """
+    adapter = current_adapter()
+    if request.method == "GET":
+        revocations = adapter.revocations
+        return jsonify({"count": len(revocations), "bloom_bits": revocations.num_bits})
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "expected a JSON object with 'hashes' and/or 'tokens'"}), 400
+    for field in ("hashes", "tokens"):
+        if not isinstance(body.get(field, []), list):
+            return jsonify({"error": f"'{field}' must be a list"}), 400
+    hashes = [str(h).lower() for h in body.get("hashes", [])]
+    hashes += [token_hash(str(t)) for t in body.get("tokens", [])]
+    invalid = [h for h in hashes if not RevocationList.is_valid_hash(h)]
+    if invalid:
+        return jsonify({"error": f"invalid hash: {invalid[0][:80]}"}), 400
+    try:
+        scope = "shared" if adapter.record_revocations(hashes) else "worker"
+    except OSError as e:
+        logger.error("could not record revocations in %s: %s", adapter.admin_revocation_file, e)
+        added = sum(adapter.revoke(digest) for digest in hashes)
+        return jsonify({
+            "error": f"revoked in this worker only; could not record them: {e}",
+            "added": added,
+            "count": len(adapter.revocations),
+            "scope": "worker",
+        }), 503
+    added = sum(adapter.revoke(digest) for digest in hashes)
+    return jsonify({"added": added, "count": len(adapter.revocations), "scope": scope})
+
+
+@views.route("/debug/profile", methods=["GET"])
+@require_admin
+def debug_profile():
+    """
+    Sample every worker thread for a while and return collapsed stacks.
+
+    Runs a StackSampler over live traffic in this worker process and returns
+    one 'frame;frame;frame count' line per distinct stack, ready for
+    flamegraph.pl or speedscope. Only one profile runs at a time.
+
+    Query Parameters:
+        seconds: How long to sample, up to PROFILE_MAX_SECONDS (default: 10)
+        interval_ms: Time between samples (default: PROFILE_INTERVAL_MS)
+
+    Returns:
+        200 text/plain collapsed stacks; 400 for bad parameters; 409 while
+        another profile is running.
+
+    Examples:
+        GET /debug/profile?seconds=30
+        Authorization: Bearer <ADMIN_TOKEN>
+
+        Response: 200 OK
+        app:check;app:_check;app:AuthzAdapter.authorize;...;app:AuthzAdapter._fetch_decision 112
+    """
+    try:
+        seconds = float(request.args.get("seconds", "10"))
+        interval_ms = float(request.args.get("interval_ms", str(PROFILE_INTERVAL_MS)))
+    except ValueError:
+        return make_response("seconds and interval_ms must be numbers", 400)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.1 <= interval_ms <= 1000:
+        return make_response(
+            f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and interval_ms in [0.1, 1000]", 400
+        )
+    if not _profile_lock.acquire(blocking=False):
+        return make_response("a profile is already running", 409)
+    try:
+        sampler = StackSampler(interval_ms / 1000.0)
+        sampler.run_for(seconds)
+    finally:
+        _profile_lock.release()
+    resp = make_response(sampler.collapsed(), 200)
+    resp.headers["Content-Type"] = "text/plain; charset=utf-8"
+    resp.headers["X-Profile-Samples"] = str(sampler.samples)
+    return resp
+
+
+@views.route("/debug/profile/requests", methods=["GET", "DELETE"])
+@require_admin
+def debug_profile_requests():
+    """
+    Collapsed stacks gathered from header-triggered /check profiling.
+
+    GET returns the stacks accumulated since the last collection and resets
+    them; DELETE discards them.
+
+    Examples:
+        GET /debug/profile/requests
+        Authorization: Bearer <ADMIN_TOKEN>
+
+        Response: 200 OK
+        app:check;app:_check;app:AuthzAdapter.authorize;...;app:AuthzAdapter._get_userinfo 7
+    """
+    if request.method == "DELETE":
+        REQUEST_PROFILER.collapsed(clear=True)
+        return make_response("", 204)
+    samples = REQUEST_PROFILER.samples
+    resp = make_response(REQUEST_PROFILER.collapsed(clear=True), 200)
+    resp.headers["Content-Type"] = "text/plain; charset=utf-8"
+    resp.headers["X-Profile-Samples"] = str(samples)
     return resp
 
 
-@app.route("/healthz", methods=["GET"])
+@views.route("/debug/memory", methods=["GET", "POST", "DELETE"])
+@require_admin
+def debug_memory():
+    """
+    Report the top allocation sites in this worker process.
+
+    POST starts tracemalloc (query parameter 'frames', default 1 or
+    TRACEMALLOC_FRAMES) and DELETE stops it; tracing costs CPU on every
+    allocation, so leave it on only while investigating. GET takes a
+    snapshot and returns the largest sites and, from the second call on,
+    the sites that grew most since the previous GET.
+
+    Query Parameters:
+        limit: Number of sites per list, 1-500 (default: 20)
+        key: Group by 'lineno', 'filename' or 'traceback' (default: lineno)
+
+    Returns:
+        JSON with traced/peak bytes, 'top' and (after the first GET)
+        'growth'; 409 while tracemalloc is not tracing; 400 for bad
+        parameters.
+
+    Examples:
+        GET /debug/memory?limit=2
+        Authorization: Bearer <ADMIN_TOKEN>
+
+        Response: 200 OK
+        {"traced_bytes": 5242880, "peak_bytes": 6291456,
+         "top": [{"site": "/app/app.py:512", "size_bytes": 1048576, "count": 9000}, ...],
+         "growth": [{"site": "/app/app.py:512", "size_diff_bytes": 4096, ...}, ...]}
+    """
+    if request.method == "POST":
+        try:
+            frames = int(request.args.get("frames", str(TRACEMALLOC_FRAMES or 1)))
+        except ValueError:
+            return jsonify({"error": "frames must be an integer"}), 400
+        if not 1 <= frames <= 64:
+            return jsonify({"error": "frames must be between 1 and 64"}), 400
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return jsonify({"tracing": True, "frames": tracemalloc.get_traceback_limit()})
+    if request.method == "DELETE":
+        with _memory_lock:
+            tracemalloc.stop()
+            _memory_baseline["snapshot"] = None
+        return jsonify({"tracing": False})
+
+    if not tracemalloc.is_tracing():
+        return jsonify({"error": "tracemalloc is not tracing; POST /debug/memory to start"}), 409
+    key_type = request.args.get("key", "lineno")
+    try:
+        limit = int(request.args.get("limit", "20"))
+    except ValueError:
+        limit = 0
+    if key_type not in ("lineno", "filename", "traceback") or not 1 <= limit <= 500:
+        return jsonify({"error": "limit must be 1-500 and key lineno, filename or traceback"}), 400
+    with _memory_lock:
+        snapshot = tracemalloc.take_snapshot()
+        previous, _memory_baseline["snapshot"] = _memory_baseline["snapshot"], snapshot
+    traced, peak = tracemalloc.get_traced_memory()
+    body = {
+        "traced_bytes": traced,
+        "peak_bytes": peak,
+        "top": top_allocations(snapshot, limit=limit, key_type=key_type),
+    }
+    if previous is not None:
+        body["growth"] = top_allocations(snapshot, previous, limit, key_type)
+    return jsonify(body)
+
+
+@views.route("/healthz", methods=["GET"])
 def healthz():
     """
     Health check endpoint.
@@ -216,6 +2052,96 @@ def healthz():
     return "ok", 200
 
 
+@views.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Readiness endpoint.
+
+    Reports ready only after the worker's warm-up (snapshot restore and
+    service-token resolution) has finished, so a restarted pod does not take
+    traffic with an empty decision cache.
+
+    Returns:
+        Tuple of (response_body, status_code):
+            - 200: Warm-up finished
+            - 503: Still warming up
+
+    Examples:
+        GET /readyz
+
+        Response: 503 Service Unavailable
+        warming up
+    """
+    if not current_adapter().ready.is_set():
+        return "warming up", 503
+    return "ok", 200
+
+
+def create_app(config=None):
+    """
+    Build a Flask app serving the adapter endpoints with its own AuthzAdapter.
+
+    Each app gets an independent Fence session pool, decision cache,
+    namespace index, revocation list and limiters, so several apps with
+    different settings can be hosted in one process (one per route, or one
+    per configuration in a benchmark). The profiler and tracemalloc behind
+    /debug/* are process-wide.
+
+    Args:
+        config: Mapping of settings by environment variable name (see the
+            list at the end of this file); unset names come from the
+            environment. The mapping is also applied to app.config.
+
+    Returns:
+        Flask app; its adapter is app.extensions["authz_adapter"].
+
+    Examples:
+        >>> route_a = create_app({"FENCE_BASE": "https://fence-a.example.com/user"})
+        >>> route_b = create_app({"FENCE_BASE": "https://fence-b.example.com/user",
+        ...                       "CACHE_TTL_SECONDS": 30})
+        >>> route_a.extensions["authz_adapter"].cache is route_b.extensions["authz_adapter"].cache
+        False
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.update(config or {})
+    flask_app.extensions["authz_adapter"] = AuthzAdapter(config)
+    flask_app.register_blueprint(views)
+    return flask_app
+
+
+# Default instance configured from the environment: the WSGI entry point
+# (app:app) and the module-level names below, which ext_authz.py, the
+# gunicorn hooks and existing callers use.
+app = create_app()
+ADAPTER = app.extensions["authz_adapter"]
+DECISION_CACHE = ADAPTER.cache
+FENCE_LIMITER = ADAPTER.fence_limiter
+IP_RATE_LIMITER = ADAPTER.ip_rate_limiter
+TOKEN_RATE_LIMITER = ADAPTER.token_rate_limiter
+CACHE_SNAPSHOT = ADAPTER.cache_snapshot
+CONFIG_WATCHER = ADAPTER.config_watcher
+READY = ADAPTER.ready
+fetch_user_doc = ADAPTER.fetch_user_doc
+userinfo_authorization = ADAPTER.userinfo_authorization
+resolve_decision = ADAPTER.resolve_decision
+authorize = ADAPTER.authorize
+reload_registrations = ADAPTER.reload_registrations
+reload_revocations = ADAPTER.reload_revocations
+warm_up = ADAPTER.warm_up
+write_cache_snapshot = ADAPTER.write_cache_snapshot
+start_warm_up = ADAPTER.start_warm_up
+stop_cache_snapshots = ADAPTER.stop_cache_snapshots
+
+
+def __getattr__(name):
+    # Swapped wholesale on reload, so always read through to the instance.
+    if name == "NAMESPACE_INDEX":
+        return ADAPTER.namespace_index
+    if name == "REVOCATIONS":
+        return ADAPTER.revocations
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
     """
     Run the Flask development server.
@@ -228,5 +2154,42 @@ if __name__ == "__main__":
         FENCE_BASE: Base URL for Fence service (default: https://calypr-dev.ohsu.edu/user)
         HTTP_TIMEOUT: Timeout for Fence requests in seconds (default: 3.0)
         FENCE_SERVICE_TOKEN: Fallback service token for authentication
+        CACHE_TTL_SECONDS: Seconds a cached decision is served as fresh (default: 300)
+        CACHE_STALE_SECONDS: Extra seconds an expired decision may be served while
+            Fence is failing (default: 60)
+        CACHE_MAX_ENTRIES: Maximum cached decisions per worker (default: 10000)
+        FENCE_CONCURRENCY_INITIAL/MIN/MAX: Adaptive Fence concurrency limit
+            bounds per worker (default: 16/2/64)
+        FENCE_LATENCY_TARGET_MS: Fence latency above which the limit shrinks (default: 500)
+        FENCE_QUEUE_SIZE: Requests allowed to wait for a slot (default: 32)
+        FENCE_QUEUE_TIMEOUT: Seconds a queued request waits before being shed (default: 1.0)
+        SHED_STATUS_CODE: Status returned for shed requests, 503 or 429 (default: 503)
+        RATE_LIMIT_IP_PER_SEC/RATE_LIMIT_IP_BURST: Fence-bound requests per client
+            IP (default: 200/400, 0 disables)
+        RATE_LIMIT_TOKEN_PER_SEC/RATE_LIMIT_TOKEN_BURST: Fence-bound requests per
+            token (default: 5/10, 0 disables)
+        RATE_LIMIT_WIDTH/RATE_LIMIT_DEPTH: Rate-limit sketch size (default: 4096/2)
+        REVOCATION_FILE: File of revoked token SHA-256 hashes loaded at startup
+        REVOCATION_CAPACITY/REVOCATION_ERROR_RATE: Revocation Bloom filter sizing
+            (default: 100000/0.001)
+        ADMIN_REVOCATION_FILE: File that /admin/revocations appends to and every
+            worker reloads; share it between replicas (default: unset, per worker)
+        ADMIN_TOKEN: Bearer token for /admin/* endpoints (disabled when unset)
+        REGISTRATIONS_FILE: JSON repoRegistrations used to map Fence resources
+            to tenant namespaces
+        CONFIG_WATCH: Reload REGISTRATIONS_FILE, REVOCATION_FILE and
+            ADMIN_REVOCATION_FILE on change (default: true)
+        CONFIG_POLL_INTERVAL: Seconds between config checks without inotify (default: 5)
+        CACHE_SNAPSHOT_FILE: File of hot cached decisions restored at startup
+            (token hashes only; disabled when unset)
+        CACHE_SNAPSHOT_INTERVAL: Seconds between snapshot writes (default: 60)
+        CACHE_SNAPSHOT_ENTRIES: Hottest decisions kept in the snapshot (default: 1000)
+        PROFILE_SAMPLE_RATE: Fraction of /check requests carrying X-Authz-Profile
+            that are stack-sampled (default: 0, disabled)
+        PROFILE_INTERVAL_MS: Profiler sampling interval (default: 5)
+        PROFILE_MAX_SECONDS: Longest /debug/profile run (default: 60)
+        TRACEMALLOC_FRAMES: Start allocation tracing for /debug/memory at
+            startup with this many frames per trace (default: 0, off)
     """
+    start_warm_up()
     app.run(host="0.0.0.0", port=8080)
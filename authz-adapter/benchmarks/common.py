@@ -0,0 +1,117 @@
+"""Shared pieces of the authz-adapter benchmarks: a stand-in Fence and a gunicorn launcher."""
+
+import collections
+import contextlib
+import http.client
+import http.server
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ADAPTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USER_DOC = {
+    "active": True,
+    "email": "bench@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [{"method": "create", "service": "gen3-workflow"}],
+    },
+}
+
+
+class StandInFence(http.server.BaseHTTPRequestHandler):
+    """Answers /user/user with a fixed user document."""
+
+    def do_GET(self):
+        body = json.dumps(USER_DOC).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+Adapter = collections.namedtuple("Adapter", "port process")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(connect, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = connect()
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("adapter did not become ready")
+
+
+@contextlib.contextmanager
+def running_adapter(extra_binds=(), handler=StandInFence, **env):
+    """
+    Run gunicorn with the adapter in front of a stand-in Fence.
+
+    Yields an Adapter with the TCP port of the HTTP listener and the gunicorn
+    master process. extra_binds are additional gunicorn listen addresses,
+    handler is the stand-in Fence request handler class, and keyword
+    arguments are passed to the adapter as environment variables.
+    """
+    fence = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=fence.serve_forever, daemon=True).start()
+    port = free_port()
+    environ = dict(
+        os.environ,
+        FENCE_BASE=f"http://127.0.0.1:{fence.server_address[1]}/user",
+        BIND=",".join([*extra_binds, f"127.0.0.1:{port}"]),
+        CONFIG_WATCH="false",
+    )
+    environ.update(env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "--access-logfile", "/dev/null", "app:app"],
+        cwd=ADAPTER_DIR, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(lambda: http.client.HTTPConnection("127.0.0.1", port, timeout=5.0))
+        yield Adapter(port, server)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        fence.shutdown()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(name, samples, elapsed=None):
+    """Summarize per-request latencies (ms) as one JSON-ready dict."""
+    ordered = sorted(samples)
+    p99 = percentile(ordered, 0.99)
+    row = {
+        "transport": name,
+        "requests": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p50_ms": round(statistics.median(samples), 4),
+        "p99_ms": round(p99, 4),
+    }
+    if elapsed:
+        row["rps"] = round(len(samples) / elapsed, 1)
+    return row
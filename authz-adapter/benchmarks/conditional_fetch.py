@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Measure what ETag revalidation saves on userinfo refreshes.
+
+Runs the adapter under gunicorn twice in front of a stand-in Fence serving a
+large user document: once with the Fence ignoring validators (every refresh
+downloads and reduces the full document) and once honouring If-None-Match
+(unchanged documents come back as 304). Decisions expire immediately but stay
+usable, so every /check after the first per token revalidates. Reports bytes
+sent by Fence and adapter CPU time for the same request mix.
+
+Requires psutil (requirements-dev.txt).
+
+Usage:
+    python benchmarks/conditional_fetch.py [--requests 3000] [--tokens 50] [--resources 300]
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import time
+import psutil
+from common import StandInFence, running_adapter
+
+
+def user_doc(resources):
+    return {
+        "active": True,
+        "email": "bench@example.com",
+        "authz": {
+            f"/programs/bench/projects/p{i}": [
+                {"method": "read", "service": "*"},
+                {"method": "create", "service": "gen3-workflow"},
+            ]
+            for i in range(resources)
+        } | {
+            "/services/workflow/gen3-workflow": [{"method": "create", "service": "gen3-workflow"}]
+        },
+    }
+
+
+def fence_handler(doc, validators):
+    """Build a stand-in Fence handler class that counts the bytes it sends."""
+    body = json.dumps(doc).encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+    class ConditionalFence(StandInFence):
+        sent = 0
+        full = 0
+        not_modified = 0
+
+        def do_GET(self):
+            cls = type(self)
+            if validators and self.headers.get("If-None-Match") == etag:
+                cls.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            cls.full += 1
+            cls.sent += len(body)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if validators:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ConditionalFence
+
+
+def cpu_seconds(process):
+    total = 0.0
+    for proc in [process] + process.children(recursive=True):
+        times = proc.cpu_times()
+        total += times.user + times.system
+    return total
+
+
+def run(doc, validators, count, tokens):
+    handler = fence_handler(doc, validators)
+    env = {
+        "CACHE_TTL_SECONDS": "0",
+        "CACHE_STALE_SECONDS": "3600",
+        "RATE_LIMIT_TOKEN_PER_SEC": "0",
+        "RATE_LIMIT_IP_PER_SEC": "0",
+    }
+    with running_adapter(handler=handler, **env) as adapter:
+        conn = http.client.HTTPConnection("127.0.0.1", adapter.port, timeout=10.0)
+
+        def check(i):
+            conn.request("GET", "/check", headers={"Authorization": f"Bearer user-{i % tokens}"})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"/check returned {response.status}")
+
+        for i in range(tokens):
+            check(i)
+        handler.sent = handler.full = handler.not_modified = 0
+        process = psutil.Process(adapter.process.pid)
+        cpu_before, start = cpu_seconds(process), time.perf_counter()
+        for i in range(count):
+            check(i)
+        elapsed = time.perf_counter() - start
+        cpu = cpu_seconds(process) - cpu_before
+        conn.close()
+    return {
+        "validators": validators,
+        "requests": count,
+        "fence_full_responses": handler.full,
+        "fence_not_modified": handler.not_modified,
+        "fence_bytes": handler.sent,
+        "adapter_cpu_s": round(cpu, 3),
+        "cpu_ms_per_check": round(cpu * 1000.0 / count, 4),
+        "rps": round(count / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000, help="timed /check calls per run")
+    parser.add_argument("--tokens", type=int, default=50, help="distinct bearer tokens")
+    parser.add_argument("--resources", type=int, default=300,
+                        help="resource paths per user document")
+    args = parser.parse_args(argv)
+
+    doc = user_doc(args.resources)
+    full = run(doc, False, args.requests, args.tokens)
+    conditional = run(doc, True, args.requests, args.tokens)
+    for row in (full, conditional):
+        print(json.dumps(row))
+    print(f"bytes saved: {1 - conditional['fence_bytes'] / max(full['fence_bytes'], 1):.1%}")
+    print(f"cpu saved: {1 - conditional['adapter_cpu_s'] / max(full['adapter_cpu_s'], 1e-9):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Compare Envoy ext_authz gRPC Check with HTTP /check.
+
+Starts one gunicorn worker serving both HTTP /check and the ext_authz gRPC
+service (EXT_AUTHZ_ADDR) in front of a local stand-in Fence, so both paths
+share one decision cache, and times cache-hit authorizations. HTTP callers
+each hold a keep-alive connection; gRPC callers share a single channel, i.e.
+one HTTP/2 connection multiplexing every concurrent Check, as Envoy does.
+
+Requires requirements-grpc.txt.
+
+Usage:
+    python benchmarks/grpc_vs_http.py [--requests 5000] [--concurrency 1,8]
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import json
+import sys
+import time
+from common import ADAPTER_DIR, free_port, running_adapter, summarize
+
+sys.path.insert(0, ADAPTER_DIR)
+import grpc  # noqa: E402
+from ext_authz import protos_and_services  # noqa: E402
+
+TOKEN = "bench-token"
+
+
+def http_worker(port, count):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5.0)
+    headers = {"Authorization": f"Bearer {TOKEN}", "X-Real-IP": "10.0.0.1"}
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        conn.request("GET", "/check", headers=headers)
+        response = conn.getresponse()
+        response.read()
+        samples.append((time.perf_counter() - start) * 1000.0)
+        if response.status != 200:
+            raise RuntimeError(f"/check returned {response.status}")
+    conn.close()
+    return samples
+
+
+def grpc_worker(stub, request, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = stub.Check(request)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        if response.status.code != 0:
+            raise RuntimeError(f"Check returned {response.status.code}")
+    return samples
+
+
+def run(concurrency, count, worker, *args):
+    """Run `worker` on `concurrency` threads and return (samples, elapsed seconds)."""
+    per_thread = max(1, count // concurrency)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: worker(*args, per_thread), range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return [s for samples in results for s in samples], elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000, help="timed requests per run")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated caller counts")
+    args = parser.parse_args(argv)
+
+    protos, services = protos_and_services()
+    request = protos.CheckRequest()
+    request.attributes.request.http.headers["authorization"] = f"Bearer {TOKEN}"
+    request.attributes.request.http.headers["x-real-ip"] = "10.0.0.1"
+
+    grpc_port = free_port()
+    with running_adapter(EXT_AUTHZ_ADDR=f"127.0.0.1:{grpc_port}") as adapter:
+        port = adapter.port
+        channel = grpc.insecure_channel(f"127.0.0.1:{grpc_port}")
+        grpc.channel_ready_future(channel).result(timeout=15)
+        stub = services.AuthorizationStub(channel)
+        http_worker(port, 200)
+        grpc_worker(stub, request, 200)
+
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            for name, worker, worker_args in (
+                ("http", http_worker, (port,)),
+                ("grpc", grpc_worker, (stub, request)),
+            ):
+                samples, elapsed = run(concurrency, args.requests, worker, *worker_args)
+                row = summarize(name, samples, elapsed)
+                row["concurrency"] = concurrency
+                print(json.dumps(row))
+        channel.close()
+
+
+if __name__ == "__main__":
+    main()
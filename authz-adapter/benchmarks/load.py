@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test of /check under gunicorn with baselines.
+
+Runs the adapter under its production server (gunicorn.conf.py) in front of a
+local stand-in Fence whose response latency follows a configurable
+distribution and which fails a configurable share of requests with 503 or
+401. Requests are sent on a fixed schedule at --rps regardless of how fast
+earlier ones complete, and each latency is measured from the request's
+scheduled send time, so queueing in the adapter shows up in the percentiles
+instead of silently lowering the offered load.
+
+Each scenario reports achieved throughput, p50, p99 and p99.9. With
+--save-baseline the rows are stored in --baseline; otherwise, if that file
+exists, every scenario is compared with its stored row and the run exits 1
+when throughput drops or a percentile rises by more than --tolerance.
+
+Latency specs: fixed:MS, uniform:LO:HI, exp:MEAN, lognormal:MEDIAN:SIGMA.
+
+Usage:
+    python benchmarks/load.py [--scenario cache-hit] [--duration 10] [--save-baseline]
+    python benchmarks/load.py --scenario fence-bound --rps 300 --fence-latency exp:15
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from common import ADAPTER_DIR, USER_DOC, StandInFence, percentile, running_adapter
+
+BASELINE_FILE = os.path.join(ADAPTER_DIR, "benchmarks", "baselines", "load.json")
+
+# A send later than this behind schedule means the load generator, not the
+# adapter, ran out of connections or CPU; such runs under-report latency.
+LATE_SEND_MS = 5.0
+
+# Percentile increases below this are scheduler noise, whatever the ratio.
+MIN_LATENCY_DELTA_MS = 0.5
+
+SCENARIOS = {
+    # Warm decision cache: measures the adapter and server, Fence is idle.
+    "cache-hit": dict(rps=500, tokens=50, fence_latency="fixed:0", fence_error_rate=0.0,
+                      fence_unauthorized_rate=0.0, cache_ttl=300),
+    # Every check misses the cache and waits on a slow, occasionally failing Fence.
+    "fence-bound": dict(rps=150, tokens=1000000, fence_latency="lognormal:20:0.5",
+                        fence_error_rate=0.01, fence_unauthorized_rate=0.05, cache_ttl=0),
+}
+
+
+def parse_latency(spec):
+    """Return a function of a random.Random giving one Fence delay in seconds."""
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(value) for value in args.split(":")] if args else []
+    except ValueError:
+        values = None
+    if kind == "fixed" and values and len(values) == 1:
+        return lambda rng: values[0] / 1000.0
+    if kind == "uniform" and values and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == "exp" and values and len(values) == 1 and values[0] > 0:
+        return lambda rng: rng.expovariate(1.0 / values[0]) / 1000.0
+    if kind == "lognormal" and values and len(values) == 2 and values[0] > 0:
+        median_ms, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median_ms), sigma) / 1000.0
+    raise argparse.ArgumentTypeError(f"bad latency spec {spec!r}")
+
+
+def latency_spec(spec):
+    """argparse type: validate a latency spec and keep its text for the report."""
+    parse_latency(spec)
+    return spec
+
+
+def fence_handler(latency, error_rate, unauthorized_rate, seed=1):
+    """Build a stand-in Fence handler class that delays and fails on demand."""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    body = json.dumps(USER_DOC).encode()
+
+    class SlowFence(StandInFence):
+        def do_GET(self):
+            with rng_lock:
+                delay, roll = latency(rng), rng.random()
+            time.sleep(delay)
+            if roll < error_rate + unauthorized_rate:
+                self.send_response(503 if roll < error_rate else 401)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return SlowFence
+
+
+def open_loop(port, rps, duration, tokens, connections):
+    """
+    Send rps * duration /check requests on a fixed schedule.
+
+    Returns (latencies in ms from each scheduled send, status Counter, late
+    sends, elapsed seconds). Transport failures count as status "error".
+    """
+    total = max(1, int(rps * duration))
+    latencies = [0.0] * total
+    statuses = Counter()
+    results_lock = threading.Lock()
+    counter = itertools.count()
+    start = time.perf_counter() + 0.1
+    finished = [start]
+
+    def worker():
+        conn = None
+        done, behind = Counter(), 0
+        while True:
+            i = next(counter)
+            if i >= total:
+                break
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay * 1000.0 > LATE_SEND_MS:
+                behind += 1
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10.0)
+                conn.request("GET", "/check",
+                             headers={"Authorization": f"Bearer load-{i % tokens}"})
+                response = conn.getresponse()
+                response.read()
+                done[response.status] += 1
+            except (OSError, http.client.HTTPException):
+                done["error"] += 1
+                conn.close()
+                conn = None
+            now = time.perf_counter()
+            latencies[i] = (now - scheduled) * 1000.0
+            finished.append(now)
+        if conn is not None:
+            conn.close()
+        with results_lock:
+            statuses.update(done)
+            statuses["late"] += behind
+
+    workers = [threading.Thread(target=worker) for _ in range(connections)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    late = statuses.pop("late")
+    return latencies, statuses, late, max(finished) - start
+
+
+def run_scenario(name, settings, duration, warmup, connections, workers, threads):
+    handler = fence_handler(
+        parse_latency(settings["fence_latency"]),
+        settings["fence_error_rate"],
+        settings["fence_unauthorized_rate"],
+    )
+    env = {
+        "CACHE_TTL_SECONDS": str(settings["cache_ttl"]),
+        "CACHE_STALE_SECONDS": "0",
+        "RATE_LIMIT_TOKEN_PER_SEC": "0",
+        "RATE_LIMIT_IP_PER_SEC": "0",
+        "GUNICORN_WORKERS": str(workers),
+        "GUNICORN_THREADS": str(threads),
+    }
+    rps, tokens = settings["rps"], settings["tokens"]
+    with running_adapter(handler=handler, **env) as adapter:
+        if warmup:
+            open_loop(adapter.port, rps, warmup, tokens, connections)
+        latencies, statuses, late, elapsed = open_loop(adapter.port, rps, duration, tokens,
+                                                       connections)
+    ordered = sorted(latencies)
+    failed = statuses["error"] + sum(count for status, count in statuses.items()
+                                     if status != "error" and status >= 500)
+    return {
+        "scenario": name,
+        "settings": settings,
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "p999_ms": round(percentile(ordered, 0.999), 3),
+        "max_ms": round(ordered[-1], 3),
+        "error_rate": round(failed / len(ordered), 4),
+        "late_sends": late,
+        "status": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def regressions(baseline, row, tolerance):
+    """Describe every way row is worse than baseline by more than tolerance."""
+    found = []
+    if row["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        found.append(f"throughput {baseline['throughput_rps']} -> {row['throughput_rps']} rps")
+    for key in ("p50_ms", "p99_ms", "p999_ms"):
+        before, after = baseline[key], row[key]
+        if after > before * (1 + tolerance) and after - before > MIN_LATENCY_DELTA_MS:
+            found.append(f"{key} {before} -> {after}")
+    if row["error_rate"] > baseline["error_rate"] + 0.01:
+        found.append(f"error_rate {baseline['error_rate']} -> {row['error_rate']}")
+    return found
+
+
+def machine():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0,
+                        help="unmeasured seconds per scenario")
+    parser.add_argument("--connections", type=int, default=64,
+                        help="client keep-alive connections")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--rps", type=float, help="override the scenario request rate")
+    parser.add_argument("--tokens", type=int,
+                        help="override the scenario's distinct bearer tokens")
+    parser.add_argument("--fence-latency", type=latency_spec,
+                        help="override the Fence latency spec")
+    parser.add_argument("--fence-error-rate", type=float, help="override the Fence 503 share")
+    parser.add_argument("--fence-unauthorized-rate", type=float,
+                        help="override the Fence 401 share")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    overrides = {
+        key: raw for key, raw in (
+            ("rps", args.rps),
+            ("tokens", args.tokens),
+            ("fence_latency", args.fence_latency),
+            ("fence_error_rate", args.fence_error_rate),
+            ("fence_unauthorized_rate", args.fence_unauthorized_rate),
+        ) if raw is not None
+    }
+    stored = {"machine": machine(), "scenarios": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+
+    failed = False
+    for name in args.scenario or sorted(SCENARIOS):
+        settings = dict(SCENARIOS[name], **overrides)
+        row = run_scenario(name, settings, args.duration, args.warmup, args.connections,
+                           args.workers, args.threads)
+        print(json.dumps(row), flush=True)
+        if row["late_sends"] > row["requests"] * 0.01:
+            print(f"{name}: {row['late_sends']} sends ran late; "
+                  "raise --connections or lower --rps")
+        baseline = stored["scenarios"].get(name)
+        if args.save_baseline:
+            stored["scenarios"][name] = row
+        elif baseline is not None and baseline["settings"] != row["settings"]:
+            print(f"{name}: settings differ from the baseline; not compared")
+        elif baseline is not None:
+            for problem in regressions(baseline, row, args.tolerance):
+                print(f"REGRESSION {name}: {problem}")
+                failed = True
+
+    if args.save_baseline:
+        stored["machine"] = machine()
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+    elif stored["machine"] != machine() and stored["scenarios"]:
+        print("note: baseline was recorded on a different machine; "
+              "comparisons are indicative only")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the authz hot path with machine-relative baselines.
+
+Times decide_groups, reduce_user_doc, token_hash, DecisionCache get/set and
+response header assembly in-process. Each benchmark is calibrated to a loop
+count whose sample takes at least --min-sample-ms, then --samples samples
+are taken. Every sample is divided by the time of a fixed pure-Python
+reference workload measured alongside it, so results are ratios that carry
+over between machines of different speed far better than absolute times.
+
+With --save-baseline the samples are stored in --baseline. Otherwise, if that
+file exists, each benchmark is compared with it using a one-sided
+Mann-Whitney U test; a benchmark is reported as slower only when the test is
+significant at --alpha and the median ratio grew by more than --min-slowdown.
+--compare OLD NEW compares two saved files without running anything.
+
+Usage:
+    python benchmarks/micro.py [--samples 20] [--save-baseline] [--output run.json]
+    python benchmarks/micro.py --compare benchmarks/baselines/micro.json run.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from common import ADAPTER_DIR
+
+sys.path.insert(0, ADAPTER_DIR)
+import app  # noqa: E402
+
+BASELINE_FILE = os.path.join(ADAPTER_DIR, "benchmarks", "baselines", "micro.json")
+
+USER_DOC = {
+    "active": True,
+    "email": "micro@example.com",
+    "authz": {
+        **{
+            f"/programs/p{i}/projects/q{i}": [{"method": "read", "service": "*"}]
+            for i in range(50)
+        },
+        "/programs/ohsu": [{"method": "create", "service": "gen3-workflow"}],
+        "/services/workflow/gen3-workflow": [{"method": "create", "service": "gen3-workflow"}],
+    },
+}
+
+REGISTRATIONS = [
+    {"repoUrl": f"https://github.com/org{i}/repo{i}.git", "tenant": f"p{i}/q{i}"}
+    for i in range(0, 100, 2)
+] + [{"repoUrl": "https://github.com/ohsu/lung-wf.git", "tenant": "ohsu/lung"}]
+
+
+def reference():
+    """Fixed interpreter-bound workload that every sample is normalized by."""
+    total = 0
+    for i in range(2000):
+        total += len(str(i)) * (i & 7)
+    return total
+
+
+def bench_decide_groups():
+    return lambda: app.decide_groups(USER_DOC, group="argoproj.io", resource="workflows")
+
+
+def bench_reduce_user_doc():
+    index = app.NamespaceIndex(REGISTRATIONS)
+    return lambda: app.reduce_user_doc(USER_DOC, now=0.0, index=index)
+
+
+def bench_token_hash():
+    return lambda: app.token_hash("Bearer eyJhbGciOiJSUzI1NiJ9.micro-benchmark-token.signature")
+
+
+def bench_cache_get():
+    cache = app.DecisionCache(max_entries=1000)
+    decision = app.Decision("micro@example.com", ["argo-viewer"],
+                            expires_at=math.inf, stale_until=math.inf)
+    keys = [app.token_hash(f"Bearer t{i}") for i in range(1000)]
+    for key in keys:
+        cache.set(key, decision)
+    key = keys[500]
+    return lambda: cache.get(key, now=0.0)
+
+
+def bench_cache_set():
+    # Full cache, so every set also evicts the least recently used entry.
+    cache = app.DecisionCache(max_entries=1000)
+    decision = app.Decision("micro@example.com", ["argo-viewer"])
+    keys = [app.token_hash(f"Bearer t{i}") for i in range(2000)]
+    position = [0]
+
+    def run():
+        position[0] = (position[0] + 1) % len(keys)
+        cache.set(keys[position[0]], decision)
+    return run
+
+
+def bench_headers():
+    groups = ["argo-runner", "argo-viewer"]
+
+    def run():
+        timing = app.RequestTiming()
+        timing.cache_status = "hit"
+        timing.phases["cache"] = 0.012
+        timing.phases["decide"] = 0.004
+        headers = app.identity_headers("micro@example.com", groups)
+        headers.update(timing.headers())
+        return headers
+    return run
+
+
+BENCHMARKS = {
+    "decide_groups": bench_decide_groups,
+    "reduce_user_doc": bench_reduce_user_doc,
+    "token_hash": bench_token_hash,
+    "cache_get": bench_cache_get,
+    "cache_set": bench_cache_set,
+    "headers": bench_headers,
+}
+
+
+def calibrate(func, min_sample_s):
+    """Loop count, grown geometrically, whose run first takes at least min_sample_s."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - started >= min_sample_s:
+            return loops
+        loops *= 2 if loops < 10 else 5
+
+
+def sample(func, loops):
+    """Seconds per call averaged over one run of loops calls."""
+    started = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return (time.perf_counter() - started) / loops
+
+
+def run(names, samples, min_sample_ms):
+    """
+    Run the named benchmarks and return {name: {...}} result rows.
+
+    Each row holds the calibrated loop count, the normalized samples (call
+    time / reference time), their median, and the median call time in ns on
+    this machine for orientation.
+    """
+    min_sample_s = min_sample_ms / 1000.0
+    ref_loops = calibrate(reference, min_sample_s)
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name]()
+        loops = calibrate(func, min_sample_s)
+        ratios, absolute = [], []
+        for _ in range(samples):
+            # Interleave the reference so drift (frequency scaling, noisy
+            # neighbours) affects both sides of each ratio alike.
+            ref = sample(reference, ref_loops)
+            took = sample(func, loops)
+            ratios.append(took / ref)
+            absolute.append(took)
+        results[name] = {
+            "loops": loops,
+            "samples": ratios,
+            "median_ratio": statistics.median(ratios),
+            "median_ns": round(statistics.median(absolute) * 1e9, 1),
+        }
+    return results
+
+
+def mann_whitney_greater(before, after):
+    """
+    One-sided Mann-Whitney U test that `after` tends to be larger than `before`.
+
+    Uses the normal approximation with tie correction, which is adequate from
+    about eight samples per side. Returns the p-value.
+    """
+    pooled = sorted(
+        (value, side) for side, values in ((0, before), (1, after)) for value in values
+    )
+    ranks, ties, i = [0.0] * len(pooled), 0.0, 0
+    while i < len(pooled):
+        j = i
+        while j + 1 < len(pooled) and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1.0
+        size = j - i + 1
+        ties += size ** 3 - size
+        i = j + 1
+    n1, n2 = len(before), len(after)
+    rank_after = sum(rank for rank, (_, side) in zip(ranks, pooled) if side == 1)
+    u = rank_after - n2 * (n2 + 1) / 2.0
+    n = n1 + n2
+    variance = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2.0 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2.0))
+
+
+def compare(baseline, current, alpha, min_slowdown):
+    """Return (name, change, p_value, significant) for every benchmark in both."""
+    rows = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name], current[name]
+        change = after["median_ratio"] / before["median_ratio"] - 1.0
+        p_value = mann_whitney_greater(before["samples"], after["samples"])
+        rows.append((name, change, p_value, p_value < alpha and change > min_slowdown))
+    return rows
+
+
+def machine():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"machine": machine(), "benchmarks": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def report(rows):
+    """Print a comparison table and return True when anything got slower."""
+    slower = False
+    for name, change, p_value, significant in rows:
+        verdict = "SLOWER" if significant else "ok"
+        print(f"{name:16} {change:+7.1%}  p={p_value:.4f}  {verdict}")
+        slower = slower or significant
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--benchmark", action="append", choices=sorted(BENCHMARKS),
+                        help="benchmark to run, repeatable (default: all)")
+    parser.add_argument("--samples", type=int, default=20, help="samples per benchmark")
+    parser.add_argument("--min-sample-ms", type=float, default=20.0,
+                        help="calibrated duration of one sample")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store results as the baseline")
+    parser.add_argument("--output", help="also write this run's results to a file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two saved result files")
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    parser.add_argument("--min-slowdown", type=float, default=0.05,
+                        help="smallest median slowdown worth reporting")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        old, new = (load(path)["benchmarks"] for path in args.compare)
+        return 1 if report(compare(old, new, args.alpha, args.min_slowdown)) else 0
+
+    results = run(args.benchmark or list(BENCHMARKS), args.samples, args.min_sample_ms)
+    for name, row in results.items():
+        print(json.dumps({"benchmark": name, "loops": row["loops"], "median_ns": row["median_ns"],
+                          "median_ratio": round(row["median_ratio"], 5)}))
+    if args.output:
+        save(args.output, results)
+    if args.save_baseline:
+        stored = load(args.baseline)["benchmarks"] if os.path.exists(args.baseline) else {}
+        save(args.baseline, {**stored, **results})
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    baseline = load(args.baseline)["benchmarks"]
+    return 1 if report(compare(baseline, results, args.alpha, args.min_slowdown)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Soak the adapter and fail on sustained memory growth per allocation site.
+
+Drives /check through the Flask app in this process, so tracemalloc sees
+every allocation, against a local stand-in Fence. Bearer tokens are drawn
+from a sliding window that keeps admitting new tokens and retiring old ones,
+the decision cache is smaller than the window so it evicts continuously, and
+the outcomes are mixed: authorized, viewer-only, inactive, Fence 401 and 5xx,
+and requests with no token at all.
+
+After --warmup requests a tracemalloc snapshot is taken every --interval
+requests. An allocation site whose size grew in at least --min-fraction of
+the intervals and by more than --threshold-kb overall is reported, and the
+run exits with status 1.
+
+Usage:
+    python benchmarks/soak.py [--requests 1000000] [--interval 100000] [--threads 4]
+"""
+
+import argparse
+import gc
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from common import ADAPTER_DIR, StandInFence
+
+sys.path.insert(0, ADAPTER_DIR)
+import app as adapter  # noqa: E402
+
+AUTHORIZED = {
+    "active": True,
+    "email": "soak@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [{"method": "create", "service": "gen3-workflow"}]
+    },
+}
+VIEWER = {"active": True, "email": "viewer@example.com", "authz": {}}
+INACTIVE = {"active": False, "email": "gone@example.com", "authz": {}}
+
+
+class MixedFence(StandInFence):
+    """Chooses the userinfo outcome from the numeric suffix of the bearer token."""
+
+    def do_GET(self):
+        token_id = int(self.headers.get("Authorization", "0").rsplit("-", 1)[-1])
+        outcome = token_id % 20
+        if outcome in (0, 1):
+            self.send_response(401 if outcome == 0 else 502)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        doc = INACTIVE if outcome == 2 else VIEWER if outcome < 6 else AUTHORIZED
+        body = json.dumps(doc).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class GrowthDetector:
+    """
+    Tracks allocation-site sizes across snapshots and flags sustained growth.
+
+    A site is a suspect when its size rose between at least min_fraction of
+    consecutive snapshots and its net growth over the run reached
+    min_growth_bytes. One-off jumps (a cache filling up, a buffer resizing)
+    do not qualify; steady accumulation does.
+    """
+
+    def __init__(self, min_growth_bytes=256 * 1024, min_fraction=0.75):
+        self.min_growth_bytes = min_growth_bytes
+        self.min_fraction = min_fraction
+        # site -> [first size, last size, intervals grown, snapshot first seen].
+        # Fixed-size per site so the detector itself does not grow per interval.
+        self.sites = {}
+        self.snapshots = 0
+
+    def observe(self, snapshot, filters=()):
+        """
+        Record one tracemalloc snapshot.
+
+        Sites are (filename, lineno) tuples built here, and allocations made
+        in this file are filtered out, so the detector's bookkeeping is never
+        reported as a leak.
+        """
+        filters = (*filters, tracemalloc.Filter(False, __file__))
+        stats = snapshot.filter_traces(filters).statistics("lineno")
+        sizes = {
+            (stat.traceback[0].filename, stat.traceback[0].lineno): stat.size for stat in stats
+        }
+        for site, state in self.sites.items():
+            size = sizes.pop(site, 0)
+            if size > state[1]:
+                state[2] += 1
+            state[1] = size
+        for site, size in sizes.items():
+            if self.snapshots:
+                # Absent (size 0) in the previous snapshot, so this is growth.
+                self.sites[site] = [0, size, 1, self.snapshots - 1]
+            else:
+                self.sites[site] = [size, size, 0, 0]
+        self.snapshots += 1
+
+    def suspects(self):
+        """
+        Return [("file:line", net_growth_bytes, growing_intervals, intervals)],
+        largest first.
+        """
+        found = []
+        for site, (first, last, growing, seen) in self.sites.items():
+            intervals = self.snapshots - 1 - seen
+            if intervals < 2:
+                continue
+            net = last - first
+            if net >= self.min_growth_bytes and growing >= self.min_fraction * intervals:
+                found.append((f"{site[0]}:{site[1]}", net, growing, intervals))
+        return sorted(found, key=lambda suspect: -suspect[1])
+
+
+def soak_app(fence_base, cache_entries):
+    """Build an adapter app of its own, configured for the soak."""
+    return adapter.create_app({
+        "FENCE_BASE": fence_base,
+        "CACHE_MAX_ENTRIES": cache_entries,
+        "CACHE_TTL_SECONDS": 2,
+        "CACHE_STALE_SECONDS": 2,
+        "RATE_LIMIT_IP_PER_SEC": 0,
+        "RATE_LIMIT_TOKEN_PER_SEC": 0,
+        "CONFIG_WATCH": "false",
+    })
+
+
+def soak(requests=1000000, interval=100000, warmup=None, tokens=20000, threads=4,
+         detector=None, seed=1, report=None):
+    """
+    Run the soak and return the GrowthDetector holding every snapshot.
+
+    report, if given, is called with one dict per interval.
+    """
+    warmup = interval if warmup is None else warmup
+    detector = detector or GrowthDetector()
+    fence = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MixedFence)
+    threading.Thread(target=fence.serve_forever, daemon=True).start()
+    app = soak_app(f"http://127.0.0.1:{fence.server_address[1]}/user", max(1, tokens // 2))
+    cache = app.extensions["authz_adapter"].cache
+    counter = iter(range(warmup + requests))
+    counter_lock = threading.Lock()
+    outcomes = Counter()
+
+    def drive(limit, rng):
+        client = app.test_client()
+        done = Counter()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None or i >= limit:
+                break
+            headers = {"X-Real-IP": f"10.0.{i % 250}.{i % 7}"}
+            if i % 50:
+                start = i // 10
+                headers["Authorization"] = f"Bearer soak-{rng.randrange(start, start + tokens)}"
+            path = "/check?namespace=wf-poc" if i % 9 == 0 else "/check"
+            done[client.get(path, headers=headers).status_code] += 1
+        with counter_lock:
+            outcomes.update(done)
+
+    def run_until(limit):
+        workers = [
+            threading.Thread(target=drive, args=(limit, random.Random(seed * 1000 + n)))
+            for n in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        run_until(warmup)
+        detector.observe(tracemalloc.take_snapshot(), adapter.TRACEMALLOC_FILTERS)
+        done = warmup
+        while done < warmup + requests:
+            started = time.perf_counter()
+            limit = min(done + interval, warmup + requests)
+            run_until(limit)
+            elapsed = time.perf_counter() - started
+            detector.observe(tracemalloc.take_snapshot(), adapter.TRACEMALLOC_FILTERS)
+            if report:
+                traced, peak = tracemalloc.get_traced_memory()
+                report({
+                    "requests": limit - warmup,
+                    "rps": round((limit - done) / elapsed, 1),
+                    "traced_kb": traced // 1024,
+                    "peak_kb": peak // 1024,
+                    "cached": len(cache),
+                    "status": dict(sorted(outcomes.items())),
+                })
+            done = limit
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+        fence.shutdown()
+        fence.server_close()
+        app.extensions["authz_adapter"].close()
+        # Collect the soak's cyclic garbage now rather than in whatever runs next.
+        gc.collect()
+    return detector
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000000, help="/check calls after warm-up")
+    parser.add_argument("--interval", type=int, default=100000, help="requests between snapshots")
+    parser.add_argument("--warmup", type=int, default=None,
+                        help="untracked requests (default: interval)")
+    parser.add_argument("--tokens", type=int, default=20000, help="live bearer tokens at any time")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent callers")
+    parser.add_argument("--threshold-kb", type=int, default=256,
+                        help="net growth that counts as a leak")
+    parser.add_argument("--min-fraction", type=float, default=0.75,
+                        help="share of intervals a site must grow in")
+    args = parser.parse_args(argv)
+
+    detector = GrowthDetector(args.threshold_kb * 1024, args.min_fraction)
+    soak(args.requests, args.interval, args.warmup, args.tokens, args.threads, detector,
+         report=lambda row: print(json.dumps(row), flush=True))
+    suspects = detector.suspects()
+    for site, net, growing, intervals in suspects:
+        print(f"LEAK? {site}: +{net // 1024} KiB, grew in {growing}/{intervals} intervals")
+    if not suspects:
+        print(f"no sustained growth over {detector.snapshots - 1} intervals")
+    return 1 if suspects else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compare /check latency over loopback TCP and a Unix domain socket.
+
+Starts one gunicorn server listening on both a TCP port and a Unix socket, in
+front of a local stand-in Fence, warms the decision cache and then times
+sequential /check requests over each transport. Each sample opens a fresh
+connection, as ingress-nginx does for auth subrequests by default.
+
+Usage:
+    python benchmarks/uds_vs_tcp.py [--requests 5000] [--keepalive]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import tempfile
+import time
+from common import running_adapter, summarize
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, path, timeout=5.0):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def measure(connect, count, keepalive):
+    """Time `count` GET /check requests and return per-request milliseconds."""
+    headers = {"Authorization": "Bearer bench-token", "X-Real-IP": "10.0.0.1"}
+    samples = []
+    conn = connect() if keepalive else None
+    for _ in range(count):
+        start = time.perf_counter()
+        if not keepalive:
+            conn = connect()
+        conn.request("GET", "/check", headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if not keepalive:
+            conn.close()
+        samples.append((time.perf_counter() - start) * 1000.0)
+        if response.status != 200:
+            raise RuntimeError(f"/check returned {response.status}")
+    if conn is not None:
+        conn.close()
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000, help="timed requests per transport")
+    parser.add_argument("--warmup", type=int, default=200, help="untimed requests per transport")
+    parser.add_argument("--keepalive", action="store_true",
+                        help="reuse one connection per transport")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sock_path = os.path.join(tmp, "adapter.sock")
+        with running_adapter(extra_binds=[f"unix:{sock_path}"]) as adapter:
+            port = adapter.port
+            transports = {
+                "tcp": lambda: http.client.HTTPConnection("127.0.0.1", port, timeout=5.0),
+                "uds": lambda: UnixHTTPConnection(sock_path),
+            }
+            results = []
+            for name, connect in transports.items():
+                measure(connect, args.warmup, args.keepalive)
+                results.append(summarize(name, measure(connect, args.requests, args.keepalive)))
+
+    for row in results:
+        print(json.dumps(row))
+    tcp, uds = results
+    print(f"uds/tcp p50 ratio: {uds['p50_ms'] / tcp['p50_ms']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Envoy ext_authz gRPC service for the authz-adapter.
+
+Serves envoy.service.auth.v3.Authorization/Check for clusters fronted by
+Envoy or Gateway API instead of ingress-nginx. Decisions come from
+app.authorize, so gRPC and HTTP /check share one fetch, cache, limit and
+group-mapping core; run inside a gunicorn worker (EXT_AUTHZ_ADDR, see
+gunicorn.conf.py) they also share the same decision cache.
+
+Envoy keeps a single HTTP/2 connection to the service and multiplexes
+concurrent Check calls over it as streams, which are handled by a thread
+pool here. Allowed requests get the X-Auth-Request-* headers as header
+mutations; denied ones get the same status and body as /check.
+
+grpcio and grpcio-tools are optional dependencies (requirements-grpc.txt).
+The message classes are built at runtime from ext_authz.proto, a
+wire-compatible subset of Envoy's API, so no generated code is checked in.
+"""
+
+import functools
+import logging
+import os
+import sys
+from concurrent import futures
+import app as adapter
+
+try:
+    import grpc
+    from google.protobuf import wrappers_pb2
+except ImportError:  # pragma: no cover - optional dependency
+    grpc = None
+
+EXT_AUTHZ_ADDR = os.environ.get("EXT_AUTHZ_ADDR", "0.0.0.0:9191")
+EXT_AUTHZ_WORKERS = int(os.environ.get("EXT_AUTHZ_WORKERS", "32"))
+EXT_AUTHZ_MAX_STREAMS = int(os.environ.get("EXT_AUTHZ_MAX_STREAMS", "128"))
+
+# google.rpc.Code for each /check status; Envoy only looks at OK vs. not OK
+# and takes the HTTP status from denied_response.
+GRPC_CODES = {
+    200: 0,   # OK
+    401: 16,  # UNAUTHENTICATED
+    403: 7,   # PERMISSION_DENIED
+    429: 8,   # RESOURCE_EXHAUSTED
+    503: 14,  # UNAVAILABLE
+}
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def protos_and_services():
+    """
+    Load the ext_authz message and service modules from ext_authz.proto.
+
+    Raises:
+        RuntimeError: If grpcio or grpcio-tools is not installed.
+    """
+    if grpc is None:
+        raise RuntimeError(
+            "ext_authz requires grpcio and grpcio-tools: pip install -r requirements-grpc.txt"
+        )
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.append(here)
+    return grpc.protos_and_services("ext_authz.proto")
+
+
+def request_client(http, source):
+    """
+    Return the client address for rate limiting, mirroring app.client_ip.
+
+    Args:
+        http: AttributeContext.HttpRequest (header names are lower-case)
+        source: AttributeContext.Peer for the downstream connection
+
+    Returns:
+        X-Real-IP, else the last X-Forwarded-For hop, else the peer address.
+    """
+    real_ip = http.headers.get("x-real-ip", "").strip()
+    if real_ip:
+        return real_ip
+    forwarded = http.headers.get("x-forwarded-for", "")
+    if forwarded:
+        return forwarded.split(",")[-1].strip()
+    return source.address.socket_address.address or None
+
+
+def check_request(request, authz=None):
+    """
+    Decide one ext_authz CheckRequest.
+
+    The Authorization header is read from the HTTP request attributes and the
+    optional namespace from the route's context_extensions (the equivalent
+    of /check?namespace=). Diagnostic values are returned as dynamic metadata
+    (authz_cache, authz_duration_ms, server_timing) for Envoy access logs.
+
+    Args:
+        request: envoy.service.auth.v3.CheckRequest
+        authz: AuthzAdapter deciding the request (default: app.ADAPTER)
+
+    Returns:
+        envoy.service.auth.v3.CheckResponse
+
+    Examples:
+        >>> protos, _ = protos_and_services()
+        >>> req = protos.CheckRequest()
+        >>> req.attributes.request.http.headers["authorization"] = "Bearer valid-token"
+        >>> check_request(req).status.code
+        0
+    """
+    protos, _ = protos_and_services()
+    attributes = request.attributes
+    http = attributes.request.http
+    timing = adapter.RequestTiming()
+    status, body, headers = (authz or adapter.ADAPTER).authorize(
+        http.headers.get("authorization", ""),
+        timing,
+        request_client(http, attributes.source),
+        attributes.context_extensions.get("namespace"),
+    )
+
+    mutations = [
+        protos.HeaderValueOption(
+            header=protos.HeaderValue(key=key, value=value),
+            append=wrappers_pb2.BoolValue(value=False),
+        )
+        for key, value in headers.items()
+    ]
+    response = protos.CheckResponse(status=protos.RpcStatus(code=GRPC_CODES.get(status, 7)))
+    diagnostics = timing.headers()
+    response.dynamic_metadata.update({
+        "authz_cache": diagnostics["X-Authz-Cache"],
+        "authz_duration_ms": float(diagnostics["X-Authz-Duration-Ms"]),
+        "server_timing": diagnostics["Server-Timing"],
+    })
+    if status == 200:
+        response.ok_response.headers.extend(mutations)
+    else:
+        response.status.message = body
+        response.denied_response.status.code = status
+        response.denied_response.headers.extend(mutations)
+        response.denied_response.body = body
+    return response
+
+
+def serve(address=None, max_workers=None, max_streams=None, authz=None):
+    """
+    Start the ext_authz gRPC server in background threads.
+
+    Args:
+        address: host:port to listen on (default EXT_AUTHZ_ADDR); port 0 picks one
+        max_workers: Threads handling concurrent Check streams (default EXT_AUTHZ_WORKERS)
+        max_streams: HTTP/2 concurrent streams allowed per connection
+            (default EXT_AUTHZ_MAX_STREAMS)
+        authz: AuthzAdapter deciding requests (default: app.ADAPTER, the
+            instance behind app:app)
+
+    Returns:
+        Tuple of (grpc.Server, bound port).
+    """
+    _, services = protos_and_services()
+
+    class AuthorizationServicer(services.AuthorizationServicer):
+        def Check(self, request, context):
+            return check_request(request, authz)
+
+    server = grpc.server(
+        futures.ThreadPoolExecutor(
+            max_workers=max_workers or EXT_AUTHZ_WORKERS, thread_name_prefix="ext-authz"
+        ),
+        options=[
+            ("grpc.max_concurrent_streams", max_streams or EXT_AUTHZ_MAX_STREAMS),
+            # Every gunicorn worker binds the same port and shares the load.
+            ("grpc.so_reuseport", 1),
+        ],
+    )
+    services.add_AuthorizationServicer_to_server(AuthorizationServicer(), server)
+    port = server.add_insecure_port(address or EXT_AUTHZ_ADDR)
+    server.start()
+    logger.info("ext_authz gRPC listening on %s", address or EXT_AUTHZ_ADDR)
+    return server, port
+
+
+if __name__ == "__main__":
+    """
+    Run the ext_authz gRPC service on its own, without the HTTP endpoint.
+
+    Environment Variables:
+        EXT_AUTHZ_ADDR: Listen address (default: 0.0.0.0:9191)
+        EXT_AUTHZ_WORKERS: Threads handling concurrent Check calls (default: 32)
+        EXT_AUTHZ_MAX_STREAMS: HTTP/2 concurrent streams per connection (default: 128)
+        Plus every variable documented in app.py.
+    """
+    logging.basicConfig(level=logging.INFO)
+    grpc_server, _ = serve()
+    grpc_server.wait_for_termination()
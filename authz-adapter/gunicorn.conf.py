@@ -0,0 +1,48 @@
+"""
+Gunicorn settings for the authz-adapter image.
+
+BIND is a comma-separated list of listen addresses. The default serves TCP on
+port 8080; the ingress-nginx sidecar mode adds a Unix domain socket in a volume
+shared with the controller, e.g.::
+
+    BIND=unix:/var/run/authz-adapter/adapter.sock,0.0.0.0:8081
+
+keeping a TCP listener for kubelet probes.
+
+EXT_AUTHZ_ADDR (e.g. ``0.0.0.0:9191``) additionally serves the Envoy ext_authz
+gRPC service from every worker, sharing the worker's decision cache with
+/check; it needs requirements-grpc.txt.
+"""
+
+import os
+
+bind = [addr.strip() for addr in os.environ.get("BIND", "0.0.0.0:8080").split(",") if addr.strip()]
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+accesslog = "-"
+# The socket is created with mode 0777 & ~umask; NGINX workers in the
+# controller container run as a different UID and must be able to connect.
+umask = 0o000
+# Worker heartbeat files; /tmp is not writable with readOnlyRootFilesystem.
+worker_tmp_dir = os.environ.get("GUNICORN_WORKER_TMP_DIR", "/dev/shm")
+
+
+def post_worker_init(worker):
+    """
+    Warm the worker's decision cache (/readyz is 503 until done) and serve
+    Envoy ext_authz gRPC from it when EXT_AUTHZ_ADDR is set.
+    """
+    import app
+    app.start_warm_up()
+    if os.environ.get("EXT_AUTHZ_ADDR"):
+        import ext_authz
+        worker.ext_authz_server, _ = ext_authz.serve()
+
+
+def worker_exit(server, worker):
+    """Drain in-flight ext_authz calls and write a final cache snapshot."""
+    ext_authz_server = getattr(worker, "ext_authz_server", None)
+    if ext_authz_server is not None:
+        ext_authz_server.stop(grace=2).wait()
+    import app
+    app.stop_cache_snapshots()
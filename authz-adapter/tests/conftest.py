@@ -14,6 +14,45 @@ sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
 import app
 
 
+BENCHMARKS_DIR = pathlib.Path(__file__).parent.parent / "benchmarks"
+
+
+@pytest.fixture
+def benchmarks(monkeypatch):
+    """Make the scripts in benchmarks/ importable for one test.
+
+    The path entry and the modules imported from the directory are removed
+    afterwards, so their names do not leak into later tests.
+    """
+    monkeypatch.syspath_prepend(str(BENCHMARKS_DIR))
+    yield BENCHMARKS_DIR
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and pathlib.Path(path).parent == BENCHMARKS_DIR:
+            del sys.modules[name]
+
+
+@pytest.fixture
+def make_app():
+    """Build apps with app.create_app(config) for one test.
+
+    Settings come from config alone, with FENCE_BASE pointing at the mocked
+    test Fence unless given. Each app's adapter is closed afterwards, which
+    stops its config watcher and snapshot threads.
+    """
+    apps = []
+
+    def make(config=None):
+        flask_app = app.create_app({'FENCE_BASE': TestData.FENCE_BASE, **(config or {})})
+        flask_app.config['TESTING'] = True
+        apps.append(flask_app)
+        return flask_app
+
+    yield make
+    for flask_app in apps:
+        flask_app.extensions['authz_adapter'].close()
+
+
 @pytest.fixture
 def client() -> FlaskClient:
     """Create a test client for the Flask app."""
@@ -110,6 +149,7 @@ def invalid_bearer_token():
 class TestData:
     """Test data constants."""
     
+    FENCE_BASE = "https://test-fence.example.com/user"
     FENCE_USERINFO_URL = "https://test-fence.example.com/user/user"
     TIMEOUT = 5.0
     
@@ -0,0 +1,182 @@
+"""Tests for the decision cache and the Server-Timing / X-Authz-* diagnostic headers."""
+
+import concurrent.futures
+import threading
+import time
+import pytest
+import requests
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "cached@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+
+def parse_server_timing(value):
+    """Parse a Server-Timing header into {name: {param: value}}."""
+    metrics = {}
+    for metric in value.split(","):
+        name, *params = [p.strip() for p in metric.split(";")]
+        metrics[name] = dict(p.split("=", 1) for p in params)
+    return metrics
+
+
+class TestDecisionCache:
+    """Unit tests for DecisionCache freshness and eviction."""
+
+    @pytest.mark.unit
+    def test_fresh_stale_and_expired(self):
+        cache = app.DecisionCache(max_entries=10)
+        cache.set("k", app.Decision("a@example.com", ["argo-viewer"], 10.0, 20.0))
+
+        assert cache.get("k", now=5.0)[1] == "hit"
+        assert cache.get("k", now=15.0)[1] == "stale"
+        assert cache.get("k", now=25.0) == (None, "miss")
+        assert len(cache) == 0
+
+    @pytest.mark.unit
+    def test_lru_eviction(self):
+        cache = app.DecisionCache(max_entries=2)
+        for key in ("a", "b"):
+            cache.set(key, app.Decision(key, ["argo-viewer"], 100.0, 100.0))
+        cache.get("a", now=0.0)
+        cache.set("c", app.Decision("c", ["argo-viewer"], 100.0, 100.0))
+
+        assert cache.get("b", now=0.0) == (None, "miss")
+        assert cache.get("a", now=0.0)[1] == "hit"
+        assert cache.get("c", now=0.0)[1] == "hit"
+
+    @pytest.mark.unit
+    def test_token_hash_is_not_the_token(self):
+        digest = app.token_hash("Bearer secret-token")
+        assert "secret-token" not in digest
+        assert digest == app.token_hash("Bearer secret-token")
+        assert digest != app.token_hash("Bearer other-token")
+
+
+class TestCheckCaching:
+    """Test /check cache behaviour and diagnostic headers."""
+
+    @pytest.mark.unit
+    def test_miss_then_hit(self, make_app):
+        client = make_app().test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            headers = {'Authorization': 'Bearer cache-token'}
+
+            first = client.get('/check', headers=headers)
+            second = client.get('/check', headers=headers)
+
+            assert first.status_code == second.status_code == 200
+            assert first.headers['X-Authz-Cache'] == 'miss'
+            assert second.headers['X-Authz-Cache'] == 'hit'
+            assert second.headers['X-Auth-Request-Email'] == 'cached@example.com'
+            assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_server_timing_phases(self, make_app):
+        client = make_app().test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+
+            response = client.get('/check', headers={'Authorization': 'Bearer timing-token'})
+            metrics = parse_server_timing(response.headers['Server-Timing'])
+
+            assert metrics['cache']['desc'] == '"miss"'
+            for phase in ('cache', 'fence', 'decision', 'total'):
+                assert phase in metrics
+            assert float(metrics['total']['dur']) >= float(metrics['fence']['dur'])
+            assert float(response.headers['X-Authz-Duration-Ms']) >= 0
+
+            hit = client.get('/check', headers={'Authorization': 'Bearer timing-token'})
+            hit_metrics = parse_server_timing(hit.headers['Server-Timing'])
+            assert 'fence' not in hit_metrics
+
+    @pytest.mark.unit
+    def test_headers_present_on_failure(self, make_app):
+        client = make_app().test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, status_code=401)
+
+            response = client.get('/check', headers={'Authorization': 'Bearer bad-token'})
+            assert response.status_code == 401
+            assert response.headers['X-Authz-Cache'] == 'miss'
+            assert 'fence;dur=' in response.headers['Server-Timing']
+
+    @pytest.mark.unit
+    def test_errors_are_not_cached(self, make_app):
+        client = make_app().test_client()
+        with requests_mock.Mocker() as m:
+            headers = {'Authorization': 'Bearer flaky-token'}
+
+            m.get(FENCE_URL, status_code=503)
+            assert client.get('/check', headers=headers).status_code == 401
+            m.get(FENCE_URL, json=USER_DOC)
+            assert client.get('/check', headers=headers).status_code == 200
+
+    @pytest.mark.unit
+    def test_stale_served_when_fence_down(self, make_app):
+        client = make_app({'CACHE_TTL_SECONDS': 0, 'CACHE_STALE_SECONDS': 60}).test_client()
+        with requests_mock.Mocker() as m:
+            headers = {'Authorization': 'Bearer stale-token'}
+
+            m.get(FENCE_URL, json=USER_DOC)
+            assert client.get('/check', headers=headers).status_code == 200
+
+            m.get(FENCE_URL, exc=requests.exceptions.ConnectionError)
+            response = client.get('/check', headers=headers)
+            assert response.status_code == 200
+            assert response.headers['X-Authz-Cache'] == 'stale'
+
+            # A definitive rejection from Fence is never masked by a stale entry
+            m.get(FENCE_URL, status_code=401)
+            assert client.get('/check', headers=headers).status_code == 401
+
+    @pytest.mark.unit
+    def test_concurrent_misses_coalesced(self, make_app):
+        release = threading.Event()
+        flask_app = make_app()
+
+        def slow_userinfo(request, context):
+            release.wait(2)
+            return USER_DOC
+
+        def make_request():
+            client = flask_app.test_client()
+            response = client.get('/check', headers={'Authorization': 'Bearer herd-token'})
+            return response.status_code, response.headers['X-Authz-Cache']
+
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=slow_userinfo)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [executor.submit(make_request) for _ in range(8)]
+                time.sleep(0.2)
+                release.set()
+                results = [f.result() for f in futures]
+
+            assert all(code == 200 for code, _ in results)
+            statuses = [status for _, status in results]
+            assert statuses.count('miss') == 1
+            assert set(statuses) <= {'miss', 'coalesced', 'hit'}
+            assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_debug_override_reports_bypass(self, make_app):
+        # The debug override is read from the environment on each request.
+        env_vars = {'DEBUG_EMAIL': 'debug@example.com', 'DEBUG_GROUPS': 'argo-viewer'}
+        client = make_app().test_client()
+        with patch.dict('os.environ', env_vars):
+            response = client.get('/check')
+            assert response.headers['X-Authz-Cache'] == 'bypass'
@@ -0,0 +1,192 @@
+"""Tests for hot-reloading registrations and revocations with atomic swaps."""
+
+import hashlib
+import json
+import os
+import sys
+import time
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+LUNG = {"name": "lung", "repoUrl": "https://github.com/ohsu/lung.git", "tenant": "ohsu/lung"}
+BRAIN = {"name": "brain", "repoUrl": "https://github.com/ohsu/brain.git", "tenant": "ohsu/brain"}
+BRAIN_V2 = dict(BRAIN, repoUrl="https://github.com/ohsu/brain-v2.git")
+
+
+def configmap_dir(root, files, version):
+    """Lay files out like a kubelet-mounted ConfigMap and atomically (re)point ..data."""
+    target = root / f"..{version}"
+    target.mkdir()
+    for name, content in files.items():
+        (target / name).write_text(content)
+        link = root / name
+        if not link.is_symlink():
+            link.symlink_to(os.path.join("..data", name))
+    tmp_link = root / "..data_tmp"
+    tmp_link.symlink_to(target.name)
+    os.replace(tmp_link, root / "..data")
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestConfigWatcher:
+    """Unit tests for ConfigWatcher."""
+
+    @pytest.mark.unit
+    def test_check_detects_symlink_swap(self, tmp_path):
+        configmap_dir(tmp_path, {"registrations.json": json.dumps([LUNG])}, 1)
+        seen = []
+        watcher = app.ConfigWatcher(poll_interval=60)
+        watcher.watch(str(tmp_path / "registrations.json"), seen.append)
+
+        assert watcher.check() == []
+        configmap_dir(tmp_path, {"registrations.json": json.dumps([LUNG, BRAIN])}, 2)
+        assert watcher.check() == [str(tmp_path / "registrations.json")]
+        assert watcher.check() == []
+        assert len(seen) == 1
+
+    @pytest.mark.unit
+    def test_failed_load_keeps_running(self, tmp_path):
+        path = tmp_path / "registrations.json"
+        path.write_text("[]")
+        watcher = app.ConfigWatcher(poll_interval=60)
+
+        def broken_loader(_):
+            raise ValueError("bad config")
+
+        watcher.watch(str(path), broken_loader)
+        path.write_text("[ not json")
+        os.utime(path, ns=(0, 1))
+        assert watcher.check() == []
+
+    @pytest.mark.unit
+    def test_missing_file_appears_later(self, tmp_path):
+        path = tmp_path / "late.json"
+        seen = []
+        watcher = app.ConfigWatcher(poll_interval=60)
+        watcher.watch(str(path), seen.append)
+        assert watcher.check() == []
+        path.write_text("[]")
+        assert watcher.check() == [str(path)]
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+    def test_thread_reacts_without_waiting_for_poll(self, tmp_path):
+        configmap_dir(tmp_path, {"registrations.json": "[]"}, 1)
+        seen = []
+        watcher = app.ConfigWatcher(poll_interval=30)
+        watcher.watch(str(tmp_path / "registrations.json"), seen.append)
+        watcher.start()
+        try:
+            time.sleep(0.05)
+            configmap_dir(tmp_path, {"registrations.json": json.dumps([LUNG])}, 2)
+            assert wait_for(lambda: seen)
+        finally:
+            watcher.stop()
+
+    @pytest.mark.unit
+    def test_polling_fallback(self, tmp_path):
+        path = tmp_path / "registrations.json"
+        path.write_text("[]")
+        seen = []
+        watcher = app.ConfigWatcher(poll_interval=0.05)
+        watcher.watch(str(path), seen.append)
+        with patch.object(app.ConfigWatcher, "_inotify", return_value=None):
+            watcher.start()
+            try:
+                path.write_text(json.dumps([LUNG]))
+                os.utime(path, ns=(0, 1))
+                assert wait_for(lambda: seen)
+            finally:
+                watcher.stop()
+
+
+class TestAtomicReload:
+    """Test reload_registrations / reload_revocations against an app's adapter."""
+
+    @pytest.mark.unit
+    def test_only_affected_decisions_invalidated(self, make_app, tmp_path):
+        path = tmp_path / "registrations.json"
+        path.write_text(json.dumps([LUNG, BRAIN]))
+        docs = {
+            'Bearer lung-user': {"active": True, "email": "l@example.com",
+                                 "authz": {"/programs/ohsu/projects/lung": [{"method": "read"}]}},
+            'Bearer brain-user': {"active": True, "email": "b@example.com",
+                                  "authz": {"/programs/ohsu/projects/brain": [{"method": "read"}]}},
+        }
+        flask_app = make_app({'REGISTRATIONS_FILE': str(path), 'CONFIG_WATCH': 'false'})
+        adapter = flask_app.extensions['authz_adapter']
+        client = flask_app.test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=lambda req, ctx: docs[req.headers['Authorization']])
+            for token in docs:
+                client.get('/check', headers={'Authorization': token})
+            old_index = adapter.namespace_index
+
+            path.write_text(json.dumps([LUNG, BRAIN_V2]))
+            assert adapter.reload_registrations(str(path)) == 1
+            assert adapter.namespace_index is not old_index
+
+            lung = client.get('/check?namespace=wf-ohsu-lung',
+                              headers={'Authorization': 'Bearer lung-user'})
+            assert lung.headers['X-Authz-Cache'] == 'hit'
+            brain = client.get('/check?namespace=wf-ohsu-brain-v2',
+                               headers={'Authorization': 'Bearer brain-user'})
+            assert brain.headers['X-Authz-Cache'] == 'miss'
+            assert brain.status_code == 200
+
+    @pytest.mark.unit
+    def test_decision_built_on_swapped_index_not_cached(self, make_app):
+        flask_app = make_app()
+        adapter = flask_app.extensions['authz_adapter']
+        original = app.reduce_user_doc
+
+        def reduce_during_swap(doc, now=None, index=None, **expiry):
+            decision = original(doc, now, index, **expiry)
+            adapter.namespace_index = app.NamespaceIndex([LUNG])
+            return decision
+
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json={"active": True, "email": "r@example.com", "authz": {}})
+            with patch.object(app, 'reduce_user_doc', reduce_during_swap):
+                response = flask_app.test_client().get(
+                    '/check', headers={'Authorization': 'Bearer racing'}
+                )
+            assert response.status_code == 200
+            assert len(adapter.cache) == 0
+
+    @pytest.mark.unit
+    def test_revocation_reload_keeps_admin_additions(self, make_app, tmp_path):
+        path = tmp_path / "revoked.txt"
+        file_hash = hashlib.sha256(b"from-file").hexdigest()
+        path.write_text(file_hash + "\n")
+        flask_app = make_app({
+            'REVOCATION_FILE': str(path),
+            'ADMIN_TOKEN': 'admin-secret',
+            'CONFIG_WATCH': 'false',
+        })
+        adapter = flask_app.extensions['authz_adapter']
+        flask_app.test_client().post('/admin/revocations', json={'tokens': ['from-admin']},
+                                     headers={'Authorization': 'Bearer admin-secret'})
+
+        new_hash = hashlib.sha256(b"added-later").hexdigest()
+        path.write_text(file_hash + "\n" + new_hash + "\n")
+        old = adapter.revocations
+        adapter.reload_revocations(str(path))
+
+        assert adapter.revocations is not old
+        assert new_hash in adapter.revocations
+        assert file_hash in adapter.revocations
+        assert app.token_hash('Bearer from-admin') in adapter.revocations
@@ -0,0 +1,145 @@
+"""Tests for the Envoy ext_authz gRPC service."""
+
+import threading
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+grpc = pytest.importorskip("grpc")
+pytest.importorskip("grpc_tools")
+
+import ext_authz
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "envoy@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+
+def check_request(protos, token=None, namespace=None, source="10.1.2.3"):
+    request = protos.CheckRequest()
+    http = request.attributes.request.http
+    http.method = "GET"
+    http.path = "/workflows"
+    if token:
+        http.headers["authorization"] = f"Bearer {token}"
+    if namespace:
+        request.attributes.context_extensions["namespace"] = namespace
+    request.attributes.source.address.socket_address.address = source
+    return request
+
+
+def header_mutations(options):
+    return {o.header.key: (o.header.value, o.append.value) for o in options}
+
+
+class TestExtAuthz:
+    """Test Check over a real gRPC channel against a mocked Fence."""
+
+    @pytest.fixture
+    def service(self, make_app):
+        flask_app = make_app()
+        with requests_mock.Mocker(real_http=True) as m:
+            protos, services = ext_authz.protos_and_services()
+            server, port = ext_authz.serve(
+                "127.0.0.1:0", authz=flask_app.extensions['authz_adapter']
+            )
+            channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+            try:
+                yield m, flask_app, protos, services.AuthorizationStub(channel)
+            finally:
+                channel.close()
+                server.stop(grace=None)
+
+    @pytest.mark.unit
+    def test_allowed_returns_identity_header_mutations(self, service):
+        m, _, protos, stub = service
+        m.get(FENCE_URL, json=USER_DOC)
+        response = stub.Check(check_request(protos, token="good"))
+
+        assert response.status.code == 0
+        assert response.WhichOneof("http_response") == "ok_response"
+        headers = header_mutations(response.ok_response.headers)
+        assert headers["X-Auth-Request-User"] == ("envoy@example.com", False)
+        assert headers["X-Auth-Request-Groups"] == ("argo-runner,argo-viewer", False)
+        assert headers["X-Allowed"] == ("true", False)
+        assert response.dynamic_metadata["authz_cache"] == "miss"
+
+        again = stub.Check(check_request(protos, token="good"))
+        assert again.dynamic_metadata["authz_cache"] == "hit"
+        assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_missing_token_denied(self, service):
+        m, _, protos, stub = service
+        response = stub.Check(check_request(protos))
+        assert response.status.code == 16
+        assert response.denied_response.status.code == 401
+        assert "no token" in response.denied_response.body
+        assert m.call_count == 0
+
+    @pytest.mark.unit
+    def test_namespace_from_context_extensions(self, service):
+        m, _, protos, stub = service
+        m.get(FENCE_URL, json=USER_DOC)
+        response = stub.Check(check_request(protos, token="scoped", namespace="wf-other-repo"))
+        assert response.status.code == 7
+        assert response.denied_response.status.code == 403
+
+    @pytest.mark.unit
+    def test_shares_cache_with_http_check(self, service):
+        m, flask_app, protos, stub = service
+        m.get(FENCE_URL, json=USER_DOC)
+        client = flask_app.test_client()
+        assert client.get('/check', headers={'Authorization': 'Bearer shared'}).status_code == 200
+
+        response = stub.Check(check_request(protos, token="shared"))
+        assert response.dynamic_metadata["authz_cache"] == "hit"
+        assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_concurrent_streams_on_one_channel(self, service):
+        m, _, protos, stub = service
+        gate = threading.Event()
+
+        def slow_fence(request, context):
+            gate.wait(5)
+            return USER_DOC
+
+        m.get(FENCE_URL, json=slow_fence)
+        calls = [stub.Check.future(check_request(protos, token="burst")) for _ in range(16)]
+        gate.set()
+        responses = [call.result(timeout=10) for call in calls]
+
+        assert all(r.status.code == 0 for r in responses)
+        assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_throttled_denied_with_retry_after(self, service):
+        m, flask_app, protos, stub = service
+        limiter = flask_app.extensions['authz_adapter'].token_rate_limiter
+        with patch.object(limiter, 'allow', return_value=False):
+            response = stub.Check(check_request(protos, token="hammering"))
+        assert response.status.code == 8
+        assert response.denied_response.status.code == 429
+        assert header_mutations(response.denied_response.headers)["Retry-After"][0] == "1"
+        assert m.call_count == 0
+
+    @pytest.mark.unit
+    def test_client_address_precedence(self, service):
+        _, _, protos, _ = service
+        request = check_request(protos, source="192.0.2.1")
+        http = request.attributes.request.http
+        source = request.attributes.source
+        assert ext_authz.request_client(http, source) == "192.0.2.1"
+        http.headers["x-forwarded-for"] = "1.1.1.1, 10.0.0.2"
+        assert ext_authz.request_client(http, source) == "10.0.0.2"
+        http.headers["x-real-ip"] = "10.0.0.9"
+        assert ext_authz.request_client(http, source) == "10.0.0.9"
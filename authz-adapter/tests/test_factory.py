@@ -0,0 +1,108 @@
+"""Tests for create_app and per-instance AuthzAdapter configuration."""
+
+import importlib
+import sys
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_A = "https://fence-a.example.com/user"
+FENCE_B = "https://fence-b.example.com/user"
+
+RUNNER = {
+    "active": True,
+    "email": "runner@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [{"method": "create", "service": "gen3-workflow"}]
+    },
+}
+VIEWER = {"active": True, "email": "viewer@example.com", "authz": {}}
+
+
+def import_fresh_app():
+    """Import app anew, so its default instance reads the current environment."""
+    sys.modules.pop('app', None)
+    return importlib.import_module('app')
+
+
+class TestCreateApp:
+    """Independent adapter instances in one process."""
+
+    @pytest.mark.unit
+    def test_instances_use_their_own_fence_and_cache(self, make_app):
+        default_entries = len(app.DECISION_CACHE)
+        route_a = make_app({"FENCE_BASE": FENCE_A})
+        route_b = make_app({"FENCE_BASE": FENCE_B, "CACHE_TTL_SECONDS": 0})
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_A + "/user", json=RUNNER)
+            m.get(FENCE_B + "/user", json=VIEWER)
+            a = route_a.test_client().get('/check', headers={'Authorization': 'Bearer same'})
+            b = route_b.test_client().get('/check', headers={'Authorization': 'Bearer same'})
+            again = route_a.test_client().get('/check', headers={'Authorization': 'Bearer same'})
+
+        assert a.headers['X-Auth-Request-Email'] == 'runner@example.com'
+        assert b.headers['X-Auth-Request-Email'] == 'viewer@example.com'
+        assert b.headers['X-Auth-Request-Groups'] == 'argo-viewer'
+        assert again.headers['X-Authz-Cache'] == 'hit'
+        adapter_a = route_a.extensions['authz_adapter']
+        adapter_b = route_b.extensions['authz_adapter']
+        assert adapter_a.cache is not adapter_b.cache
+        assert adapter_a.session is not adapter_b.session
+        assert len(app.DECISION_CACHE) == default_entries
+
+    @pytest.mark.unit
+    def test_config_overrides_environment(self):
+        env_vars = {'FENCE_BASE': FENCE_A, 'HTTP_TIMEOUT': '7', 'ADMIN_TOKEN': 'from-env'}
+        with patch.dict('os.environ', env_vars):
+            fresh = import_fresh_app()
+        configured = fresh.AuthzAdapter({"HTTP_TIMEOUT": 1.5, "CACHE_MAX_ENTRIES": "5",
+                                         "CONFIG_WATCH": "false"})
+        assert configured.userinfo_url == FENCE_A + "/user"
+        assert configured.timeout == 1.5
+        assert configured.cache.max_entries == 5
+        assert configured.admin_token == 'from-env'
+        assert fresh.ADAPTER.timeout == 7.0
+        configured.close()
+
+    @pytest.mark.unit
+    def test_admin_token_is_per_instance(self, make_app):
+        open_app = make_app({"ADMIN_TOKEN": "secret"})
+        closed_app = make_app({"ADMIN_TOKEN": ""})
+        headers = {'Authorization': 'Bearer secret'}
+        open_client, closed_client = open_app.test_client(), closed_app.test_client()
+        assert open_client.get('/admin/revocations', headers=headers).status_code == 200
+        assert closed_client.get('/admin/revocations', headers=headers).status_code == 404
+
+    @pytest.mark.unit
+    def test_readiness_is_per_instance(self, make_app):
+        warming = make_app()
+        ready = make_app()
+        warming.extensions['authz_adapter'].ready.clear()
+        assert warming.test_client().get('/readyz').status_code == 503
+        assert ready.test_client().get('/readyz').status_code == 200
+
+    @pytest.mark.unit
+    def test_module_names_follow_default_instance(self, tmp_path):
+        # Reloads the default instance's registrations, so use a fresh import.
+        fresh = import_fresh_app()
+        assert fresh.authorize.__self__ is fresh.ADAPTER
+        assert fresh.DECISION_CACHE is fresh.ADAPTER.cache
+        path = tmp_path / "registrations.json"
+        path.write_text('[{"repoUrl": "https://github.com/ohsu/lung-wf.git", '
+                        '"tenant": "ohsu/lung"}]')
+        fresh.reload_registrations(str(path))
+        assert fresh.NAMESPACE_INDEX is fresh.ADAPTER.namespace_index
+        assert len(fresh.NAMESPACE_INDEX) > 0
+
+    @pytest.mark.unit
+    def test_fence_cookies_not_shared_between_callers(self, make_app):
+        flask_app = make_app({"FENCE_BASE": FENCE_A})
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_A + "/user", json=RUNNER, headers={'Set-Cookie': 'session=alice; Path=/'})
+            client = flask_app.test_client()
+            client.get('/check', headers={'Authorization': 'Bearer alice'})
+            client.get('/check', headers={'Authorization': 'Bearer bob'})
+            assert 'Cookie' not in m.request_history[1].headers
+        assert len(flask_app.extensions['authz_adapter'].session.cookies) == 0
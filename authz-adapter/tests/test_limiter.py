@@ -0,0 +1,219 @@
+"""Tests for the adaptive Fence concurrency limiter and load shedding in /check."""
+
+import concurrent.futures
+import threading
+import time
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "limited@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+
+class StandInFence:
+    """requests_mock callback that slows down with every call and tracks concurrency."""
+
+    def __init__(self, step=0.01, gate=None):
+        self.step = step
+        self.gate = gate
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request, context):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            delay = self.step * self.calls
+        try:
+            if self.gate is not None:
+                self.gate.wait(5)
+            else:
+                time.sleep(delay)
+            return USER_DOC
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TestAdaptiveLimiter:
+    """Unit tests for AdaptiveLimiter."""
+
+    @pytest.mark.unit
+    def test_additive_increase(self):
+        limiter = app.AdaptiveLimiter(initial=4, min_limit=1, max_limit=8, latency_target_ms=100)
+        for _ in range(50):
+            assert limiter.acquire()
+            limiter.release(latency_ms=5.0, ok=True)
+        assert 4 < limiter.limit <= 8
+
+    @pytest.mark.unit
+    def test_multiplicative_decrease(self):
+        limiter = app.AdaptiveLimiter(initial=8, min_limit=2, max_limit=8, latency_target_ms=100)
+        for _ in range(50):
+            assert limiter.acquire()
+            limiter.release(latency_ms=500.0, ok=True)
+        assert limiter.limit == 2
+
+        assert limiter.acquire()
+        limiter.release(latency_ms=1.0, ok=False)
+        assert limiter.limit == 2
+
+    @pytest.mark.unit
+    def test_full_queue_rejects_immediately(self):
+        limiter = app.AdaptiveLimiter(initial=1, min_limit=1, max_limit=1, max_queue=0)
+        assert limiter.acquire()
+        start = time.perf_counter()
+        assert not limiter.acquire()
+        assert time.perf_counter() - start < 0.05
+        assert limiter.shed == 1
+
+    @pytest.mark.unit
+    def test_queued_caller_gets_released_slot(self):
+        limiter = app.AdaptiveLimiter(
+            initial=1, min_limit=1, max_limit=1, max_queue=1, queue_timeout=2.0
+        )
+        assert limiter.acquire()
+        timer = threading.Timer(0.05, limiter.release, kwargs={"latency_ms": 1.0, "ok": True})
+        timer.start()
+        assert limiter.acquire()
+        timer.join()
+
+    @pytest.mark.unit
+    def test_queue_timeout_sheds(self):
+        limiter = app.AdaptiveLimiter(
+            initial=1, min_limit=1, max_limit=1, max_queue=1, queue_timeout=0.05
+        )
+        assert limiter.acquire()
+        assert not limiter.acquire()
+        assert limiter.waiting == 0
+
+
+class TestLoadShedding:
+    """Test /check under a stand-in Fence with increasing latency."""
+
+    CONFIG = {
+        'FENCE_CONCURRENCY_INITIAL': 4,
+        'FENCE_CONCURRENCY_MIN': 1,
+        'FENCE_CONCURRENCY_MAX': 4,
+        'FENCE_LATENCY_TARGET_MS': 20,
+        'FENCE_QUEUE_SIZE': 2,
+        'FENCE_QUEUE_TIMEOUT': 0.05,
+    }
+
+    @pytest.mark.slow
+    def test_sheds_and_adapts_under_increasing_latency(self, make_app):
+        fence = StandInFence(step=0.005)
+        flask_app = make_app(self.CONFIG)
+        limiter = flask_app.extensions['authz_adapter'].fence_limiter
+
+        def make_request(i):
+            client = flask_app.test_client()
+            response = client.get('/check', headers={'Authorization': f'Bearer slow-{i}'})
+            return response.status_code, response.headers['X-Authz-Cache']
+
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=fence)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+                results = list(executor.map(make_request, range(64)))
+
+        codes = [code for code, _ in results]
+        assert set(codes) <= {200, 503}
+        assert codes.count(503) > 0
+        assert all(status == 'shed' for code, status in results if code == 503)
+        assert fence.max_active <= 4
+        assert limiter.limit < 4
+        assert limiter.inflight == 0
+
+    @pytest.mark.unit
+    def test_cache_hits_bypass_saturated_limiter(self, make_app):
+        gate = threading.Event()
+        gate.set()
+        fence = StandInFence(gate=gate)
+        flask_app = make_app(self.CONFIG)
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=fence)
+            client = flask_app.test_client()
+            assert client.get('/check', headers={'Authorization': 'Bearer warm'}).status_code == 200
+
+            gate.clear()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [
+                    executor.submit(
+                        flask_app.test_client().get, '/check',
+                        headers={'Authorization': f'Bearer blocked-{i}'}
+                    )
+                    for i in range(8)
+                ]
+                time.sleep(0.2)
+
+                response = client.get('/check', headers={'Authorization': 'Bearer warm'})
+                assert response.status_code == 200
+                assert response.headers['X-Authz-Cache'] == 'hit'
+
+                gate.set()
+                blocked = [f.result().status_code for f in futures]
+
+            assert 503 in blocked
+
+    @pytest.mark.unit
+    def test_configurable_shed_status(self, make_app):
+        flask_app = make_app(dict(self.CONFIG, SHED_STATUS_CODE=429))
+        limiter = flask_app.extensions['authz_adapter'].fence_limiter
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            with patch.object(limiter, 'acquire', return_value=False):
+                response = flask_app.test_client().get(
+                    '/check', headers={'Authorization': 'Bearer shed-me'}
+                )
+            assert response.status_code == 429
+            assert response.headers['Retry-After'] == '1'
+            assert m.call_count == 0
+
+    @pytest.mark.unit
+    def test_shed_serves_stale_decision(self, make_app):
+        flask_app = make_app(dict(self.CONFIG, CACHE_TTL_SECONDS=0, CACHE_STALE_SECONDS=60))
+        limiter = flask_app.extensions['authz_adapter'].fence_limiter
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            client = flask_app.test_client()
+            headers = {'Authorization': 'Bearer stale-under-load'}
+            assert client.get('/check', headers=headers).status_code == 200
+
+            with patch.object(limiter, 'acquire', return_value=False):
+                response = client.get('/check', headers=headers)
+            assert response.status_code == 200
+            assert response.headers['X-Authz-Cache'] == 'stale'
+
+    @pytest.mark.unit
+    def test_failed_fetch_releases_slot(self, make_app):
+        flask_app = make_app(dict(self.CONFIG, FENCE_CONCURRENCY_INITIAL=2,
+                                  FENCE_CONCURRENCY_MAX=2, FENCE_QUEUE_SIZE=0))
+        adapter = flask_app.extensions['authz_adapter']
+        with requests_mock.Mocker() as m:
+            # reduce_user_doc raises on an authz list instead of a mapping.
+            m.get(FENCE_URL, json={"active": True, "authz": ["bad"]})
+            for i in range(3):
+                with pytest.raises(AttributeError):
+                    adapter.resolve_decision(f'Bearer malformed-{i}', app.RequestTiming())
+            assert adapter.fence_limiter.inflight == 0
+
+            m.get(FENCE_URL, json=USER_DOC)
+            response = flask_app.test_client().get(
+                '/check', headers={'Authorization': 'Bearer after-failures'}
+            )
+            assert response.status_code == 200
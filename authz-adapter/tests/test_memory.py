@@ -0,0 +1,124 @@
+"""Tests for allocation reporting and the /debug/memory endpoint."""
+
+import importlib
+import sys
+import tracemalloc
+import pytest
+from unittest.mock import patch
+
+import app
+
+ADMIN = {'Authorization': 'Bearer admin-secret'}
+
+_retained = []
+
+
+def allocate(count):
+    _retained.extend(bytearray(256) for _ in range(count))
+
+
+@pytest.fixture(autouse=True)
+def stop_tracing():
+    """Leave tracemalloc off and the retained allocations freed after each test."""
+    yield
+    _retained.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class TestTopAllocations:
+    """Unit tests for top_allocations."""
+
+    @pytest.mark.unit
+    def test_reports_largest_sites_first(self):
+        tracemalloc.start()
+        allocate(2000)
+        rows = app.top_allocations(tracemalloc.take_snapshot(), limit=5)
+        assert 1 <= len(rows) <= 5
+        assert rows[0]['site'].startswith(__file__)
+        assert rows[0]['size_bytes'] >= 2000 * 256
+        assert [row['size_bytes'] for row in rows] == sorted(
+            (row['size_bytes'] for row in rows), reverse=True
+        )
+        assert all('size_diff_bytes' not in row for row in rows)
+
+    @pytest.mark.unit
+    def test_growth_since_previous_snapshot(self):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        allocate(1000)
+        rows = app.top_allocations(tracemalloc.take_snapshot(), before, limit=1)
+        assert rows[0]['site'].startswith(__file__)
+        assert rows[0]['size_diff_bytes'] >= 1000 * 256
+        assert rows[0]['count_diff'] >= 1000
+
+    @pytest.mark.unit
+    def test_traceback_key_lists_frames(self):
+        tracemalloc.start(4)
+        allocate(1000)
+        rows = app.top_allocations(tracemalloc.take_snapshot(), limit=1, key_type='traceback')
+        assert rows[0]['site'] == rows[0]['traceback'][-1]
+        assert rows[0]['site'].startswith(__file__)
+        assert len(rows[0]['traceback']) > 1
+
+
+class TestMemoryEndpoint:
+    """Test /debug/memory."""
+
+    @pytest.mark.unit
+    def test_hidden_without_admin_token(self, make_app):
+        assert make_app({'ADMIN_TOKEN': ''}).test_client().get('/debug/memory').status_code == 404
+
+    @pytest.mark.unit
+    def test_requires_admin(self, make_app):
+        response = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client().get(
+            '/debug/memory', headers={'Authorization': 'Bearer nope'}
+        )
+        assert response.status_code == 401
+
+    @pytest.mark.unit
+    def test_conflict_while_not_tracing(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        assert not tracemalloc.is_tracing()
+        assert client.get('/debug/memory', headers=ADMIN).status_code == 409
+
+    @pytest.mark.unit
+    def test_starts_at_import_when_configured(self):
+        # Tracing starts when the module is imported, so import it anew.
+        sys.modules.pop('app', None)
+        with patch.dict('os.environ', {'TRACEMALLOC_FRAMES': '3'}):
+            fresh = importlib.import_module('app')
+        assert fresh.TRACEMALLOC_FRAMES == 3
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traceback_limit() == 3
+
+    @pytest.mark.unit
+    def test_start_report_and_stop(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        started = client.post('/debug/memory?frames=2', headers=ADMIN)
+        assert started.status_code == 200
+        assert started.get_json() == {'tracing': True, 'frames': 2}
+
+        first = client.get('/debug/memory?limit=3', headers=ADMIN).get_json()
+        assert first['traced_bytes'] > 0
+        assert first['peak_bytes'] >= first['traced_bytes']
+        assert 1 <= len(first['top']) <= 3
+        assert 'growth' not in first
+
+        allocate(2000)
+        second = client.get('/debug/memory?limit=3', headers=ADMIN).get_json()
+        assert second['growth'][0]['site'].startswith(__file__)
+        assert second['growth'][0]['size_diff_bytes'] >= 2000 * 256
+
+        assert client.delete('/debug/memory', headers=ADMIN).get_json() == {'tracing': False}
+        assert not tracemalloc.is_tracing()
+        assert app._memory_baseline['snapshot'] is None
+
+    @pytest.mark.unit
+    def test_rejects_bad_parameters(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        for query in ('frames=abc', 'frames=0', 'frames=65'):
+            assert client.post(f'/debug/memory?{query}', headers=ADMIN).status_code == 400
+        client.post('/debug/memory', headers=ADMIN)
+        for query in ('limit=abc', 'limit=0', 'limit=501', 'key=module'):
+            assert client.get(f'/debug/memory?{query}', headers=ADMIN).status_code == 400
@@ -0,0 +1,152 @@
+"""Tests for the Fence resource path -> tenant namespace index."""
+
+import json
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+REGISTRATIONS = [
+    {
+        "name": "lung-wf",
+        "repoUrl": "https://github.com/ohsu/lung-wf.git",
+        "tenant": "ohsu/lung",
+    },
+    {
+        "name": "brain-wf",
+        "repoUrl": "https://github.com/ohsu/brain-wf.git",
+        "tenant": "ohsu/brain",
+    },
+    {
+        "name": "hello",
+        "repoUrl": "https://github.com/bwalsh/nextflow-hello.git",
+        "tenant": "bwalsh",
+    },
+    {
+        "name": "explicit",
+        "repoUrl": "https://github.com/lab/explicit.git",
+        "tenant": "ignored",
+        "fenceResource": "/programs/lab/projects/x/",
+    },
+]
+
+
+class TestRegistrationMapping:
+    """Unit tests for registration_namespace and registration_resource."""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("registration,expected", [
+        ({"repoUrl": "https://github.com/org/repo.git"}, "wf-org-repo"),
+        ({"repoUrl": "http://github.com/org/repo"}, "wf-org-repo"),
+        ({"repoUrl": "https://github.com/org/repo/extra.git"}, "wf-org-repo"),
+        ({"repoUrl": "", "name": "solo"}, "wf-solo"),
+    ])
+    def test_namespace_matches_helm_helper(self, registration, expected):
+        assert app.registration_namespace(registration) == expected
+
+    @pytest.mark.unit
+    def test_resource_from_tenant(self):
+        assert app.registration_resource({"tenant": "p/q"}) == "/programs/p/projects/q"
+        assert app.registration_resource({"tenant": "org"}) == "/programs/org"
+        assert app.registration_resource({}) is None
+        assert app.registration_resource({"fenceResource": "a/b/"}) == "/a/b"
+
+
+class TestNamespaceIndex:
+    """Unit tests for NamespaceIndex."""
+
+    @pytest.mark.unit
+    def test_project_grant(self):
+        index = app.NamespaceIndex(REGISTRATIONS)
+        read, run = index.namespaces_for({
+            "/programs/ohsu/projects/lung": [{"method": "read", "service": "*"}],
+        })
+        assert read == {"wf-ohsu-lung-wf"}
+        assert run == frozenset()
+
+    @pytest.mark.unit
+    def test_program_grant_covers_projects(self):
+        index = app.NamespaceIndex(REGISTRATIONS)
+        read, run = index.namespaces_for({
+            "/programs/ohsu": [{"method": "create", "service": "*"}],
+            "/programs/bwalsh/": [{"method": "read", "service": "*"}],
+        })
+        assert read == {"wf-ohsu-lung-wf", "wf-ohsu-brain-wf", "wf-bwalsh-nextflow-hello"}
+        assert run == {"wf-ohsu-lung-wf", "wf-ohsu-brain-wf"}
+
+    @pytest.mark.unit
+    def test_explicit_resource_and_unrelated_paths(self):
+        index = app.NamespaceIndex(REGISTRATIONS)
+        read, _ = index.namespaces_for({
+            "/programs/lab/projects/x": [{"method": "*"}],
+            "/programs/ignored": [{"method": "*"}],
+            "/services/workflow/gen3-workflow": [{"method": "create"}],
+        })
+        assert read == {"wf-lab-explicit"}
+
+    @pytest.mark.unit
+    def test_from_file(self, tmp_path):
+        path = tmp_path / "registrations.json"
+        path.write_text(json.dumps(REGISTRATIONS))
+        index = app.NamespaceIndex.from_file(str(path))
+        assert len(index) == len(app.NamespaceIndex(REGISTRATIONS))
+
+
+class TestNamespaceScopedCheck:
+    """Test /check?namespace= against the index."""
+
+    @pytest.fixture
+    def registrations_file(self, tmp_path):
+        path = tmp_path / "registrations.json"
+        path.write_text(json.dumps(REGISTRATIONS))
+        return str(path)
+
+    @pytest.mark.unit
+    def test_namespace_membership(self, make_app, registrations_file):
+        user_doc = {
+            "active": True,
+            "email": "lung@example.com",
+            "authz": {
+                "/services/workflow/gen3-workflow": [{"method": "create"}],
+                "/programs/ohsu/projects/lung": [{"method": "create"}],
+                "/programs/ohsu/projects/brain": [{"method": "read"}],
+            },
+        }
+        client = make_app({'REGISTRATIONS_FILE': registrations_file}).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=user_doc)
+            headers = {'Authorization': 'Bearer ns-token'}
+
+            lung = client.get('/check?namespace=wf-ohsu-lung-wf', headers=headers)
+            assert lung.status_code == 200
+            assert lung.headers['X-Auth-Request-Groups'] == 'argo-runner,argo-viewer'
+
+            brain = client.get('/check?namespace=wf-ohsu-brain-wf', headers=headers)
+            assert brain.status_code == 200
+            assert brain.headers['X-Auth-Request-Groups'] == 'argo-viewer'
+
+            other = client.get('/check?namespace=wf-bwalsh-nextflow-hello', headers=headers)
+            assert other.status_code == 403
+
+            unscoped = client.get('/check', headers=headers)
+            assert unscoped.status_code == 200
+            assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_namespaces_computed_once_per_document(self, make_app, registrations_file):
+        flask_app = make_app({'REGISTRATIONS_FILE': registrations_file})
+        index = flask_app.extensions['authz_adapter'].namespace_index
+        client = flask_app.test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json={
+                "active": True,
+                "email": "once@example.com",
+                "authz": {"/programs/bwalsh": [{"method": "read"}]},
+            })
+            with patch.object(index, 'namespaces_for', wraps=index.namespaces_for) as spy:
+                for ns in ('wf-bwalsh-nextflow-hello', 'wf-ohsu-lung-wf') * 5:
+                    client.get(f'/check?namespace={ns}', headers={'Authorization': 'Bearer once'})
+            assert spy.call_count == 1
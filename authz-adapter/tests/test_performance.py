@@ -4,7 +4,6 @@ import concurrent.futures
 import time
 import pytest
 import statistics
-from unittest.mock import patch
 
 # Import the app module
 import sys
@@ -16,11 +15,6 @@ import app
 class TestPerformance:
     """Performance tests for authorization decisions."""
 
-    def setup_method(self):
-        """Reset app module before each test."""
-        if 'app' in sys.modules:
-            del sys.modules['app']
-
     @pytest.mark.slow
     def test_decide_groups_performance(self):
         """Test performance of decide_groups function."""
@@ -72,7 +66,7 @@ class TestPerformance:
         assert max_time < 0.01, f"Max time {max_time:.6f}s exceeds 10ms"
 
     @pytest.mark.slow
-    def test_authorization_endpoint_performance(self):
+    def test_authorization_endpoint_performance(self, make_app):
         """Test performance of the /check endpoint."""
         import requests_mock
         
@@ -88,41 +82,36 @@ class TestPerformance:
         }
         
         with requests_mock.Mocker() as m:
-            env_vars = {
-                'FENCE_BASE': 'https://test-fence.example.com/user',
-                'HTTP_TIMEOUT': '1.0'
-            }
-            with patch.dict('os.environ', env_vars):
-                import app
-                
-                fence_url = "https://test-fence.example.com/user/user"
-                m.get(fence_url, json=user_doc, status_code=200)
-                
-                client = app.app.test_client()
-                
-                # Measure response times
-                times = []
-                for i in range(100):
-                    start = time.perf_counter()
-                    response = client.get('/check', headers={
-                        'Authorization': f'Bearer perf-token-{i}'
-                    })
-                    end = time.perf_counter()
-                    
-                    assert response.status_code == 200
-                    times.append(end - start)
-                
-                # Performance assertions (excluding network time since mocked)
-                avg_time = statistics.mean(times)
-                p95_time = statistics.quantiles(times, n=20)[18]
-                max_time = max(times)
+            flask_app = make_app({'HTTP_TIMEOUT': 1.0})
+            
+            fence_url = "https://test-fence.example.com/user/user"
+            m.get(fence_url, json=user_doc, status_code=200)
+            
+            client = flask_app.test_client()
+            
+            # Measure response times
+            times = []
+            for i in range(100):
+                start = time.perf_counter()
+                response = client.get('/check', headers={
+                    'Authorization': f'Bearer perf-token-{i}'
+                })
+                end = time.perf_counter()
                 
-                assert avg_time < 0.01, f"Average response time {avg_time:.6f}s exceeds 10ms"
-                assert p95_time < 0.05, f"95th percentile {p95_time:.6f}s exceeds 50ms"
-                assert max_time < 0.1, f"Max response time {max_time:.6f}s exceeds 100ms"
+                assert response.status_code == 200
+                times.append(end - start)
+            
+            # Performance assertions (excluding network time since mocked)
+            avg_time = statistics.mean(times)
+            p95_time = statistics.quantiles(times, n=20)[18]
+            max_time = max(times)
+            
+            assert avg_time < 0.01, f"Average response time {avg_time:.6f}s exceeds 10ms"
+            assert p95_time < 0.05, f"95th percentile {p95_time:.6f}s exceeds 50ms"
+            assert max_time < 0.1, f"Max response time {max_time:.6f}s exceeds 100ms"
 
     @pytest.mark.slow
-    def test_concurrent_performance(self):
+    def test_concurrent_performance(self, make_app):
         """Test performance under concurrent load."""
         import requests_mock
         
@@ -138,58 +127,53 @@ class TestPerformance:
         
         # Set up mocking and environment once for all concurrent requests
         with requests_mock.Mocker() as m:
-            env_vars = {
-                'FENCE_BASE': 'https://test-fence.example.com/user',
-                'HTTP_TIMEOUT': '5.0'
-            }
-            with patch.dict('os.environ', env_vars):
-                import app
+            flask_app = make_app({'HTTP_TIMEOUT': 5.0})
+            
+            fence_url = "https://test-fence.example.com/user/user"
+            m.get(fence_url, json=user_doc, status_code=200)
+            
+            def make_request(request_id):
+                """Make a single authorization request."""
+                client = flask_app.test_client()
+                start = time.perf_counter()
+                response = client.get('/check', headers={
+                    'Authorization': f'Bearer concurrent-token-{request_id}'
+                })
+                end = time.perf_counter()
+                return response.status_code, end - start
+            
+            # Test with different concurrency levels
+            for num_workers in [5, 10, 20]:
+                num_requests = num_workers * 10
                 
-                fence_url = "https://test-fence.example.com/user/user"
-                m.get(fence_url, json=user_doc, status_code=200)
+                start_time = time.perf_counter()
+                with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+                    futures = [executor.submit(make_request, i) for i in range(num_requests)]
+                    results = [future.result() for future in concurrent.futures.as_completed(futures)]
+                end_time = time.perf_counter()
                 
-                def make_request(request_id):
-                    """Make a single authorization request."""
-                    client = app.app.test_client()
-                    start = time.perf_counter()
-                    response = client.get('/check', headers={
-                        'Authorization': f'Bearer concurrent-token-{request_id}'
-                    })
-                    end = time.perf_counter()
-                    return response.status_code, end - start
+                # Verify all requests succeeded
+                status_codes, response_times = zip(*results)
+                
+                # Debug: Print failed status codes
+                failed_codes = [code for code in status_codes if code != 200]
+                if failed_codes:
+                    print(f"Failed status codes: {failed_codes}")
+                    print(f"Total requests: {len(status_codes)}, Failed: {len(failed_codes)}")
                 
-                # Test with different concurrency levels
-                for num_workers in [5, 10, 20]:
-                    num_requests = num_workers * 10
-                    
-                    start_time = time.perf_counter()
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-                        futures = [executor.submit(make_request, i) for i in range(num_requests)]
-                        results = [future.result() for future in concurrent.futures.as_completed(futures)]
-                    end_time = time.perf_counter()
-                    
-                    # Verify all requests succeeded
-                    status_codes, response_times = zip(*results)
-                    
-                    # Debug: Print failed status codes
-                    failed_codes = [code for code in status_codes if code != 200]
-                    if failed_codes:
-                        print(f"Failed status codes: {failed_codes}")
-                        print(f"Total requests: {len(status_codes)}, Failed: {len(failed_codes)}")
-                    
-                    assert all(code == 200 for code in status_codes), f"Some requests failed. Failed codes: {failed_codes}"
-                    
-                    # Performance metrics
-                    total_time = end_time - start_time
-                    avg_response_time = statistics.mean(response_times)
-                    throughput = num_requests / total_time
-                    
-                    print(f"Concurrency {num_workers}: {throughput:.1f} req/s, "
-                          f"avg response: {avg_response_time:.3f}s")
-                    
-                    # Assertions
-                    assert avg_response_time < 0.1, f"Average response time too high: {avg_response_time:.3f}s"
-                    assert throughput > 50, f"Throughput too low: {throughput:.1f} req/s"
+                assert all(code == 200 for code in status_codes), f"Some requests failed. Failed codes: {failed_codes}"
+                
+                # Performance metrics
+                total_time = end_time - start_time
+                avg_response_time = statistics.mean(response_times)
+                throughput = num_requests / total_time
+                
+                print(f"Concurrency {num_workers}: {throughput:.1f} req/s, "
+                      f"avg response: {avg_response_time:.3f}s")
+                
+                # Assertions
+                assert avg_response_time < 0.1, f"Average response time too high: {avg_response_time:.3f}s"
+                assert throughput > 50, f"Throughput too low: {throughput:.1f} req/s"
 
     @pytest.mark.slow
     def test_memory_usage(self):
@@ -234,6 +218,54 @@ class TestPerformance:
         # Memory growth should be minimal (less than 10MB)
         assert memory_growth_mb < 10, f"Memory growth too high: {memory_growth_mb:.1f}MB"
 
+    @pytest.mark.slow
+    def test_soak_no_sustained_allocation_growth(self, benchmarks):
+        """Drive /check with rotating tokens and fail on steady growth at any allocation site.
+
+        SOAK_REQUESTS and SOAK_INTERVAL scale this up to a full soak, e.g.
+        SOAK_REQUESTS=2000000 SOAK_INTERVAL=200000.
+        """
+        import os
+        import soak
+
+        requests = int(os.environ.get("SOAK_REQUESTS", "3000"))
+        interval = int(os.environ.get("SOAK_INTERVAL", "600"))
+        detector = soak.soak(requests, interval, tokens=400, threads=2)
+
+        assert detector.snapshots == -(-requests // interval) + 1
+        # Under pytest-cov the coverage collector's own data grows with every
+        # new line pair it records; that is the measurement, not the adapter.
+        suspects = [s for s in detector.suspects() if f"{os.sep}coverage{os.sep}" not in s[0]]
+        assert suspects == []
+
+    @pytest.mark.slow
+    def test_microbenchmarks_detect_significant_slowdown(self, benchmarks):
+        """The microbenchmark comparison flags a real shift and ignores noise."""
+        import random
+        import micro
+
+        results = micro.run(list(micro.BENCHMARKS), samples=3, min_sample_ms=1.0)
+        assert set(results) == set(micro.BENCHMARKS)
+        assert all(row["median_ratio"] > 0 and len(row["samples"]) == 3 for row in results.values())
+
+        rng = random.Random(7)
+        before = [rng.gauss(1.0, 0.02) for _ in range(20)]
+        noise = [rng.gauss(1.0, 0.02) for _ in range(20)]
+        slower = [rng.gauss(1.1, 0.02) for _ in range(20)]
+        rows = {
+            name: {"samples": samples, "median_ratio": statistics.median(samples)}
+            for name, samples in (("before", before), ("noise", noise), ("slower", slower))
+        }
+        verdicts = {
+            name: significant
+            for name, _, _, significant in micro.compare(
+                {"noise": rows["before"], "slower": rows["before"]},
+                {"noise": rows["noise"], "slower": rows["slower"]},
+                alpha=0.01, min_slowdown=0.05,
+            )
+        }
+        assert verdicts == {"noise": False, "slower": True}
+
     @pytest.mark.slow
     def test_large_authorization_document(self):
         """Test performance with very large authorization documents."""
@@ -285,9 +317,9 @@ class TestPerformance:
         assert max_time < 0.05, f"Max time {max_time:.6f}s too high for large document"
 
     @pytest.mark.slow
-    def test_stress_test_health_endpoint(self):
+    def test_stress_test_health_endpoint(self, make_app):
         """Stress test the health endpoint."""
-        client = app.app.test_client()
+        client = make_app().test_client()
         
         # Make many rapid requests
         start_time = time.perf_counter()
@@ -308,12 +340,7 @@ class TestPerformance:
 class TestResourceUsage:
     """Test resource usage patterns."""
 
-    def setup_method(self):
-        """Reset app module before each test."""
-        if 'app' in sys.modules:
-            del sys.modules['app']
-
-    def test_cpu_usage_pattern(self):
+    def test_cpu_usage_pattern(self, make_app):
         """Test CPU usage remains reasonable under load."""
         import psutil
         import threading
@@ -345,24 +372,19 @@ class TestResourceUsage:
         
         try:
             with requests_mock.Mocker() as m:
-                env_vars = {
-                    'FENCE_BASE': 'https://test-fence.example.com/user',
-                    'HTTP_TIMEOUT': '1.0'
-                }
-                with patch.dict('os.environ', env_vars):
-                    import app
-                    
-                    fence_url = "https://test-fence.example.com/user/user"
-                    m.get(fence_url, json=user_doc, status_code=200)
-                    
-                    client = app.app.test_client()
-                    
-                    # Generate load
-                    for i in range(100):
-                        response = client.get('/check', headers={
-                            'Authorization': f'Bearer cpu-token-{i}'
-                        })
-                        assert response.status_code == 200
+                flask_app = make_app({'HTTP_TIMEOUT': 1.0})
+                
+                fence_url = "https://test-fence.example.com/user/user"
+                m.get(fence_url, json=user_doc, status_code=200)
+                
+                client = flask_app.test_client()
+                
+                # Generate load
+                for i in range(100):
+                    response = client.get('/check', headers={
+                        'Authorization': f'Bearer cpu-token-{i}'
+                    })
+                    assert response.status_code == 200
         finally:
             stop_monitoring.set()
             monitor_thread.join()
@@ -377,7 +399,7 @@ class TestResourceUsage:
             assert avg_cpu < 80, f"Average CPU usage too high: {avg_cpu:.1f}%"
             assert max_cpu < 150, f"Peak CPU usage too high: {max_cpu:.1f}%"
 
-    def test_response_time_consistency(self):
+    def test_response_time_consistency(self, make_app):
         """Test that response times are consistent."""
         import requests_mock
         
@@ -392,39 +414,34 @@ class TestResourceUsage:
         }
         
         with requests_mock.Mocker() as m:
-            env_vars = {
-                'FENCE_BASE': 'https://test-fence.example.com/user',
-                'HTTP_TIMEOUT': '1.0'
-            }
-            with patch.dict('os.environ', env_vars):
-                import app
-                
-                fence_url = "https://test-fence.example.com/user/user"
-                m.get(fence_url, json=user_doc, status_code=200)
-                
-                client = app.app.test_client()
-                
-                response_times = []
-                for i in range(200):
-                    start = time.perf_counter()
-                    response = client.get('/check', headers={
-                        'Authorization': f'Bearer consistency-token-{i}'
-                    })
-                    end = time.perf_counter()
-                    
-                    assert response.status_code == 200
-                    response_times.append(end - start)
-                
-                # Calculate consistency metrics
-                mean_time = statistics.mean(response_times)
-                stdev_time = statistics.stdev(response_times)
-                coefficient_of_variation = stdev_time / mean_time
-                
-                # Response times should be reasonably consistent
-                # Note: More lenient threshold for test environment while still catching major issues
-                assert coefficient_of_variation < 1.0, f"Response times too variable: CV={coefficient_of_variation:.3f}"
+            flask_app = make_app({'HTTP_TIMEOUT': 1.0})
+            
+            fence_url = "https://test-fence.example.com/user/user"
+            m.get(fence_url, json=user_doc, status_code=200)
+            
+            client = flask_app.test_client()
+            
+            response_times = []
+            for i in range(200):
+                start = time.perf_counter()
+                response = client.get('/check', headers={
+                    'Authorization': f'Bearer consistency-token-{i}'
+                })
+                end = time.perf_counter()
                 
-                # No response should be more than 3 standard deviations from mean
-                outliers = [t for t in response_times if abs(t - mean_time) > 3 * stdev_time]
-                outlier_percentage = len(outliers) / len(response_times) * 100
-                assert outlier_percentage < 5, f"Too many outliers: {outlier_percentage:.1f}%"
+                assert response.status_code == 200
+                response_times.append(end - start)
+            
+            # Calculate consistency metrics
+            mean_time = statistics.mean(response_times)
+            stdev_time = statistics.stdev(response_times)
+            coefficient_of_variation = stdev_time / mean_time
+            
+            # Response times should be reasonably consistent
+            # Note: More lenient threshold for test environment while still catching major issues
+            assert coefficient_of_variation < 1.0, f"Response times too variable: CV={coefficient_of_variation:.3f}"
+            
+            # No response should be more than 3 standard deviations from mean
+            outliers = [t for t in response_times if abs(t - mean_time) > 3 * stdev_time]
+            outlier_percentage = len(outliers) / len(response_times) * 100
+            assert outlier_percentage < 5, f"Too many outliers: {outlier_percentage:.1f}%"
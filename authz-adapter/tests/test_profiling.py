@@ -0,0 +1,166 @@
+"""Tests for the sampling profiler and the /debug/profile endpoints."""
+
+import sys
+import threading
+import time
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "profiled@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+ADMIN = {'Authorization': 'Bearer admin-secret'}
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+class TestStackSampler:
+    """Unit tests for collapse_stack and StackSampler."""
+
+    @pytest.mark.unit
+    def test_collapse_stack_root_first(self):
+        def inner():
+            return app.collapse_stack(sys._getframe())
+
+        stack = inner()
+        frames = stack.split(";")
+        assert frames[-1].endswith("inner")
+        assert frames[-2].endswith("test_collapse_stack_root_first")
+        assert all(":" in frame for frame in frames)
+
+    @pytest.mark.unit
+    def test_sampler_sees_busy_thread_but_not_itself(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        try:
+            sampler = app.StackSampler(interval=0.001)
+            sampler.run_for(0.1)
+        finally:
+            stop.set()
+            worker.join()
+        assert sampler.samples > 0
+        output = sampler.collapsed()
+        assert "busy_loop" in output
+        assert "run_for" not in output
+        lines = output.splitlines()
+        counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+        assert counts == sorted(counts, reverse=True)
+
+        sampler.collapsed(clear=True)
+        assert sampler.collapsed() == ""
+        assert sampler.samples == 0
+
+
+class TestProfileEndpoints:
+    """Test /debug/profile and header-triggered /check profiling.
+
+    The profiler settings are process-wide, so tests patch the module's
+    values rather than configure an instance.
+    """
+
+    @pytest.mark.unit
+    def test_profile_hidden_without_admin_token(self, make_app):
+        client = make_app({'ADMIN_TOKEN': ''}).test_client()
+        assert client.get('/debug/profile').status_code == 404
+        assert client.get('/debug/profile/requests').status_code == 404
+
+    @pytest.mark.unit
+    def test_profile_requires_admin(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        response = client.get('/debug/profile', headers={'Authorization': 'Bearer nope'})
+        assert response.status_code == 401
+
+    @pytest.mark.unit
+    def test_profile_rejects_bad_parameters(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        with patch.object(app, 'PROFILE_MAX_SECONDS', 5.0):
+            for query in ('seconds=abc', 'seconds=0', 'seconds=6', 'seconds=1&interval_ms=0'):
+                assert client.get(f'/debug/profile?{query}', headers=ADMIN).status_code == 400
+
+    @pytest.mark.unit
+    def test_profile_returns_collapsed_stacks(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        try:
+            response = client.get('/debug/profile?seconds=0.1&interval_ms=1', headers=ADMIN)
+        finally:
+            stop.set()
+            worker.join()
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert int(response.headers['X-Profile-Samples']) > 0
+        assert 'busy_loop' in response.get_data(as_text=True)
+
+    @pytest.mark.unit
+    def test_only_one_profile_at_a_time(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        with app._profile_lock:
+            response = client.get('/debug/profile?seconds=1', headers=ADMIN)
+        assert response.status_code == 409
+
+    @pytest.mark.unit
+    def test_header_profiles_sampled_check(self, make_app):
+        def slow_fence(request, context):
+            time.sleep(0.1)
+            return USER_DOC
+
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        profiler = app.RequestProfiler(interval=0.001)
+        with patch.object(app, 'PROFILE_SAMPLE_RATE', 1.0):
+            with patch.object(app, 'REQUEST_PROFILER', profiler):
+                with requests_mock.Mocker() as m:
+                    m.get(FENCE_URL, json=slow_fence)
+                    response = client.get('/check', headers={
+                        'Authorization': 'Bearer slow', 'X-Authz-Profile': '1',
+                    })
+                    assert response.status_code == 200
+
+                profile = client.get('/debug/profile/requests', headers=ADMIN)
+                body = profile.get_data(as_text=True)
+                assert 'app:AuthzAdapter._get_userinfo' in body
+                assert 'app:check;app:_check' in body
+                assert client.get('/debug/profile/requests', headers=ADMIN).data == b''
+
+    @pytest.mark.unit
+    def test_check_without_header_not_profiled(self, make_app):
+        client = make_app().test_client()
+        with patch.object(app, 'PROFILE_SAMPLE_RATE', 1.0):
+            with requests_mock.Mocker() as m:
+                m.get(FENCE_URL, json=USER_DOC)
+                with patch.object(app.REQUEST_PROFILER, 'begin') as begin:
+                    client.get('/check', headers={'Authorization': 'Bearer x'})
+            begin.assert_not_called()
+
+    @pytest.mark.unit
+    def test_disabled_by_default(self, make_app):
+        client = make_app().test_client()
+        profiler = app.RequestProfiler()
+        with patch.object(app, 'PROFILE_SAMPLE_RATE', 0.0):
+            with patch.object(app, 'REQUEST_PROFILER', profiler):
+                with requests_mock.Mocker() as m:
+                    m.get(FENCE_URL, json=USER_DOC)
+                    with patch.object(app.random, 'random') as roll:
+                        response = client.get('/check', headers={
+                            'Authorization': 'Bearer x', 'X-Authz-Profile': '1',
+                        })
+        assert response.status_code == 200
+        roll.assert_not_called()
+        assert profiler._thread is None
@@ -0,0 +1,116 @@
+"""Tests for per-token and per-client-IP rate limiting in front of Fence."""
+
+import pytest
+import requests_mock
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "ratelimited@example.com",
+    "authz": {}
+}
+
+
+class TestTokenBucketSketch:
+    """Unit tests for TokenBucketSketch."""
+
+    @pytest.mark.unit
+    def test_burst_then_refill(self):
+        limiter = app.TokenBucketSketch(rate=2.0, burst=3, width=128, depth=2)
+        assert [limiter.allow("k", now=0.0) for _ in range(4)] == [True, True, True, False]
+        assert limiter.allow("k", now=0.5)
+        assert not limiter.allow("k", now=0.5)
+
+    @pytest.mark.unit
+    def test_keys_are_independent(self):
+        limiter = app.TokenBucketSketch(rate=1.0, burst=1, width=1024, depth=3)
+        assert limiter.allow("a", now=0.0)
+        assert not limiter.allow("a", now=0.0)
+        assert limiter.allow("b", now=0.0)
+
+    @pytest.mark.unit
+    def test_memory_is_bounded(self):
+        limiter = app.TokenBucketSketch(rate=1.0, burst=1, width=64, depth=2)
+        size = len(limiter._tokens) + len(limiter._stamps)
+        for i in range(10000):
+            limiter.allow(f"attacker-{i}", now=0.0)
+        assert len(limiter._tokens) + len(limiter._stamps) == size == 256
+
+    @pytest.mark.unit
+    def test_zero_rate_disables(self):
+        limiter = app.TokenBucketSketch(rate=0, burst=1, width=8, depth=1)
+        assert all(limiter.allow("k", now=0.0) for _ in range(100))
+
+    @pytest.mark.unit
+    def test_client_ip_precedence(self):
+        with app.app.test_request_context(
+            '/check', headers={'X-Real-IP': '10.0.0.9', 'X-Forwarded-For': '1.1.1.1, 10.0.0.2'}
+        ):
+            assert app.client_ip(app.request) == '10.0.0.9'
+        with app.app.test_request_context(
+            '/check', headers={'X-Forwarded-For': '1.1.1.1, 10.0.0.2'}
+        ):
+            assert app.client_ip(app.request) == '10.0.0.2'
+        with app.app.test_request_context('/check', environ_base={'REMOTE_ADDR': '10.0.0.3'}):
+            assert app.client_ip(app.request) == '10.0.0.3'
+
+
+class TestCheckRateLimits:
+    """Test that throttled /check calls never reach Fence."""
+
+    @pytest.mark.unit
+    def test_per_ip_limit_with_distinct_bad_tokens(self, make_app):
+        client = make_app({'RATE_LIMIT_IP_PER_SEC': 1, 'RATE_LIMIT_IP_BURST': 5}).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, status_code=401)
+
+            codes = [
+                client.get('/check', headers={
+                    'Authorization': f'Bearer broken-{i}',
+                    'X-Real-IP': '203.0.113.7',
+                }).status_code
+                for i in range(50)
+            ]
+            assert codes.count(401) <= 6
+            assert codes.count(429) >= 44
+            assert m.call_count == codes.count(401)
+
+            other = client.get('/check', headers={
+                'Authorization': 'Bearer from-elsewhere',
+                'X-Real-IP': '198.51.100.1',
+            })
+            assert other.status_code == 401
+
+    @pytest.mark.unit
+    def test_per_token_limit(self, make_app):
+        flask_app = make_app({'RATE_LIMIT_TOKEN_PER_SEC': 1, 'RATE_LIMIT_TOKEN_BURST': 3})
+        client = flask_app.test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, status_code=401)
+
+            responses = [
+                client.get('/check', headers={'Authorization': 'Bearer looping'})
+                for _ in range(20)
+            ]
+            throttled = [r for r in responses if r.status_code == 429]
+            assert len(throttled) >= 16
+            assert throttled[0].headers['X-Authz-Cache'] == 'throttled'
+            assert throttled[0].headers['Retry-After'] == '1'
+            assert m.call_count <= 4
+
+    @pytest.mark.unit
+    def test_cache_hits_not_rate_limited(self, make_app):
+        flask_app = make_app({'RATE_LIMIT_TOKEN_PER_SEC': 1, 'RATE_LIMIT_TOKEN_BURST': 1})
+        client = flask_app.test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+
+            codes = [
+                client.get('/check', headers={'Authorization': 'Bearer good'}).status_code
+                for _ in range(20)
+            ]
+            assert codes == [200] * 20
+            assert m.call_count == 1
@@ -0,0 +1,173 @@
+"""Tests for conditional (ETag / Last-Modified) revalidation of cached decisions."""
+
+import pytest
+import requests_mock
+from unittest.mock import patch
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "etag@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+# Every request revalidates: entries expire at once but stay usable for a minute.
+CONFIG = {
+    'CACHE_TTL_SECONDS': 0,
+    'CACHE_STALE_SECONDS': 60,
+}
+
+
+class ConditionalFence:
+    """requests_mock callback that honours If-None-Match like a validator-aware Fence."""
+
+    def __init__(self, doc, etag='"v1"'):
+        self.doc = doc
+        self.etag = etag
+
+    def __call__(self, request, context):
+        context.headers['ETag'] = self.etag
+        if request.headers.get('If-None-Match') == self.etag:
+            context.status_code = 304
+            return None
+        return self.doc
+
+
+class TestConditionalRevalidation:
+    """Test /check revalidation against a Fence that supports validators."""
+
+    @pytest.mark.unit
+    def test_not_modified_renews_without_reducing(self, make_app):
+        fence = ConditionalFence(USER_DOC)
+        client = make_app(CONFIG).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=fence)
+            headers = {'Authorization': 'Bearer unchanged'}
+            assert client.get('/check', headers=headers).headers['X-Authz-Cache'] == 'miss'
+
+            with patch.object(app, 'reduce_user_doc', wraps=app.reduce_user_doc) as spy:
+                response = client.get('/check', headers=headers)
+            assert response.status_code == 200
+            assert response.headers['X-Authz-Cache'] == 'revalidated'
+            assert response.headers['X-Auth-Request-Email'] == 'etag@example.com'
+            assert spy.call_count == 0
+            assert m.request_history[1].headers['If-None-Match'] == '"v1"'
+            assert 'decision;' not in response.headers['Server-Timing']
+
+    @pytest.mark.unit
+    def test_changed_document_replaces_decision(self, make_app):
+        fence = ConditionalFence(USER_DOC)
+        flask_app = make_app(CONFIG)
+        client = flask_app.test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=fence)
+            headers = {'Authorization': 'Bearer changing'}
+            assert 'argo-runner' in client.get('/check', headers=headers).headers[
+                'X-Auth-Request-Groups'
+            ]
+
+            fence.doc = {"active": True, "email": "etag@example.com", "authz": {}}
+            fence.etag = '"v2"'
+            response = client.get('/check', headers=headers)
+            assert response.headers['X-Authz-Cache'] == 'miss'
+            assert response.headers['X-Auth-Request-Groups'] == 'argo-viewer'
+
+            cache = flask_app.extensions['authz_adapter'].cache
+            entry, _ = cache.get(app.token_hash('Bearer changing'))
+            assert entry.validators == ('"v2"', None)
+
+    @pytest.mark.unit
+    def test_revalidates_past_stale_window(self, make_app):
+        fence = ConditionalFence(USER_DOC)
+        client = make_app(dict(CONFIG, CACHE_STALE_SECONDS=0)).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=fence)
+            headers = {'Authorization': 'Bearer long-gone'}
+            assert client.get('/check', headers=headers).headers['X-Authz-Cache'] == 'miss'
+
+            response = client.get('/check', headers=headers)
+            assert response.status_code == 200
+            assert response.headers['X-Authz-Cache'] == 'revalidated'
+            assert m.request_history[1].headers['If-None-Match'] == '"v1"'
+
+    @pytest.mark.unit
+    def test_entry_past_stale_window_is_not_served(self, make_app):
+        client = make_app(dict(CONFIG, CACHE_STALE_SECONDS=0)).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, [
+                {'json': USER_DOC, 'headers': {'ETag': '"v1"'}},
+                {'status_code': 503},
+            ])
+            headers = {'Authorization': 'Bearer fence-down'}
+            assert client.get('/check', headers=headers).status_code == 200
+
+            response = client.get('/check', headers=headers)
+            assert response.status_code != 200
+            assert response.headers['X-Authz-Cache'] == 'miss'
+            assert m.request_history[1].headers['If-None-Match'] == '"v1"'
+
+    @pytest.mark.unit
+    def test_last_modified_sent_as_if_modified_since(self, make_app):
+        stamp = 'Wed, 21 Oct 2026 07:28:00 GMT'
+        client = make_app(CONFIG).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, [
+                {'json': USER_DOC, 'headers': {'Last-Modified': stamp}},
+                {'status_code': 304},
+            ])
+            headers = {'Authorization': 'Bearer dated'}
+            client.get('/check', headers=headers)
+            response = client.get('/check', headers=headers)
+            assert response.headers['X-Authz-Cache'] == 'revalidated'
+            assert m.request_history[1].headers['If-Modified-Since'] == stamp
+            assert 'If-None-Match' not in m.request_history[1].headers
+
+    @pytest.mark.unit
+    def test_no_validators_no_conditional_request(self, make_app):
+        client = make_app(CONFIG).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            headers = {'Authorization': 'Bearer plain'}
+            client.get('/check', headers=headers)
+            client.get('/check', headers=headers)
+            assert 'If-None-Match' not in m.request_history[1].headers
+            assert 'If-Modified-Since' not in m.request_history[1].headers
+
+    @pytest.mark.unit
+    def test_unsolicited_not_modified_is_an_error(self, make_app):
+        adapter = make_app().extensions['authz_adapter']
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, status_code=304)
+            doc, err = adapter.fetch_user_doc('Bearer confused')
+            assert doc is None
+            assert err == 'userinfo status 304'
+
+    @pytest.mark.unit
+    def test_unexpected_error_is_reported(self, make_app):
+        adapter = make_app().extensions['authz_adapter']
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, exc=RuntimeError('boom'))
+            doc, err = adapter.fetch_user_doc('Bearer broken')
+            assert doc is None
+            assert err == 'unexpected error: boom'
+
+    @pytest.mark.unit
+    def test_snapshot_keeps_validators(self, make_app, tmp_path):
+        adapter = make_app(CONFIG).extensions['authz_adapter']
+        decision = app.reduce_user_doc(USER_DOC)
+        decision.validators = ('"v9"', None)
+        adapter.cache.set(app.token_hash('Bearer kept'), decision)
+        snapshot = app.CacheSnapshot(str(tmp_path / "snapshot.json"))
+        snapshot.write(adapter.cache, adapter.namespace_index)
+
+        restored = app.DecisionCache()
+        snapshot.load(restored, adapter.namespace_index)
+        entry, _ = restored.get(app.token_hash('Bearer kept'))
+        assert entry.validators == ('"v9"', None)
@@ -0,0 +1,257 @@
+"""Tests for the revoked-token list and the /admin/revocations endpoint."""
+
+import hashlib
+import threading
+import time
+import pytest
+import requests_mock
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "revocable@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+
+def sha256(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TestRevocationList:
+    """Unit tests for RevocationList."""
+
+    @pytest.mark.unit
+    def test_membership(self):
+        revoked = app.RevocationList(capacity=1000)
+        for i in range(500):
+            revoked.add(sha256(f"revoked-{i}"))
+        assert all(sha256(f"revoked-{i}") in revoked for i in range(500))
+        assert not any(sha256(f"valid-{i}") in revoked for i in range(5000))
+        assert len(revoked) == 500
+
+    @pytest.mark.unit
+    def test_add_is_idempotent(self):
+        revoked = app.RevocationList(capacity=10)
+        assert revoked.add(sha256("t"))
+        assert not revoked.add(sha256("t"))
+        assert len(revoked) == 1
+
+    @pytest.mark.unit
+    def test_grows_past_capacity(self):
+        revoked = app.RevocationList(capacity=8)
+        bits = revoked.num_bits
+        for i in range(100):
+            revoked.add(sha256(f"t-{i}"))
+        assert revoked.capacity >= 100
+        assert revoked.num_bits > bits
+        assert all(sha256(f"t-{i}") in revoked for i in range(100))
+
+    @pytest.mark.unit
+    def test_lookups_during_resize(self):
+        revoked = app.RevocationList(capacity=1)
+        known = [sha256(f"known-{i}") for i in range(50)]
+        for digest in known:
+            revoked.add(digest)
+        done = threading.Event()
+        failures = []
+
+        def check():
+            while not done.is_set():
+                try:
+                    if not all(digest in revoked for digest in known):
+                        failures.append("missing")
+                except Exception as e:
+                    failures.append(repr(e))
+
+        readers = [threading.Thread(target=check) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            for i in range(4000):
+                revoked.add(sha256(f"t-{i}"))
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+        assert failures == []
+
+    @pytest.mark.unit
+    def test_load_file(self, tmp_path):
+        path = tmp_path / "revoked.txt"
+        path.write_text(
+            "# revoked after incident\n"
+            f"{sha256('one')}\n"
+            "\n"
+            f"{sha256('two').upper()}  # rotated\n"
+            "not-a-hash\n"
+        )
+        revoked = app.RevocationList(capacity=10)
+        assert revoked.load_file(str(path)) == 2
+        assert sha256("one") in revoked
+        assert sha256("two") in revoked
+
+    @pytest.mark.unit
+    def test_token_hash_matches_sha256sum(self):
+        assert app.token_hash("Bearer abc") == sha256("abc")
+        assert app.token_hash("bearer abc") == sha256("abc")
+
+
+class TestRevocationEnforcement:
+    """Test /check and /admin/revocations."""
+
+    @pytest.mark.unit
+    def test_revoked_from_file_never_reaches_fence(self, make_app, tmp_path):
+        path = tmp_path / "revoked.txt"
+        path.write_text(sha256("stolen-token") + "\n")
+        client = make_app({'REVOCATION_FILE': str(path)}).test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            response = client.get('/check', headers={'Authorization': 'Bearer stolen-token'})
+            assert response.status_code == 401
+            assert 'token revoked' in response.get_data(as_text=True)
+            assert response.headers['X-Authz-Cache'] == 'revoked'
+            assert m.call_count == 0
+
+    @pytest.mark.unit
+    def test_admin_revocation_overrides_cached_decision(self, make_app):
+        flask_app = make_app({'ADMIN_TOKEN': 'admin-secret'})
+        client = flask_app.test_client()
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            headers = {'Authorization': 'Bearer leaked-token'}
+            assert client.get('/check', headers=headers).status_code == 200
+            assert client.get('/check', headers=headers).headers['X-Authz-Cache'] == 'hit'
+
+            response = client.post(
+                '/admin/revocations',
+                json={'tokens': ['leaked-token']},
+                headers={'Authorization': 'Bearer admin-secret'},
+            )
+            assert response.status_code == 200
+            assert response.get_json() == {'added': 1, 'count': 1, 'scope': 'worker'}
+
+            assert client.get('/check', headers=headers).status_code == 401
+            assert len(flask_app.extensions['authz_adapter'].cache) == 0
+
+    @pytest.mark.unit
+    def test_admin_accepts_hashes_and_rejects_malformed(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        admin = {'Authorization': 'Bearer admin-secret'}
+
+        response = client.post(
+            '/admin/revocations', json={'hashes': [sha256('x')]}, headers=admin
+        )
+        assert response.get_json()['added'] == 1
+        response = client.post(
+            '/admin/revocations', json={'hashes': ['zz']}, headers=admin
+        )
+        assert response.status_code == 400
+        assert client.get('/admin/revocations', headers=admin).get_json()['count'] == 1
+
+    @pytest.mark.unit
+    def test_admin_rejects_malformed_bodies(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        admin = {'Authorization': 'Bearer admin-secret'}
+        for body in ([sha256('x')], 'tokens', {'hashes': sha256('x')}, {'tokens': 'leaked'}):
+            response = client.post('/admin/revocations', json=body, headers=admin)
+            assert response.status_code == 400, body
+        response = client.post('/admin/revocations', data='not json', headers=admin)
+        assert response.status_code == 400
+        assert client.get('/admin/revocations', headers=admin).get_json()['count'] == 0
+
+    @pytest.mark.unit
+    def test_admin_revocation_reaches_other_instances(self, make_app, tmp_path):
+        config = {
+            'ADMIN_TOKEN': 'admin-secret',
+            'ADMIN_REVOCATION_FILE': str(tmp_path / 'admin-revoked.txt'),
+            'CONFIG_POLL_INTERVAL': 0.05,
+        }
+        replica_a, replica_b = make_app(config), make_app(config)
+        headers = {'Authorization': 'Bearer leaked-elsewhere'}
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            client_a = replica_a.test_client()
+            assert client_a.get('/check', headers=headers).status_code == 200
+
+            response = replica_b.test_client().post(
+                '/admin/revocations', json={'tokens': ['leaked-elsewhere']},
+                headers={'Authorization': 'Bearer admin-secret'},
+            )
+            assert response.get_json() == {'added': 1, 'count': 1, 'scope': 'shared'}
+
+            deadline = time.monotonic() + 5
+            while client_a.get('/check', headers=headers).status_code == 200:
+                assert time.monotonic() < deadline, 'revocation never reached replica A'
+                time.sleep(0.05)
+            assert client_a.get('/check', headers=headers).headers['X-Authz-Cache'] == 'revoked'
+
+        restarted = make_app(dict(config, CONFIG_WATCH='false'))
+        assert sha256('leaked-elsewhere') in restarted.extensions['authz_adapter'].revocations
+
+    @pytest.mark.unit
+    def test_snapshot_from_before_revocation_is_not_restored(self, make_app, tmp_path):
+        config = {
+            'ADMIN_TOKEN': 'admin-secret',
+            'ADMIN_REVOCATION_FILE': str(tmp_path / 'admin-revoked.txt'),
+            'CACHE_SNAPSHOT_FILE': str(tmp_path / 'snapshot.json'),
+            'CONFIG_WATCH': 'false',
+        }
+        headers = {'Authorization': 'Bearer snapshotted'}
+        before = make_app(config)
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            assert before.test_client().get('/check', headers=headers).status_code == 200
+        assert before.extensions['authz_adapter'].write_cache_snapshot() == 1
+
+        response = before.test_client().post(
+            '/admin/revocations', json={'tokens': ['snapshotted']},
+            headers={'Authorization': 'Bearer admin-secret'},
+        )
+        assert response.get_json()['scope'] == 'shared'
+
+        # A crash loses the final snapshot write; the restarted worker finds the old one.
+        restarted = make_app(config)
+        assert restarted.extensions['authz_adapter'].warm_up() == 0
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            response = restarted.test_client().get('/check', headers=headers)
+            assert response.status_code == 401
+            assert m.call_count == 0
+
+    @pytest.mark.unit
+    def test_unwritable_revocation_file_is_reported(self, make_app, tmp_path):
+        flask_app = make_app({
+            'ADMIN_TOKEN': 'admin-secret',
+            'ADMIN_REVOCATION_FILE': str(tmp_path / 'missing-dir' / 'admin-revoked.txt'),
+            'CONFIG_WATCH': 'false',
+        })
+        response = flask_app.test_client().post(
+            '/admin/revocations', json={'hashes': [sha256('x')]},
+            headers={'Authorization': 'Bearer admin-secret'},
+        )
+        assert response.status_code == 503
+        assert response.get_json()['scope'] == 'worker'
+        assert sha256('x') in flask_app.extensions['authz_adapter'].revocations
+
+    @pytest.mark.unit
+    def test_admin_requires_token(self, make_app):
+        client = make_app({'ADMIN_TOKEN': 'admin-secret'}).test_client()
+        assert client.get('/admin/revocations').status_code == 401
+        assert client.get(
+            '/admin/revocations', headers={'Authorization': 'Bearer wrong'}
+        ).status_code == 401
+
+    @pytest.mark.unit
+    def test_admin_disabled_without_admin_token(self, make_app):
+        response = make_app({'ADMIN_TOKEN': ''}).test_client().get(
+            '/admin/revocations', headers={'Authorization': 'Bearer '}
+        )
+        assert response.status_code == 404
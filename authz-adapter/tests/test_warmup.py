@@ -0,0 +1,168 @@
+"""Tests for startup warm-up and the persisted cache snapshot."""
+
+import json
+import os
+import threading
+import time
+import pytest
+import requests_mock
+
+import app
+
+FENCE_URL = "https://test-fence.example.com/user/user"
+
+USER_DOC = {
+    "active": True,
+    "email": "warm@example.com",
+    "authz": {
+        "/services/workflow/gen3-workflow": [
+            {"method": "create", "service": "gen3-workflow"}
+        ]
+    }
+}
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestCacheSnapshot:
+    """Unit tests for CacheSnapshot."""
+
+    @pytest.fixture
+    def populated(self):
+        cache = app.DecisionCache(max_entries=100)
+        for i in range(10):
+            key = app.token_hash(f"Bearer raw-token-{i}")
+            cache.set(key, app.reduce_user_doc(USER_DOC))
+            for _ in range(i):
+                cache.get(key)
+        return cache
+
+    @pytest.mark.unit
+    def test_round_trip_keeps_hottest_without_raw_tokens(self, populated, tmp_path):
+        cache = populated
+        path = tmp_path / "snapshot.json"
+        snapshot = app.CacheSnapshot(str(path), max_entries=3)
+        assert snapshot.write(cache, app.NamespaceIndex()) == 3
+
+        content = path.read_text()
+        assert "raw-token" not in content
+        assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+
+        restored = app.DecisionCache()
+        assert snapshot.load(restored, app.NamespaceIndex()) == 3
+        hottest = app.token_hash("Bearer raw-token-9")
+        entry, status = restored.get(hottest)
+        assert status == "hit"
+        assert entry.email == "warm@example.com"
+        assert entry.groups == ["argo-runner", "argo-viewer"]
+        assert abs(entry.expires_at - (time.monotonic() + app.CACHE_TTL_SECONDS)) < 5
+        assert restored.get(app.token_hash("Bearer raw-token-0"))[1] == "miss"
+
+    @pytest.mark.unit
+    def test_expired_and_revoked_entries_skipped(self, populated, tmp_path):
+        cache = populated
+        path = tmp_path / "snapshot.json"
+        snapshot = app.CacheSnapshot(str(path))
+        snapshot.write(cache, app.NamespaceIndex())
+        payload = json.loads(path.read_text())
+        payload["entries"][0][4] = time.time() - 1
+        path.write_text(json.dumps(payload))
+
+        revoked = app.RevocationList(capacity=10)
+        revoked.add(payload["entries"][1][0])
+        assert snapshot.load(app.DecisionCache(), app.NamespaceIndex(), revoked) == 8
+
+    @pytest.mark.unit
+    def test_registration_change_discards_snapshot(self, populated, tmp_path):
+        cache = populated
+        snapshot = app.CacheSnapshot(str(tmp_path / "snapshot.json"))
+        snapshot.write(cache, app.NamespaceIndex())
+        changed = app.NamespaceIndex([{"repoUrl": "https://github.com/a/b.git", "tenant": "a"}])
+        assert snapshot.load(app.DecisionCache(), changed) == 0
+
+    @pytest.mark.unit
+    def test_missing_or_corrupt_file(self, tmp_path):
+        snapshot = app.CacheSnapshot(str(tmp_path / "absent.json"))
+        assert snapshot.load(app.DecisionCache(), app.NamespaceIndex()) == 0
+        corrupt = tmp_path / "corrupt.json"
+        corrupt.write_text("{not json")
+        snapshot = app.CacheSnapshot(str(corrupt))
+        assert snapshot.load(app.DecisionCache(), app.NamespaceIndex()) == 0
+
+
+class TestWarmUp:
+    """Test warm_up, /readyz and periodic snapshot writes."""
+
+    @pytest.mark.unit
+    def test_service_token_resolved_before_traffic(self, make_app):
+        flask_app = make_app({'FENCE_SERVICE_TOKEN': 'svc-token'})
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            flask_app.extensions['authz_adapter'].warm_up()
+            assert m.call_count == 1
+
+            response = flask_app.test_client().get('/check')
+            assert response.status_code == 200
+            assert response.headers['X-Authz-Cache'] == 'hit'
+            assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_restart_serves_snapshot_without_fence(self, make_app, tmp_path):
+        config = {'CACHE_SNAPSHOT_FILE': str(tmp_path / "snapshot.json")}
+        headers = {'Authorization': 'Bearer returning-user'}
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            before = make_app(config)
+            before.test_client().get('/check', headers=headers)
+            assert before.extensions['authz_adapter'].stop_cache_snapshots() == 1
+
+            restarted = make_app(config)
+            assert restarted.extensions['authz_adapter'].warm_up() == 1
+            response = restarted.test_client().get('/check', headers=headers)
+            assert response.headers['X-Authz-Cache'] == 'hit'
+            assert m.call_count == 1
+
+    @pytest.mark.unit
+    def test_readyz_waits_for_warm_up(self, make_app):
+        gate = threading.Event()
+
+        def slow_fence(request, context):
+            gate.wait(5)
+            return USER_DOC
+
+        flask_app = make_app({'FENCE_SERVICE_TOKEN': 'svc-token'})
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=slow_fence)
+            client = flask_app.test_client()
+            assert client.get('/readyz').status_code == 200
+
+            flask_app.extensions['authz_adapter'].start_warm_up()
+            assert client.get('/readyz').status_code == 503
+            gate.set()
+            assert wait_for(lambda: client.get('/readyz').status_code == 200)
+
+    @pytest.mark.unit
+    def test_snapshot_written_periodically(self, make_app, tmp_path):
+        path = tmp_path / "snapshot.json"
+        flask_app = make_app({
+            'CACHE_SNAPSHOT_FILE': str(path),
+            'CACHE_SNAPSHOT_INTERVAL': 0.05,
+        })
+        adapter = flask_app.extensions['authz_adapter']
+        with requests_mock.Mocker() as m:
+            m.get(FENCE_URL, json=USER_DOC)
+            adapter.start_warm_up()
+            try:
+                flask_app.test_client().get('/check', headers={'Authorization': 'Bearer p'})
+                assert wait_for(
+                    lambda: path.exists() and json.loads(path.read_text())["entries"]
+                )
+            finally:
+                adapter.stop_cache_snapshots()
@@ -14,11 +14,23 @@ The service:
 """
 
 import os
-import re
+import queue
 import sqlite3
 import json
+import base64
+import hmac
+import io
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
 from pathlib import Path
-from flask import Flask, request, render_template, jsonify, redirect, url_for
+from flask import (
+    Flask, Response, request, render_template, jsonify, redirect, stream_with_context, url_for,
+)
+from registration_schema import CRD_PATH, compile_schema, is_decimal, load_crd_schema
 import logging
 
 # Configure logging
@@ -38,11 +50,369 @@ DEFAULT_DB_PATH = "/tmp/registrations.sqlite" if os.environ.get("FLASK_ENV") ==
 DB_PATH = os.environ.get("DB_PATH", DEFAULT_DB_PATH)
 
 
+# SQLite tuning. WAL lets form reads proceed while a submission is being
+# written, and synchronous=NORMAL only syncs the WAL at checkpoints, which
+# keeps committed registrations safe from application crashes (a power loss
+# may drop the most recent commits). Concurrent writers wait up to the busy
+# timeout for the write lock instead of failing with "database is locked".
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHED_STATEMENTS = 64
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL").upper()
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Invalid DB_SYNCHRONOUS '{DB_SYNCHRONOUS}'")
+
+# Group commit of save_registration(): concurrent saves are committed
+# together, up to GROUP_COMMIT_MAX_BATCH at a time, after waiting at most
+# GROUP_COMMIT_WINDOW_MS for company. Each batch is synced to disk before
+# any of its callers returns.
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "true").lower() == "true"
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "64"))
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", "2"))
+
+# Schema migrations, applied in order by init_db(). Each entry is a tuple of
+# statements; PRAGMA user_version records how many entries have been applied.
+SCHEMA_MIGRATIONS = [
+    (
+        """
+        CREATE TABLE IF NOT EXISTS registrations (
+            installation_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    # Normalized lookups: users and buckets in indexed side tables and the
+    # tenant as a column, backfilled from the JSON of existing rows.
+    (
+        "ALTER TABLE registrations ADD COLUMN tenant TEXT",
+        "UPDATE registrations SET tenant = json_extract(data, '$.tenant')",
+        "CREATE INDEX registrations_tenant ON registrations (tenant, installation_id)",
+        """
+        CREATE TABLE registration_users (
+            installation_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            email TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (installation_id, role, email)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX registration_users_email "
+        "ON registration_users (email, role, installation_id)",
+        """
+        CREATE TABLE registration_buckets (
+            installation_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            hostname TEXT,
+            PRIMARY KEY (installation_id, field)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX registration_buckets_bucket "
+        "ON registration_buckets (bucket, installation_id)",
+        """
+        INSERT OR IGNORE INTO registration_users (installation_id, role, email)
+        SELECT r.installation_id, 'admin', u.value
+        FROM registrations r, json_each(r.data, '$.adminUsers') u WHERE u.type = 'text'
+        """,
+        """
+        INSERT OR IGNORE INTO registration_users (installation_id, role, email)
+        SELECT r.installation_id, 'read', u.value
+        FROM registrations r, json_each(r.data, '$.readUsers') u WHERE u.type = 'text'
+        """,
+        """
+        INSERT INTO registration_buckets (installation_id, field, bucket, hostname)
+        SELECT installation_id, 'dataBucket', json_extract(data, '$.dataBucket.bucket'),
+               json_extract(data, '$.dataBucket.hostname')
+        FROM registrations WHERE json_extract(data, '$.dataBucket.bucket') IS NOT NULL
+        """,
+        """
+        INSERT INTO registration_buckets (installation_id, field, bucket, hostname)
+        SELECT installation_id, 'artifactBucket', json_extract(data, '$.artifactBucket.bucket'),
+               json_extract(data, '$.artifactBucket.hostname')
+        FROM registrations WHERE json_extract(data, '$.artifactBucket.bucket') IS NOT NULL
+        """,
+    ),
+    # Keyset pagination of the listing API on (updated_at, installation_id).
+    (
+        "CREATE INDEX registrations_updated ON registrations (updated_at, installation_id)",
+        "DROP INDEX registrations_tenant",
+        "CREATE INDEX registrations_tenant_updated "
+        "ON registrations (tenant, updated_at, installation_id)",
+    ),
+    # Append-only change log for incremental sync, seeded with one change
+    # per existing registration in update order.
+    (
+        """
+        CREATE TABLE registration_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            installation_id TEXT NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO registration_changes (installation_id, op, changed_at)
+        SELECT installation_id, 'upsert', updated_at FROM registrations
+        ORDER BY updated_at, installation_id
+        """,
+    ),
+    # Optimistic concurrency: every save bumps the version, and conditional
+    # saves only apply to the version the editor started from.
+    (
+        "ALTER TABLE registrations ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+    ),
+]
+
+# Registration fields indexed in registration_users, with the role they map to.
+USER_ROLES = {"adminUsers": "admin", "readUsers": "read"}
+
+# Registration fields indexed in registration_buckets.
+BUCKET_FIELDS = ("dataBucket", "artifactBucket")
+
+SELECT_REGISTRATION_SQL = "SELECT data FROM registrations WHERE installation_id = ?"
+
+SELECT_VERSIONED_REGISTRATION_SQL = (
+    "SELECT data, version FROM registrations WHERE installation_id = ?"
+)
+
+SELECT_VERSION_SQL = "SELECT version FROM registrations WHERE installation_id = ?"
+
+UPSERT_REGISTRATION_SQL = """
+    INSERT INTO registrations (installation_id, data, tenant, created_at, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT(installation_id)
+    DO UPDATE SET
+        data = excluded.data,
+        tenant = excluded.tenant,
+        updated_at = CURRENT_TIMESTAMP,
+        version = version + 1
+    RETURNING version
+"""
+
+UPDATE_REGISTRATION_IF_VERSION_SQL = """
+    UPDATE registrations
+    SET data = ?, tenant = ?, updated_at = CURRENT_TIMESTAMP, version = version + 1
+    WHERE installation_id = ? AND version = ?
+    RETURNING version
+"""
+
+DELETE_USERS_SQL = "DELETE FROM registration_users WHERE installation_id = ?"
+
+INSERT_USER_SQL = (
+    "INSERT OR IGNORE INTO registration_users (installation_id, role, email) VALUES (?, ?, ?)"
+)
+
+DELETE_BUCKETS_SQL = "DELETE FROM registration_buckets WHERE installation_id = ?"
+
+INSERT_BUCKET_SQL = (
+    "INSERT INTO registration_buckets (installation_id, field, bucket, hostname) "
+    "VALUES (?, ?, ?, ?)"
+)
+
+SELECT_USER_INSTALLATIONS_SQL = (
+    "SELECT DISTINCT installation_id FROM registration_users WHERE email = ? "
+    "ORDER BY installation_id"
+)
+
+SELECT_USER_ROLE_INSTALLATIONS_SQL = (
+    "SELECT installation_id FROM registration_users WHERE email = ? AND role = ? "
+    "ORDER BY installation_id"
+)
+
+SELECT_BUCKET_INSTALLATIONS_SQL = (
+    "SELECT DISTINCT installation_id FROM registration_buckets WHERE bucket = ? "
+    "ORDER BY installation_id"
+)
+
+SELECT_TENANT_INSTALLATIONS_SQL = (
+    "SELECT installation_id FROM registrations WHERE tenant = ? ORDER BY installation_id"
+)
+
+LIST_REGISTRATIONS_SQL = (
+    "SELECT installation_id, data, created_at, updated_at, version FROM registrations"
+)
+
+INSERT_CHANGE_SQL = "INSERT INTO registration_changes (installation_id, op) VALUES (?, ?)"
+
+SELECT_CHANGES_SQL = """
+    SELECT c.seq, c.installation_id, c.op, c.changed_at, r.data
+    FROM registration_changes c
+    LEFT JOIN registrations r ON r.installation_id = c.installation_id
+    WHERE c.seq > ?
+    ORDER BY c.seq
+    LIMIT ?
+"""
+
+# How often change-feed waiters re-check the log for commits made by other
+# processes; commits in the same process wake them immediately.
+CHANGE_POLL_INTERVAL = float(os.environ.get("CHANGE_POLL_INTERVAL", "0.5"))
+
+# Longest wait a long-poll may ask for, and how long one event stream stays
+# open before the client is expected to reconnect with Last-Event-ID.
+CHANGE_MAX_WAIT_SECONDS = 30
+CHANGE_STREAM_MAX_SECONDS = int(os.environ.get("CHANGE_STREAM_MAX_SECONDS", "300"))
+CHANGE_STREAM_HEARTBEAT_SECONDS = 15
+
+# Waiting long-polls and open streams each hold a server thread, so each
+# process admits at most this many at once and answers 503 beyond that. Keep it
+# below GUNICORN_THREADS so the form and the rest of the API stay served.
+CHANGE_MAX_SUBSCRIBERS = int(os.environ.get("CHANGE_MAX_SUBSCRIBERS", "2"))
+
+# Bearer token for the JSON API (/api/...); the API is disabled while unset.
+API_TOKEN = os.environ.get("API_TOKEN", "")
+
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+
+# Bucket fields never returned by the JSON API.
+SECRET_BUCKET_FIELDS = ("secretKey",)
+
+EXPORT_REGISTRATIONS_SQL = "SELECT data FROM registrations ORDER BY installation_id"
+
+# Records committed per transaction by bulk imports, and how many rejected
+# records an import reports individually.
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_ERRORS = 100
+
+
+def open_connection(
+    path, busy_timeout_ms=DB_BUSY_TIMEOUT_MS, cached_statements=DB_CACHED_STATEMENTS
+):
+    """
+    Open a tuned SQLite connection.
+
+    The connection is in autocommit mode; writes go through
+    ConnectionManager.transaction(), which takes the write lock up front.
+
+    Args:
+        path: Database file path
+        busy_timeout_ms: How long to wait for a lock before raising
+        cached_statements: Size of the per-connection prepared statement cache
+
+    Returns:
+        sqlite3.Connection: The open connection
+    """
+    conn = sqlite3.connect(
+        path,
+        timeout=busy_timeout_ms / 1000.0,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=cached_statements,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    return conn
+
+
+class _ThreadConnections:
+    """A thread's open connections keyed by database path."""
+
+    __slots__ = ("by_path", "__weakref__")
+
+    def __init__(self):
+        self.by_path = {}
+
+
+class ConnectionManager:
+    """
+    Per-thread SQLite connections.
+
+    Each thread keeps one open connection per database path for its whole
+    life, so the PRAGMAs run once and the statement cache of the connection
+    turns repeated queries into prepared-statement reuse. Connections are
+    never shared between threads; a thread's connections are closed when the
+    thread exits.
+    """
+
+    def __init__(self, busy_timeout_ms=DB_BUSY_TIMEOUT_MS, cached_statements=DB_CACHED_STATEMENTS):
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = weakref.WeakSet()
+
+    def connect(self, path=None):
+        """
+        Return the calling thread's connection to path (default: DB_PATH).
+
+        Args:
+            path: Database file path
+
+        Returns:
+            sqlite3.Connection: The thread's open connection
+        """
+        path = path or DB_PATH
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = _ThreadConnections()
+            with self._lock:
+                self._threads.add(connections)
+        conn = connections.by_path.get(path)
+        if conn is None:
+            conn = open_connection(path, self.busy_timeout_ms, self.cached_statements)
+            connections.by_path[path] = conn
+        return conn
+
+    @contextmanager
+    def transaction(self, path=None):
+        """
+        Run a block in a write transaction on the calling thread's connection.
+
+        BEGIN IMMEDIATE takes the write lock before the first statement, so a
+        concurrent writer waits on the busy timeout instead of failing on a
+        lock upgrade. Commits on success and rolls back on any exception.
+
+        Args:
+            path: Database file path (default: DB_PATH)
+
+        Yields:
+            sqlite3.Connection: The connection to run statements on
+        """
+        conn = self.connect(path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def close(self, path=None):
+        """
+        Close open connections to path, or all connections, in every thread.
+
+        Only for start-up and shutdown: a thread still using a closed
+        connection fails, though its next connect() opens a fresh one.
+
+        Args:
+            path: Database file path, or None for every path
+        """
+        with self._lock:
+            threads = list(self._threads)
+        for connections in threads:
+            for key in list(connections.by_path):
+                if path is None or key == path:
+                    conn = connections.by_path.pop(key, None)
+                    if conn is not None:
+                        conn.close()
+
+
+db = ConnectionManager()
+
+
 def init_db():
     """
     Initialize the SQLite database.
-    
-    Creates the registrations table if it doesn't exist.
+
+    Switches the database to WAL mode and applies any SCHEMA_MIGRATIONS it
+    has not seen yet. The check and the migrations run in one write
+    transaction, so processes starting together (gunicorn workers without
+    preload, several replicas on one volume) serialize on the write lock and
+    each migration runs exactly once.
+
+    The connection is closed again afterwards: under gunicorn this runs in
+    the master before it forks, and a SQLite connection must not be carried
+    across a fork.
     Table schema:
         - installation_id: TEXT PRIMARY KEY
         - data: TEXT (JSON serialized RepoRegistration)
@@ -52,81 +422,727 @@ def init_db():
     # Ensure directory exists
     db_dir = Path(DB_PATH).parent
     db_dir.mkdir(parents=True, exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS registrations (
-            installation_id TEXT PRIMARY KEY,
-            data TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
-    logger.info(f"Database initialized at {DB_PATH}")
+
+    db.close()
+    with db.transaction() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for statements in SCHEMA_MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+        if version < len(SCHEMA_MIGRATIONS):
+            conn.execute(f"PRAGMA user_version = {len(SCHEMA_MIGRATIONS)}")
+    db.close()
+    logger.info(f"Database initialized at {DB_PATH} (schema version {len(SCHEMA_MIGRATIONS)})")
 
 
 def get_registration(installation_id):
     """
     Get a registration from the database.
-    
+
     Args:
         installation_id: The GitHub installation ID
-        
+
     Returns:
         dict: The registration data or None if not found
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT data FROM registrations WHERE installation_id = ?",
-        (installation_id,)
-    )
-    
-    row = cursor.fetchone()
-    conn.close()
-    
+    row = db.connect().execute(SELECT_REGISTRATION_SQL, (installation_id,)).fetchone()
     if row:
         return json.loads(row[0])
     return None
 
 
-def save_registration(installation_id, registration_data):
+def get_versioned_registration(installation_id):
+    """
+    Get a registration together with its version.
+
+    Args:
+        installation_id: The GitHub installation ID
+
+    Returns:
+        tuple: (registration data, version), or (None, None) if not found
+    """
+    row = db.connect().execute(SELECT_VERSIONED_REGISTRATION_SQL, (installation_id,)).fetchone()
+    if row:
+        return json.loads(row[0]), row[1]
+    return None, None
+
+
+# expected_version for If-Match: * -- the registration must exist, at any version.
+ANY_VERSION = "*"
+
+
+class VersionConflict(Exception):
+    """A conditional save found the registration at a different version."""
+
+    def __init__(self, installation_id, current_version):
+        super().__init__(
+            f"Registration {installation_id} was changed by someone else"
+            if current_version is not None
+            else f"Registration {installation_id} no longer exists"
+        )
+        self.installation_id = installation_id
+        self.current_version = current_version
+
+
+def upsert_registration(conn, installation_id, registration_data, expected_version=None):
+    """
+    Write a registration and its lookup rows inside the caller's transaction.
+
+    Replaces the installation's rows in registration_users and
+    registration_buckets, so the side tables always match the stored JSON,
+    and appends the save to registration_changes.
+
+    Args:
+        conn: Connection with an open write transaction
+        installation_id: The GitHub installation ID
+        registration_data: The RepoRegistration configuration dict
+        expected_version: If given, only update the registration while it is
+            at this version, or with ANY_VERSION while it exists at all
+
+    Returns:
+        int: The registration's new version
+
+    Raises:
+        VersionConflict: If expected_version is given and does not match
+    """
+    data = json.dumps(registration_data)
+    tenant = registration_data.get("tenant")
+    if expected_version == ANY_VERSION:
+        if conn.execute(SELECT_VERSION_SQL, (installation_id,)).fetchone() is None:
+            raise VersionConflict(installation_id, None)
+        expected_version = None
+    if expected_version is None:
+        (version,) = conn.execute(
+            UPSERT_REGISTRATION_SQL, (installation_id, data, tenant)
+        ).fetchone()
+    else:
+        row = conn.execute(
+            UPDATE_REGISTRATION_IF_VERSION_SQL, (data, tenant, installation_id, expected_version)
+        ).fetchone()
+        if row is None:
+            current = conn.execute(SELECT_VERSION_SQL, (installation_id,)).fetchone()
+            raise VersionConflict(installation_id, current[0] if current else None)
+        (version,) = row
+    conn.execute(DELETE_USERS_SQL, (installation_id,))
+    conn.executemany(
+        INSERT_USER_SQL,
+        [
+            (installation_id, role, email)
+            for field, role in USER_ROLES.items()
+            for email in registration_data.get(field) or ()
+        ],
+    )
+    conn.execute(DELETE_BUCKETS_SQL, (installation_id,))
+    conn.executemany(
+        INSERT_BUCKET_SQL,
+        [
+            (installation_id, field, bucket["bucket"], bucket.get("hostname"))
+            for field, bucket in ((f, registration_data.get(f)) for f in BUCKET_FIELDS)
+            if bucket and bucket.get("bucket")
+        ],
+    )
+    conn.execute(INSERT_CHANGE_SQL, (installation_id, "upsert"))
+    return version
+
+
+class _PendingWrite:
+    """A save waiting for the group-commit writer."""
+
+    __slots__ = (
+        "installation_id", "registration_data", "expected_version", "done", "error", "version",
+    )
+
+    def __init__(self, installation_id, registration_data, expected_version):
+        self.installation_id = installation_id
+        self.registration_data = registration_data
+        self.expected_version = expected_version
+        self.done = threading.Event()
+        self.error = None
+        self.version = None
+
+
+class GroupCommitWriter:
+    """
+    Commits concurrent saves together in one transaction.
+
+    Callers hand their write to a single writer thread per process and
+    block until it is committed. The writer takes the first queued write,
+    gathers whatever else arrives within the window (up to max_batch
+    writes) and commits them in one transaction on a connection with
+    synchronous=FULL: one WAL sync covers the whole batch, and no caller is
+    acknowledged before its write is on disk. Each write runs in its own
+    savepoint, so a failing write, such as a version conflict, is reported
+    to its caller alone.
+    """
+
+    def __init__(self, max_batch=GROUP_COMMIT_MAX_BATCH, window_ms=GROUP_COMMIT_WINDOW_MS):
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.batches = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def submit(self, installation_id, registration_data, expected_version=None):
+        """
+        Queue a registration write and wait until it is durably committed.
+
+        Args:
+            installation_id: The GitHub installation ID
+            registration_data: The RepoRegistration configuration dict
+            expected_version: As for upsert_registration()
+
+        Returns:
+            int: The registration's new version
+
+        Raises:
+            Exception: Whatever the write or its batch's commit raised
+        """
+        pending = _PendingWrite(installation_id, registration_data, expected_version)
+        self._process_queue().put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.version
+
+    def _process_queue(self):
+        # The writer thread starts on first use, and again in a forked child,
+        # which inherits the queue but not the thread.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._run, args=(self._queue,), name="group-commit", daemon=True
+                ).start()
+            return self._queue
+
+    def _run(self, pending_writes):
+        while True:
+            batch = [pending_writes.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(pending_writes.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            db.connect().execute("PRAGMA synchronous=FULL")
+            with db.transaction() as conn:
+                for pending in batch:
+                    conn.execute("SAVEPOINT pending_write")
+                    try:
+                        pending.version = upsert_registration(
+                            conn,
+                            pending.installation_id,
+                            pending.registration_data,
+                            pending.expected_version,
+                        )
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO pending_write")
+                        pending.error = e
+                    conn.execute("RELEASE pending_write")
+        except Exception as e:
+            # Nothing in the batch was committed.
+            for pending in batch:
+                pending.error = pending.error or e
+        else:
+            self.batches += 1
+            self.writes += len(batch)
+            notify_changes()
+        for pending in batch:
+            pending.done.set()
+
+
+group_writer = GroupCommitWriter()
+
+
+def save_registration(installation_id, registration_data, expected_version=None):
     """
     Save or update a registration in the database.
-    
+
+    With GROUP_COMMIT (the default) the write is committed by group_writer
+    together with concurrent saves, and this returns once it is on disk.
+
+    With expected_version the save is conditional: it only applies while
+    the registration is still at that version, or with ANY_VERSION while it
+    exists at any version. A stale version is caught by
+    a read before the write is queued, so most conflicts fail without
+    waiting for the write lock; the check is repeated inside the write
+    transaction for saves that race past it.
+
     Args:
         installation_id: The GitHub installation ID
         registration_data: The RepoRegistration configuration dict
+        expected_version: Version the caller's edit is based on (optional)
+
+    Returns:
+        int: The registration's new version
+
+    Raises:
+        VersionConflict: If the registration is not at expected_version
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    data_json = json.dumps(registration_data)
-    
-    cursor.execute("""
-        INSERT INTO registrations (installation_id, data, created_at, updated_at)
-        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        ON CONFLICT(installation_id) 
-        DO UPDATE SET 
-            data = excluded.data,
-            updated_at = CURRENT_TIMESTAMP
-    """, (installation_id, data_json))
-    
-    conn.commit()
-    conn.close()
-    logger.info(f"Registration saved for installation_id={installation_id}")
+    if expected_version is not None:
+        _, current_version = get_versioned_registration(installation_id)
+        if current_version is None or expected_version not in (ANY_VERSION, current_version):
+            raise VersionConflict(installation_id, current_version)
+    if GROUP_COMMIT:
+        version = group_writer.submit(installation_id, registration_data, expected_version)
+    else:
+        with db.transaction() as conn:
+            version = upsert_registration(conn, installation_id, registration_data,
+                                          expected_version)
+        notify_changes()
+    logger.info(f"Registration saved for installation_id={installation_id} (version {version})")
+    return version
+
+
+def installations_for_user(email, role=None):
+    """
+    List the installations a user is registered on.
+
+    Args:
+        email: User email address (matched case-insensitively)
+        role: "admin" or "read" to match only that role, None for either
+
+    Returns:
+        list: Installation IDs in ascending order
+    """
+    if role is None:
+        rows = db.connect().execute(SELECT_USER_INSTALLATIONS_SQL, (email,))
+    else:
+        rows = db.connect().execute(SELECT_USER_ROLE_INSTALLATIONS_SQL, (email, role))
+    return [row[0] for row in rows]
+
+
+def installations_for_bucket(bucket):
+    """
+    List the installations that use a bucket as data or artifact bucket.
+
+    Args:
+        bucket: Bucket name
+
+    Returns:
+        list: Installation IDs in ascending order
+    """
+    rows = db.connect().execute(SELECT_BUCKET_INSTALLATIONS_SQL, (bucket,))
+    return [row[0] for row in rows]
+
+
+def installations_for_tenant(tenant):
+    """
+    List the installations registered for a tenant.
+
+    Args:
+        tenant: Tenant identifier (the RepoRegistration spec.tenant)
+
+    Returns:
+        list: Installation IDs in ascending order
+    """
+    rows = db.connect().execute(SELECT_TENANT_INSTALLATIONS_SQL, (tenant,))
+    return [row[0] for row in rows]
+
+
+def list_registrations(after=None, limit=LIST_DEFAULT_LIMIT, user=None, role=None, tenant=None,
+                       updated_since=None):
+    """
+    Page through registrations in (updated_at, installation_id) order.
+
+    Keyset pagination: a page starts right after the key of the previous
+    page's last row, so every page is an index range scan whatever its depth.
+
+    Args:
+        after: (updated_at, installation_id) of the last row already seen
+        limit: Maximum rows to return
+        user: Only registrations listing this email (case-insensitive)
+        role: With user, only where the user has this role ("admin" or "read")
+        tenant: Only registrations for this tenant
+        updated_since: Only rows with updated_at >= this SQLite timestamp
+
+    Returns:
+        sqlite3.Cursor: Rows of (installation_id, data, created_at, updated_at, version)
+    """
+    clauses, params = [], []
+    if user is not None:
+        if role is None:
+            clauses.append(
+                "installation_id IN "
+                "(SELECT installation_id FROM registration_users WHERE email = ?)"
+            )
+            params.append(user)
+        else:
+            clauses.append(
+                "installation_id IN "
+                "(SELECT installation_id FROM registration_users WHERE email = ? AND role = ?)"
+            )
+            params.extend((user, role))
+    if tenant is not None:
+        clauses.append("tenant = ?")
+        params.append(tenant)
+    if updated_since is not None:
+        clauses.append("updated_at >= ?")
+        params.append(updated_since)
+    if after is not None:
+        clauses.append("(updated_at, installation_id) > (?, ?)")
+        params.extend(after)
+    sql = LIST_REGISTRATIONS_SQL
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY updated_at, installation_id LIMIT ?"
+    params.append(limit)
+    return db.connect().execute(sql, params)
+
+
+_changes_committed = threading.Condition()
+_change_subscribers = threading.BoundedSemaphore(max(CHANGE_MAX_SUBSCRIBERS, 0))
+
+
+def notify_changes():
+    """Wake this process's change-feed waiters after a committed write."""
+    with _changes_committed:
+        _changes_committed.notify_all()
+
+
+def read_changes(since, limit):
+    """
+    Read the change log after a sequence number.
+
+    Args:
+        since: Last sequence number already processed (0 for everything)
+        limit: Maximum changes to return
+
+    Returns:
+        list: (seq, installation_id, op, changed_at, data) tuples in seq
+        order, with data the registration's current JSON (None if gone)
+    """
+    return db.connect().execute(SELECT_CHANGES_SQL, (since, limit)).fetchall()
+
+
+def wait_for_changes(since, limit, timeout):
+    """
+    Like read_changes(), but wait up to timeout seconds for a first change.
+
+    Saves in this process wake the waiter at once; commits from other
+    processes are picked up within CHANGE_POLL_INTERVAL.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        changes = read_changes(since, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        with _changes_committed:
+            _changes_committed.wait(min(CHANGE_POLL_INTERVAL, remaining))
+
+
+def subscribers_full():
+    """503 response for a change-feed subscriber over CHANGE_MAX_SUBSCRIBERS."""
+    error = f"too many change-feed subscribers (at most {CHANGE_MAX_SUBSCRIBERS}); retry later"
+    return jsonify({"success": False, "error": error}), 503, {"Retry-After": "5"}
+
+
+def change_item(seq, installation_id, op, changed_at, data):
+    """A change-log row as returned by the JSON API."""
+    return {
+        "seq": seq,
+        "installation_id": installation_id,
+        "op": op,
+        "changed_at": format_timestamp(changed_at),
+        "registration": public_registration(json.loads(data)) if data else None,
+    }
+
+
+def encode_cursor(updated_at, installation_id):
+    """Opaque listing cursor for the row (updated_at, installation_id)."""
+    raw = json.dumps([updated_at, installation_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a listing cursor.
+
+    Returns:
+        tuple: (updated_at, installation_id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor") from None
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(k, str) for k in key)):
+        raise ValueError("Invalid cursor")
+    return key[0], key[1]
+
+
+def parse_timestamp(value):
+    """
+    Convert an ISO 8601 timestamp to SQLite's UTC CURRENT_TIMESTAMP format.
+
+    Naive timestamps are taken as UTC.
+
+    Raises:
+        ValueError: If value is not an ISO 8601 timestamp
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}'") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def format_timestamp(value):
+    """SQLite UTC timestamp as ISO 8601 with a Z suffix."""
+    return value.replace(" ", "T") + "Z" if value else value
+
+
+def version_etag(version):
+    """ETag header value for a registration version."""
+    return f'"{version}"'
+
+
+class WeakETagPrecondition(Exception):
+    """If-Match carried a weak ETag, which never matches a registration version."""
+
+
+def parse_version_etag(value):
+    """
+    Registration version from an If-Match header or the form's version field.
+
+    Accepts a single ETag as sent by version_etag() ("3"), the bare version
+    number (3), or * for ANY_VERSION. A weak tag such as W/"3" is well
+    formed but can never match, because If-Match uses the strong comparison
+    (RFC 9110, section 13.1.1).
+
+    Raises:
+        WeakETagPrecondition: If value is a weak tag
+        ValueError: If value is not one of the above
+    """
+    tag = value.strip()
+    if tag == ANY_VERSION:
+        return ANY_VERSION
+    opaque = tag[2:]
+    if (tag.startswith("W/") and len(opaque) >= 2
+            and opaque[0] == opaque[-1] == '"' and '"' not in opaque[1:-1]):
+        raise WeakETagPrecondition(
+            f"If-Match {tag[:50]} is a weak ETag and never matches; send the ETag as returned"
+        )
+    if len(tag) >= 2 and tag[0] == tag[-1] == '"':
+        tag = tag[1:-1]
+    if not is_decimal(tag):
+        raise ValueError(f"Invalid version '{value[:50]}': expected a single ETag such as \"3\"")
+    return int(tag)
+
+
+def expected_version_from_request():
+    """
+    Version a write request is conditional on, or None for an unconditional write.
+
+    Taken from the If-Match header, or else from the registration form's
+    hidden version field.
+
+    Raises:
+        WeakETagPrecondition: If the supplied version is a weak ETag
+        ValueError: If the supplied version is malformed
+    """
+    value = request.headers.get("If-Match") or request.form.get("version")
+    return parse_version_etag(value) if value else None
+
+
+def conflict_response(conflict):
+    """409 JSON response for a VersionConflict."""
+    body = {
+        "success": False,
+        "error": f"{conflict}. Reload it and reapply your changes.",
+        "current_version": conflict.current_version,
+    }
+    headers = {}
+    if conflict.current_version is not None:
+        headers["ETag"] = version_etag(conflict.current_version)
+    return jsonify(body), 409, headers
+
+
+def precondition_failed_response(error):
+    """412 JSON response for a WeakETagPrecondition."""
+    return jsonify({"success": False, "error": str(error)}), 412
+
+
+def public_registration(registration_data):
+    """Copy of a registration without bucket secrets, for the JSON API."""
+    public = dict(registration_data)
+    for field in BUCKET_FIELDS:
+        if public.get(field):
+            public[field] = {
+                key: value for key, value in public[field].items()
+                if key not in SECRET_BUCKET_FIELDS
+            }
+    return public
+
+
+def api_token_required(view):
+    """Require "Authorization: Bearer <API_TOKEN>" on a JSON API view."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not API_TOKEN:
+            return jsonify({"success": False, "error": "API disabled: API_TOKEN is not set"}), 403
+        supplied = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(supplied, f"Bearer {API_TOKEN}".encode()):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
 
 
 # Initialize database on startup
 init_db()
 
 
+# Templates rendered by the routes; compiled by preload_templates().
+TEMPLATES = ("registration_form.html", "success.html", "error.html")
+
+
+def preload_templates():
+    """
+    Compile the page templates into the Jinja environment's cache.
+
+    Runs at import, so under gunicorn's preload_app the master compiles them
+    once and every forked worker starts with them cached.
+    """
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+
+
+preload_templates()
+
+
+def split_emails(raw):
+    """Comma-separated form field as a list of stripped, non-empty entries."""
+    return [email.strip() for email in raw.split(",") if email.strip()]
+
+
+def bucket_from_form(form, prefix):
+    """
+    Bucket configuration from the form's <prefix>_* fields.
+
+    Returns:
+        dict: The bucket configuration, or None when no bucket name is given
+    """
+    bucket_name = form.get(f"{prefix}_bucket", "").strip()
+    if not bucket_name:
+        return None
+
+    is_aws = form.get(f"{prefix}_is_aws") == "on"
+    config = {
+        "bucket": bucket_name,
+        "accessKey": form.get(f"{prefix}_accessKey", "").strip(),
+        "secretKey": form.get(f"{prefix}_secretKey", "").strip(),
+        "is_aws": is_aws,
+    }
+    if not is_aws:
+        config["hostname"] = form.get(f"{prefix}_hostname", "").strip()
+        config["region"] = form.get(f"{prefix}_region", "").strip()
+        config["pathStyle"] = form.get(f"{prefix}_pathStyle") == "on"
+    return config
+
+
+def registration_from_form(form):
+    """
+    Registration configuration from the submitted registration form.
+
+    repoUrl and tenant are only included when filled in, so leaving them
+    blank keeps the values already stored for the installation.
+
+    Args:
+        form: The request's form fields
+
+    Returns:
+        dict: The registration, to be checked with validate_registration()
+    """
+    registration = {
+        "installation_id": form.get("installation_id", "").strip(),
+        "defaultBranch": form.get("defaultBranch", "main").strip(),
+        "dataBucket": bucket_from_form(form, "dataBucket"),
+        "artifactBucket": bucket_from_form(form, "artifactBucket"),
+        "adminUsers": split_emails(form.get("adminUsers", "")),
+        "readUsers": split_emails(form.get("readUsers", "")),
+    }
+    for field in ("repoUrl", "tenant"):
+        value = form.get(field, "").strip()
+        if value:
+            registration[field] = value
+    return registration
+
+
+def require_admin_user(registration):
+    """Registration rule: at least one admin user."""
+    if not registration.get("adminUsers"):
+        return "At least one admin user email is required"
+
+
+def bucket_rule(field):
+    """
+    Registration rule for the credentials and endpoint of a bucket field.
+
+    The CRD leaves credentials to Vault, but the form collects them, so a
+    configured bucket needs its keys, and a non-AWS one its endpoint.
+    """
+    label = field.replace("_", " ").title()
+
+    def check(registration):
+        bucket = registration.get(field)
+        if not bucket:
+            return None
+        if not bucket.get("bucket"):
+            return f"{label} requires a bucket name"
+
+        # If bucket is set, accessKey and secretKey must exist
+        if not bucket.get("accessKey") or not bucket.get("secretKey"):
+            return f"{label} requires both access key and secret key"
+
+        # If not AWS, hostname, region, and pathStyle should be complete
+        if not bucket.get("is_aws"):
+            hostname = bucket.get("hostname")
+            if not hostname or not bucket.get("region"):
+                return f"{label} (non-AWS) requires hostname and region"
+            if not hostname.startswith("https://"):
+                return f"{label} hostname must start with https://"
+    return check
+
+
+# Registration checks: the RepoRegistration CRD's spec schema, compiled once
+# at startup, followed by the form's own rules. The form's repoUrl is
+# optional, and the form names the installation ID installation_id.
+REGISTRATION_VALIDATOR = compile_schema(
+    load_crd_schema(CRD_PATH),
+    field_names={"installationId": "installation_id"},
+    required=("installationId",),
+    integer_strings=True,
+    extra_rules=[require_admin_user] + [bucket_rule(field) for field in BUCKET_FIELDS],
+)
+
+
+def validate_registration(registration):
+    """
+    Check a registration against REGISTRATION_VALIDATOR.
+
+    Used for form submissions, bulk imports and API writes alike.
+
+    Args:
+        registration: The registration configuration dict
+
+    Raises:
+        ValueError: Describing the first rule the registration breaks
+    """
+    REGISTRATION_VALIDATOR.validate(registration)
+
+
 @app.route("/healthz", methods=["GET"])
 def healthz():
     """
@@ -207,7 +1223,7 @@ def registrations_form():
     )
 
     # Check if registration exists
-    existing_registration = get_registration(installation_id)
+    existing_registration, version = get_versioned_registration(installation_id)
     
     # Handle install action
     if setup_action == "install":
@@ -249,16 +1265,22 @@ def registrations_form():
                 404,
             )
 
-    # Load existing data for update mode
-    initial_data = existing_registration if setup_action == "update" else None
+    # Load existing data for update mode; the version it is at comes back
+    # with the submission so that edits made meanwhile are not overwritten.
+    if setup_action == "update":
+        initial_data = existing_registration
+        headers = {"ETag": version_etag(version)}
+    else:
+        initial_data, version, headers = None, None, {}
 
     return render_template(
         "registration_form.html",
         installation_id=installation_id,
         setup_action=setup_action,
         initial_data=initial_data,
+        version=version,
         github_app_name=GITHUB_APP_NAME,
-    )
+    ), 200, headers
 
 
 @app.route("/registrations", methods=["POST"])
@@ -267,124 +1289,54 @@ def registrations_submit():
     Handle repository registration form submission.
 
     Validates the submitted form data and saves the repository registration
-    configuration.
+    configuration. An update replaces only the fields the form collects;
+    others set through the API or an import are kept, and so are repoUrl
+    and tenant when left blank.
 
     Form Fields:
         installation_id: GitHub installation ID (required)
+        repoUrl: Git repository URL ending in .git (optional)
+        tenant: Tenant identifier (optional)
         defaultBranch: Default branch name (default: main)
         dataBucket_*: Data bucket configuration fields (optional)
         artifactBucket_*: Artifact bucket configuration fields (optional)
         adminUsers: Comma-separated list of admin email addresses (required)
         readUsers: Comma-separated list of read-only email addresses (optional)
+        version: Version the update form was rendered from (optional); the
+            If-Match header may carry it instead, or * to only update an
+            existing registration
 
     Returns:
-        JSON response with success/error status or redirect to success page
+        JSON response with success/error status or redirect to success page;
+        409 if the registration changed since the given version, 412 for a
+        weak If-Match tag
     """
     try:
-        # Extract form data
-        installation_id = request.form.get("installation_id", "").strip()
-        default_branch = request.form.get("defaultBranch", "main").strip()
-        admin_users_raw = request.form.get("adminUsers", "").strip()
-        read_users_raw = request.form.get("readUsers", "").strip()
-
-        # Validate required fields
-        if not installation_id:
-            return jsonify({"success": False, "error": "installation_id is required"}), 400
-
-        if not admin_users_raw:
-            return (
-                jsonify({"success": False, "error": "At least one admin user email is required"}),
-                400,
-            )
-
-        # Parse email lists
-        admin_users = [email.strip() for email in admin_users_raw.split(",") if email.strip()]
-        read_users = (
-            [email.strip() for email in read_users_raw.split(",") if email.strip()]
-            if read_users_raw
-            else []
-        )
-
-        # Validate admin users
-        if not admin_users:
-            return (
-                jsonify({"success": False, "error": "At least one admin user email is required"}),
-                400,
-            )
-
-        # Basic email validation
-        email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-        for email in admin_users + read_users:
-            if not re.match(email_pattern, email):
-                return jsonify({"success": False, "error": f"Invalid email address: {email}"}), 400
-
-        # Parse bucket configurations
-        def parse_bucket_config(prefix):
-            """Parse S3 bucket configuration from form data."""
-            bucket_name = request.form.get(f"{prefix}_bucket", "").strip()
-            if not bucket_name:
-                return None
-
-            access_key = request.form.get(f"{prefix}_accessKey", "").strip()
-            secret_key = request.form.get(f"{prefix}_secretKey", "").strip()
-
-            # If bucket is set, accessKey and secretKey must exist
-            if not access_key or not secret_key:
-                raise ValueError(
-                    f"{prefix.replace('_', ' ').title()} requires both access key and secret key"
-                )
-
-            is_aws = request.form.get(f"{prefix}_is_aws") == "on"
-
-            config = {
-                "bucket": bucket_name,
-                "accessKey": access_key,
-                "secretKey": secret_key,
-                "is_aws": is_aws,
-            }
-
-            # If not AWS, hostname, region, and pathStyle should be complete
-            if not is_aws:
-                hostname = request.form.get(f"{prefix}_hostname", "").strip()
-                region = request.form.get(f"{prefix}_region", "").strip()
-                path_style = request.form.get(f"{prefix}_pathStyle") == "on"
-
-                if not hostname or not region:
-                    raise ValueError(
-                        f"{prefix.replace('_', ' ').title()} (non-AWS) requires hostname and region"
-                    )
-
-                if not hostname.startswith("https://"):
-                    raise ValueError(
-                        f"{prefix.replace('_', ' ').title()} hostname must start with https://"
-                    )
-
-                config["hostname"] = hostname
-                config["region"] = region
-                config["pathStyle"] = path_style
-
-            return config
-
+        form_config = registration_from_form(request.form)
+        installation_id = form_config["installation_id"]
+        existing, current_version = get_versioned_registration(installation_id)
+        registration_config = {**(existing or {}), **form_config}
         try:
-            data_bucket = parse_bucket_config("dataBucket")
-            artifact_bucket = parse_bucket_config("artifactBucket")
+            validate_registration(registration_config)
+            expected_version = expected_version_from_request()
+        except WeakETagPrecondition as e:
+            return precondition_failed_response(e)
         except ValueError as e:
             return jsonify({"success": False, "error": str(e)}), 400
-
-        # Create registration configuration
-        registration_config = {
-            "installation_id": installation_id,
-            "defaultBranch": default_branch,
-            "dataBucket": data_bucket,
-            "artifactBucket": artifact_bucket,
-            "adminUsers": admin_users,
-            "readUsers": read_users,
-        }
+        if expected_version is None or (expected_version == ANY_VERSION
+                                        and current_version is not None):
+            # The merge is based on current_version; don't save it over a newer one.
+            expected_version = current_version
 
         logger.info(f"Repository registration submitted: installation_id={installation_id}")
 
         # Save configuration to database
-        save_registration(installation_id, registration_config)
+        try:
+            version = save_registration(installation_id, registration_config, expected_version)
+        except VersionConflict as conflict:
+            logger.info(f"Registration update conflict: installation_id={installation_id}")
+            return conflict_response(conflict)
+        headers = {"ETag": version_etag(version)}
 
         # Return success response
         if request.headers.get("Accept") == "application/json":
@@ -394,27 +1346,384 @@ def registrations_submit():
                         "success": True,
                         "message": "Repository registration completed successfully",
                         "config": registration_config,
+                        "version": version,
                     }
                 ),
                 200,
+                headers,
             )
         else:
             # Redirect to success page
             return render_template(
                 "success.html", github_app_name=GITHUB_APP_NAME, config=registration_config
-            )
+            ), 200, headers
 
     except Exception as e:
         logger.exception("Error processing registration submission")
         return jsonify({"success": False, "error": f"Internal server error: {str(e)}"}), 500
 
 
+@app.route("/api/registrations", methods=["GET"])
+@api_token_required
+def registrations_list():
+    """
+    List registrations as JSON, ordered by (updated_at, installation_id).
+
+    The body is streamed row by row, so memory use does not depend on the
+    page size. Bucket secret keys are omitted.
+
+    Query Parameters:
+        limit: Page size (default 100, at most 1000)
+        cursor: next_cursor of the previous page
+        user: Only registrations listing this email as a user
+        role: With user, "admin" or "read"
+        tenant: Only registrations for this tenant
+        updated_since: Only registrations updated at or after this ISO 8601 time
+
+    Returns:
+        JSON {"items": [...], "next_cursor": cursor or null}
+    """
+    try:
+        limit = int(request.args.get("limit", LIST_DEFAULT_LIMIT))
+        if not 1 <= limit <= LIST_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {LIST_MAX_LIMIT}")
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+        updated_since = request.args.get("updated_since")
+        if updated_since:
+            updated_since = parse_timestamp(updated_since)
+        role = request.args.get("role")
+        if role not in (None, "admin", "read"):
+            raise ValueError("role must be 'admin' or 'read'")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    # One row more than the page tells whether another page follows.
+    rows = list_registrations(
+        after=after,
+        limit=limit + 1,
+        user=request.args.get("user"),
+        role=role,
+        tenant=request.args.get("tenant"),
+        updated_since=updated_since or None,
+    )
+
+    def generate():
+        try:
+            yield '{"items": ['
+            last = None
+            for count, (installation_id, data, created_at, updated_at, version) in enumerate(rows):
+                if count == limit:
+                    yield '], "next_cursor": ' + json.dumps(encode_cursor(*last)) + "}"
+                    return
+                item = {
+                    "installation_id": installation_id,
+                    "created_at": format_timestamp(created_at),
+                    "updated_at": format_timestamp(updated_at),
+                    "version": version,
+                    "registration": public_registration(json.loads(data)),
+                }
+                yield ("," if count else "") + json.dumps(item)
+                last = (updated_at, installation_id)
+            yield '], "next_cursor": null}'
+        finally:
+            rows.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+@app.route("/api/registrations/<installation_id>", methods=["GET"])
+@api_token_required
+def registration_get(installation_id):
+    """
+    Get one registration as JSON, without bucket secret keys.
+
+    Returns:
+        JSON {"installation_id": id, "version": n, "registration": {...}}
+        with the version as ETag header, or 404
+    """
+    registration, version = get_versioned_registration(installation_id)
+    if registration is None:
+        return jsonify({"success": False, "error": "Registration not found"}), 404
+    body = {
+        "installation_id": installation_id,
+        "version": version,
+        "registration": public_registration(registration),
+    }
+    return jsonify(body), 200, {"ETag": version_etag(version)}
+
+
+@app.route("/api/registrations/<installation_id>", methods=["PUT"])
+@api_token_required
+def registration_put(installation_id):
+    """
+    Create or replace one registration from a JSON body.
+
+    The body is the complete registration, secrets included, and is checked
+    with the registration form's rules. With an If-Match header carrying
+    the ETag from a GET, the registration is only replaced while it is
+    still at that version; a conflict is answered with 409 at once instead
+    of waiting on a lock. If-Match: * only replaces an existing
+    registration, whatever its version.
+
+    Returns:
+        JSON {"success": true, "version": n} with the new ETag, 400 for an
+        invalid body, 409 with the current version on a conflict, or 412
+        for a weak If-Match tag
+    """
+    registration = request.get_json(silent=True)
+    try:
+        if not isinstance(registration, dict):
+            raise ValueError("Body must be a JSON object")
+        registration["installation_id"] = installation_id
+        validate_registration(registration)
+        expected_version = expected_version_from_request()
+    except WeakETagPrecondition as e:
+        return precondition_failed_response(e)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        version = save_registration(installation_id, registration, expected_version)
+    except VersionConflict as conflict:
+        return conflict_response(conflict)
+    return jsonify({"success": True, "version": version}), 200, {"ETag": version_etag(version)}
+
+
+def parse_change_args():
+    """
+    Parse the since and limit query parameters of the change-feed endpoints.
+
+    Raises:
+        ValueError: If a parameter is malformed
+    """
+    since = int(request.args.get("since", 0))
+    limit = int(request.args.get("limit", LIST_DEFAULT_LIMIT))
+    if since < 0:
+        raise ValueError("since must not be negative")
+    if not 1 <= limit <= LIST_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {LIST_MAX_LIMIT}")
+    return since, limit
+
+
+def import_registrations(lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate and save NDJSON registration records in batched transactions.
+
+    Each line holds one registration object, as written by the export.
+    Records are checked with validate_registration(); invalid ones are
+    skipped and reported, valid ones are committed batch_size at a time,
+    so one transaction and one WAL sync cover a whole batch while other
+    writers still get the lock between batches.
+
+    Args:
+        lines: Iterable of NDJSON lines (str or bytes), e.g. a request stream
+        batch_size: Records per transaction
+
+    Returns:
+        dict: {"imported": n, "rejected": n, "errors": [{"line": n, "error": msg}]},
+            listing at most IMPORT_MAX_ERRORS errors
+    """
+    result = {"imported": 0, "rejected": 0, "errors": []}
+    batch = []
+
+    def commit():
+        with db.transaction() as conn:
+            for registration in batch:
+                upsert_registration(conn, registration["installation_id"], registration)
+        notify_changes()
+        result["imported"] += len(batch)
+        batch.clear()
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            registration = json.loads(line)
+            if not isinstance(registration, dict):
+                raise ValueError("Record must be a JSON object")
+            validate_registration(registration)
+        except ValueError as e:
+            result["rejected"] += 1
+            if len(result["errors"]) < IMPORT_MAX_ERRORS:
+                result["errors"].append({"line": number, "error": str(e)})
+            continue
+        registration["installation_id"] = str(registration["installation_id"]).strip()
+        batch.append(registration)
+        if len(batch) >= batch_size:
+            commit()
+    if batch:
+        commit()
+    return result
+
+
+@app.route("/api/registrations/export", methods=["GET"])
+@api_token_required
+def registrations_export():
+    """
+    Export every registration as NDJSON, one registration object per line.
+
+    Rows are streamed from a server-side cursor in installation_id order,
+    so memory use does not depend on the number of registrations.
+
+    Query Parameters:
+        include_secrets: "1" to keep bucket secret keys, which an import
+            into another environment needs (default: omitted)
+
+    Returns:
+        application/x-ndjson stream
+    """
+    include_secrets = request.args.get("include_secrets") == "1"
+    rows = db.connect().execute(EXPORT_REGISTRATIONS_SQL)
+
+    def generate():
+        try:
+            for (data,) in rows:
+                if include_secrets:
+                    yield data + "\n"
+                else:
+                    yield json.dumps(public_registration(json.loads(data))) + "\n"
+        finally:
+            rows.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/registrations/import", methods=["POST"])
+@api_token_required
+def registrations_import():
+    """
+    Import NDJSON registrations, such as an export with include_secrets=1.
+
+    The body is read line by line as it arrives. Every record is validated
+    with the registration form's rules; valid records are created or
+    replaced in batches of IMPORT_BATCH_SIZE per transaction, invalid ones
+    are reported by line number.
+
+    Returns:
+        JSON {"success": bool, "imported": n, "rejected": n, "errors": [...]}
+    """
+    stream = request.stream
+    if isinstance(stream, io.RawIOBase):
+        # Werkzeug's length-limited input is unbuffered; reading lines from
+        # it directly would cost one read call per byte.
+        stream = io.BufferedReader(stream, 1 << 16)
+    result = import_registrations(stream)
+    logger.info(
+        f"Bulk import: {result['imported']} imported, {result['rejected']} rejected"
+    )
+    return jsonify({"success": result["rejected"] == 0, **result})
+
+
+@app.route("/api/changes", methods=["GET"])
+@api_token_required
+def changes_poll():
+    """
+    Long-poll the registration change log.
+
+    Returns at once when changes after `since` exist; otherwise waits up to
+    `wait` seconds for the first one. Consumers pass the returned
+    next_since as `since` on their next call. A poll with a wait counts
+    against CHANGE_MAX_SUBSCRIBERS and gets 503 when the limit is reached.
+
+    Query Parameters:
+        since: Last sequence number already processed (default 0)
+        limit: Maximum changes per response (default 100, at most 1000)
+        wait: Seconds to wait for a change (default 0, at most 30)
+
+    Returns:
+        JSON {"changes": [...], "next_since": seq}
+    """
+    try:
+        since, limit = parse_change_args()
+        wait = float(request.args.get("wait", 0))
+        if not 0 <= wait <= CHANGE_MAX_WAIT_SECONDS:
+            raise ValueError(f"wait must be between 0 and {CHANGE_MAX_WAIT_SECONDS}")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if wait > 0:
+        if not _change_subscribers.acquire(blocking=False):
+            return subscribers_full()
+        try:
+            changes = wait_for_changes(since, limit, wait)
+        finally:
+            _change_subscribers.release()
+    else:
+        changes = read_changes(since, limit)
+    return jsonify({
+        "changes": [change_item(*row) for row in changes],
+        "next_since": changes[-1][0] if changes else since,
+    })
+
+
+@app.route("/api/changes/stream", methods=["GET"])
+@api_token_required
+def changes_stream():
+    """
+    Stream the registration change log as server-sent events.
+
+    Each change is one event whose id is its sequence number, so a client
+    that reconnects with Last-Event-ID resumes where it stopped. Comments
+    are sent as heartbeats while idle, and the stream ends after
+    CHANGE_STREAM_MAX_SECONDS so long-lived connections are rebalanced.
+    Open streams count against CHANGE_MAX_SUBSCRIBERS; a stream over the
+    limit gets 503.
+
+    Query Parameters:
+        since: Last sequence number already processed (default 0);
+            the Last-Event-ID header takes precedence
+        limit: Maximum changes read per batch (default 100, at most 1000)
+
+    Returns:
+        text/event-stream of "upsert" events with change items as data
+    """
+    try:
+        since, limit = parse_change_args()
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id:
+            since = int(last_event_id)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    def generate(since):
+        deadline = time.monotonic() + CHANGE_STREAM_MAX_SECONDS
+        # Flushes the response headers before the first wait.
+        yield ": connected\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changes = wait_for_changes(
+                since, limit, min(CHANGE_STREAM_HEARTBEAT_SECONDS, remaining)
+            )
+            if not changes:
+                yield ": keepalive\n\n"
+                continue
+            for row in changes:
+                item = change_item(*row)
+                yield f"id: {item['seq']}\nevent: {item['op']}\ndata: {json.dumps(item)}\n\n"
+            since = changes[-1][0]
+
+    if not _change_subscribers.acquire(blocking=False):
+        return subscribers_full()
+    response = Response(
+        stream_with_context(generate(since)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the server closes the response, even if the stream never started.
+    response.call_on_close(_change_subscribers.release)
+    return response
+
+
 if __name__ == "__main__":
     """
-    Run the Flask development server.
+    Run the Flask development server (production uses gunicorn.conf.py).
 
     Environment Variables:
         SECRET_KEY: Flask secret key for session management
         GITHUB_APP_NAME: Name of the GitHub App (default: calypr-workflows)
+        FLASK_DEBUG: Set to 1 to enable the debugger and reloader
     """
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    app.run(host="0.0.0.0", port=8080, debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Bulk NDJSON import and export of registrations against a time target.
+
+Generates --records synthetic registrations as NDJSON, POSTs them to
+/api/registrations/import through Flask's test client (so every record is
+validated and committed in batches of --batch-size), then streams them
+back out of /api/registrations/export?include_secrets=1 and checks that
+the export matches the input. The run exits 1 when the import takes longer
+than --target-seconds.
+
+For contrast, --baseline-records records are also saved one transaction
+each with save_registration(), the way form submissions are written, and
+the rate is extrapolated to --records.
+
+Usage:
+    python benchmarks/bulk.py [--records 100000] [--batch-size 5000] [--target-seconds 30]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from common import import_app, synthetic_registration
+
+TOKEN = "bench-token"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000, help="records to import")
+    parser.add_argument("--batch-size", type=int, default=5000, help="records per transaction")
+    parser.add_argument("--target-seconds", type=float, default=30.0,
+                        help="import time the run must beat")
+    parser.add_argument("--baseline-records", type=int, default=2000,
+                        help="records saved one transaction each for comparison")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    records = [synthetic_registration(rng, i) for i in range(args.records)]
+    body = "".join(json.dumps(record) + "\n" for record in records).encode()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = import_app(os.path.join(tmp, "registrations.sqlite"))
+        app.API_TOKEN = TOKEN
+        app.IMPORT_BATCH_SIZE = args.batch_size
+        client = app.app.test_client()
+        headers = {"Authorization": f"Bearer {TOKEN}"}
+
+        started = time.perf_counter()
+        response = client.post("/api/registrations/import", data=body, headers=headers,
+                               content_type="application/x-ndjson")
+        import_s = time.perf_counter() - started
+        result = response.get_json()
+        if result["imported"] != args.records:
+            raise AssertionError(f"import failed: {json.dumps(result)[:500]}")
+
+        started = time.perf_counter()
+        response = client.get("/api/registrations/export?include_secrets=1", headers=headers)
+        exported = response.get_data()
+        export_s = time.perf_counter() - started
+        if sorted(exported.splitlines()) != sorted(body.splitlines()):
+            raise AssertionError("export does not match the imported records")
+
+        started = time.perf_counter()
+        for record in records[:args.baseline_records]:
+            app.save_registration("9" + record["installation_id"], record)
+        per_record_s = (time.perf_counter() - started) / max(1, args.baseline_records)
+        app.db.close()
+
+    print(json.dumps({
+        "records": args.records,
+        "mbytes": round(len(body) / 1e6, 1),
+        "batch_size": args.batch_size,
+        "import_s": round(import_s, 2),
+        "import_records_per_s": round(args.records / import_s),
+        "export_s": round(export_s, 2),
+        "export_records_per_s": round(args.records / export_s),
+        "one_per_transaction_estimate_s": round(per_record_s * args.records, 1),
+        "target_s": args.target_seconds,
+    }))
+    if import_s > args.target_seconds:
+        print(f"REGRESSION: import took {import_s:.1f}s, target {args.target_seconds}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Shared pieces of the gitapp-callback benchmarks: a server launcher, test data, percentiles."""
+
+import collections
+import contextlib
+import http.client
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Sizes of the pools synthetic registrations draw users, buckets and tenants from.
+USERS = 20000
+BUCKETS = 5000
+TENANTS = 1000
+
+Server = collections.namedtuple("Server", "port process")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5.0)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+def server_command(kind, port):
+    """Command line for the development server ("flask") or production server ("gunicorn")."""
+    if kind == "flask":
+        return [sys.executable, "-m", "flask", "--app", "app", "run",
+                "--host", "127.0.0.1", "--port", str(port)]
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--access-logfile", "/dev/null", "app:app"]
+
+
+@contextlib.contextmanager
+def running_server(kind, **env):
+    """
+    Run the service under the development server or gunicorn.
+
+    Yields a Server with the TCP port and the server process. Keyword
+    arguments are passed to the service as environment variables; DB_PATH
+    should point at a scratch database.
+    """
+    port = free_port()
+    environ = dict(os.environ, BIND=f"127.0.0.1:{port}")
+    environ.update(env)
+    server = subprocess.Popen(
+        server_command(kind, port),
+        cwd=APP_DIR, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(port)
+        yield Server(port, server)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def import_app(db_path):
+    """Import app.py on a scratch database with its INFO logging silenced."""
+    os.environ["DB_PATH"] = db_path
+    # Per-save INFO logging would dominate the measurements.
+    logging.disable(logging.INFO)
+    sys.path.insert(0, APP_DIR)
+    import app
+
+    return app
+
+
+def synthetic_registration(rng, i):
+    """A plausible registration: 1-3 admins, 0-5 readers, one or two buckets."""
+    email = "user{}@example.com".format
+    return {
+        "installation_id": str(10000000 + i),
+        "tenant": f"program{rng.randrange(TENANTS)}/project",
+        "defaultBranch": "main",
+        "adminUsers": [email(rng.randrange(USERS)) for _ in range(rng.randint(1, 3))],
+        "readUsers": [email(rng.randrange(USERS)) for _ in range(rng.randint(0, 5))],
+        "dataBucket": {"bucket": f"bucket{rng.randrange(BUCKETS)}", "accessKey": "AKIAEXAMPLE",
+                       "secretKey": "secret", "is_aws": True},
+        "artifactBucket": (
+            {"bucket": f"bucket{rng.randrange(BUCKETS)}", "accessKey": "AKIAEXAMPLE",
+             "secretKey": "secret", "is_aws": False, "hostname": "https://minio.example.com",
+             "region": "us-east-1", "pathStyle": True}
+            if rng.random() < 0.5 else None
+        ),
+    }
+
+
+def fill(app, count, batch=5000, seed=0):
+    """Create count synthetic registrations (IDs 10000000 up) in batched transactions."""
+    rng = random.Random(seed)
+    for start in range(0, count, batch):
+        with app.db.transaction() as conn:
+            for i in range(start, min(count, start + batch)):
+                app.upsert_registration(conn, str(10000000 + i), synthetic_registration(rng, i))
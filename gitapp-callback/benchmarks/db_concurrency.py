@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write benchmark of the registrations database.
+
+Runs --workers processes with --threads threads each, the way a multi-worker
+WSGI server would, against a fresh SQLite file. Every thread loops for
+--duration seconds doing get_registration() reads and, with probability
+--write-ratio, save_registration() upserts on random installation IDs.
+
+Two modes are compared:
+    legacy  a new sqlite3.connect() per call in the default rollback-journal
+            mode, as app.py did before the connection manager
+    pooled  app.get_registration / app.save_registration on per-thread WAL
+            connections with a busy timeout, saves going through the
+            group-commit writer (see group_commit.py)
+
+Each mode prints one JSON line with throughput, p50/p99 latency and the
+share of operations that failed with "database is locked" or "busy". Both
+modes wait up to --busy-timeout-ms for a lock (Python's sqlite3 default is
+5000); with the default, legacy contention mostly shows up as p99 latency,
+and shorter timeouts turn it into lock errors.
+
+Usage:
+    python benchmarks/db_concurrency.py [--mode legacy --mode pooled] [--workers 4] [--threads 4]
+    python benchmarks/db_concurrency.py --write-ratio 0.5 --busy-timeout-ms 50
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from common import APP_DIR, percentile
+
+REGISTRATION = {
+    "tenant": "bench",
+    "adminUsers": ["admin@example.com"],
+    "dataBucket": {"bucket": "bench-data", "region": "us-west-2", "is_aws": True},
+}
+
+
+def legacy_init(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS registrations (
+            installation_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def legacy_get(path, installation_id, timeout):
+    conn = sqlite3.connect(path, timeout=timeout)
+    row = conn.execute(
+        "SELECT data FROM registrations WHERE installation_id = ?", (installation_id,)
+    ).fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def legacy_save(path, installation_id, registration_data, timeout=5.0):
+    conn = sqlite3.connect(path, timeout=timeout)
+    conn.execute("""
+        INSERT INTO registrations (installation_id, data, created_at, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(installation_id)
+        DO UPDATE SET
+            data = excluded.data,
+            updated_at = CURRENT_TIMESTAMP
+    """, (installation_id, json.dumps(registration_data)))
+    conn.commit()
+    conn.close()
+
+
+def operations(mode, path, busy_timeout_ms):
+    """Return (get, save) callables for mode, both bound to path."""
+    timeout = busy_timeout_ms / 1000.0
+    if mode == "legacy":
+        return (
+            lambda key: legacy_get(path, key, timeout),
+            lambda key, data: legacy_save(path, key, data, timeout),
+        )
+    os.environ["DB_PATH"] = path
+    os.environ["DB_BUSY_TIMEOUT_MS"] = str(busy_timeout_ms)
+    # Per-save INFO logging would dominate the measurement.
+    logging.disable(logging.INFO)
+    sys.path.insert(0, APP_DIR)
+    import app
+
+    return app.get_registration, app.save_registration
+
+
+def is_lock_error(error):
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+def worker(mode, path, busy_timeout_ms, start_at, duration, threads, write_ratio, keys, seed,
+           results):
+    """One server process: run threads until start_at + duration, report totals."""
+    get, save = operations(mode, path, busy_timeout_ms)
+    lock = threading.Lock()
+    totals = {"reads": 0, "writes": 0, "lock_errors": 0, "other_errors": 0, "latencies": []}
+
+    def loop(index):
+        rng = random.Random(seed * 1000 + index)
+        reads = writes = lock_errors = other_errors = 0
+        latencies = []
+        time.sleep(max(0.0, start_at - time.time()))
+        deadline = start_at + duration
+        while time.time() < deadline:
+            key = str(rng.randrange(keys))
+            writing = rng.random() < write_ratio
+            started = time.perf_counter()
+            try:
+                if writing:
+                    save(key, REGISTRATION)
+                    writes += 1
+                else:
+                    get(key)
+                    reads += 1
+            except sqlite3.OperationalError as e:
+                if is_lock_error(e):
+                    lock_errors += 1
+                else:
+                    other_errors += 1
+            latencies.append(time.perf_counter() - started)
+        with lock:
+            totals["reads"] += reads
+            totals["writes"] += writes
+            totals["lock_errors"] += lock_errors
+            totals["other_errors"] += other_errors
+            totals["latencies"].extend(latencies)
+
+    pool = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(totals)
+
+
+def run_mode(mode, workers, threads, duration, write_ratio, keys, busy_timeout_ms):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "registrations.sqlite")
+        legacy_init(path)
+        for key in range(keys):
+            legacy_save(path, str(key), REGISTRATION)
+        results = context.Queue()
+        # Leave time for the spawned interpreters to import before the clock starts.
+        start_at = time.time() + 2.0
+        processes = [
+            context.Process(
+                target=worker,
+                args=(mode, path, busy_timeout_ms, start_at, duration, threads, write_ratio, keys,
+                      seed, results),
+            )
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    latencies = sorted(latency for row in rows for latency in row["latencies"])
+    attempted = len(latencies)
+    completed = sum(row["reads"] + row["writes"] for row in rows)
+    lock_errors = sum(row["lock_errors"] for row in rows)
+
+    def percentile_ms(fraction):
+        return round(percentile(latencies, fraction) * 1000, 3) if latencies else 0.0
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "threads": threads,
+        "write_ratio": write_ratio,
+        "busy_timeout_ms": busy_timeout_ms,
+        "ops_per_sec": round(completed / duration, 1),
+        "reads": sum(row["reads"] for row in rows),
+        "writes": sum(row["writes"] for row in rows),
+        "lock_errors": lock_errors,
+        "lock_error_rate": round(lock_errors / attempted, 4) if attempted else 0.0,
+        "other_errors": sum(row["other_errors"] for row in rows),
+        "p50_ms": percentile_ms(0.50),
+        "p99_ms": percentile_ms(0.99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", action="append", choices=["legacy", "pooled"],
+                        help="mode to run, repeatable (default: legacy then pooled)")
+    parser.add_argument("--workers", type=int, default=4, help="server processes")
+    parser.add_argument("--threads", type=int, default=4, help="threads per process")
+    parser.add_argument("--duration", type=float, default=5.0, help="measured seconds per mode")
+    parser.add_argument("--write-ratio", type=float, default=0.2,
+                        help="share of operations that write")
+    parser.add_argument("--keys", type=int, default=1000, help="distinct installation IDs")
+    parser.add_argument("--busy-timeout-ms", type=int, default=5000, help="lock wait in both modes")
+    args = parser.parse_args(argv)
+
+    for mode in args.mode or ["legacy", "pooled"]:
+        row = run_mode(mode, args.workers, args.threads, args.duration, args.write_ratio, args.keys,
+                       args.busy_timeout_ms)
+        print(json.dumps(row), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Durable registration submissions per second under bursty concurrency.
+
+--clients threads call app.save_registration() back to back for --duration
+seconds against a fresh database, each saving a synthetic registration
+under a random installation ID. Three modes are compared, each in its own
+spawned process since app.py reads its settings at import:
+    direct-normal  one transaction per save, synchronous=NORMAL: fast, but
+                   a power loss can drop acknowledged saves
+    direct-full    one transaction per save, synchronous=FULL: every save
+                   is on disk when acknowledged, at one WAL sync per save
+    group-full     the group-commit writer (GROUP_COMMIT=true): concurrent
+                   saves share one synchronous=FULL transaction and sync
+
+Each mode prints one JSON line with submissions/sec, p50/p99 latency from
+call to acknowledgement, errors and, for group-full, the mean batch size.
+
+Usage:
+    python benchmarks/group_commit.py [--clients 50] [--duration 10]
+    python benchmarks/group_commit.py --mode group-full --max-batch 128 --window-ms 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from common import import_app, percentile, synthetic_registration
+
+MODES = {
+    "direct-normal": {"GROUP_COMMIT": "false", "DB_SYNCHRONOUS": "NORMAL"},
+    "direct-full": {"GROUP_COMMIT": "false", "DB_SYNCHRONOUS": "FULL"},
+    "group-full": {"GROUP_COMMIT": "true", "DB_SYNCHRONOUS": "NORMAL"},
+}
+
+
+def worker(mode, path, args, results):
+    """Run the clients in a fresh interpreter configured for mode."""
+    os.environ.update(MODES[mode])
+    os.environ["GROUP_COMMIT_MAX_BATCH"] = str(args.max_batch)
+    os.environ["GROUP_COMMIT_WINDOW_MS"] = str(args.window_ms)
+    app = import_app(path)
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + args.duration
+
+    def client(index):
+        rng = random.Random(index)
+        took, failed = [], 0
+        while time.perf_counter() < deadline:
+            i = rng.randrange(args.installations)
+            registration = synthetic_registration(rng, i)
+            started = time.perf_counter()
+            try:
+                app.save_registration(registration["installation_id"], registration)
+            except Exception:
+                failed += 1
+            took.append((time.perf_counter() - started) * 1000.0)
+        with lock:
+            latencies.extend(took)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    writer = app.group_writer
+    results.put({
+        "latencies": latencies,
+        "errors": errors[0],
+        "elapsed": elapsed,
+        "batches": writer.batches,
+        "batched_writes": writer.writes,
+    })
+
+
+def run_mode(mode, args):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        results = context.Queue()
+        process = context.Process(
+            target=worker, args=(mode, os.path.join(tmp, "registrations.sqlite"), args, results)
+        )
+        process.start()
+        row = results.get()
+        process.join()
+
+    ordered = sorted(row["latencies"])
+    submitted = len(ordered) - row["errors"]
+    return {
+        "mode": mode,
+        "clients": args.clients,
+        "submissions": submitted,
+        "submissions_per_s": round(submitted / row["elapsed"], 1),
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "errors": row["errors"],
+        "mean_batch": (round(row["batched_writes"] / row["batches"], 1)
+                       if row["batches"] else None),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", action="append", choices=list(MODES),
+                        help="mode to run, repeatable (default: all)")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent submitting threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per mode")
+    parser.add_argument("--installations", type=int, default=10000,
+                        help="installation IDs submissions are spread over")
+    parser.add_argument("--max-batch", type=int, default=64, help="GROUP_COMMIT_MAX_BATCH")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="GROUP_COMMIT_WINDOW_MS")
+    parser.add_argument("--dir", default=None,
+                        help="directory for the scratch database (sync cost depends on its disk)")
+    args = parser.parse_args(argv)
+
+    for mode in args.mode or list(MODES):
+        print(json.dumps(run_mode(mode, args)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Page latency of the registrations listing API deep into a large table.
+
+Fills a scratch database with --registrations synthetic registrations,
+spreads their updated_at over a year, then walks GET /api/registrations
+from the first page to the last, following next_cursor, through Flask's
+test client. Page latency is reported for the first and last --edge share
+of pages; with keyset pagination the two should match, and the run exits 1
+when the last pages' p50 exceeds the first pages' by more than --max-ratio.
+
+For contrast, the first and last pages are also fetched with LIMIT/OFFSET
+directly in SQL (no HTTP or JSON), whose cost grows with the offset. A
+tenant-filtered walk, ten rows per page, is timed as well.
+
+Usage:
+    python benchmarks/listing.py [--registrations 100000] [--limit 100] [--max-ratio 2.0]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from common import fill, import_app, percentile
+
+TOKEN = "bench-token"
+
+OFFSET_SQL = (
+    "SELECT installation_id, data, created_at, updated_at FROM registrations "
+    "ORDER BY updated_at, installation_id LIMIT ? OFFSET ?"
+)
+
+
+def walk(client, query):
+    """Fetch every page of the listing; return (per-page ms, rows seen)."""
+    took, rows, cursor = [], 0, None
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    while True:
+        url = f"/api/registrations?{query}" + (f"&cursor={cursor}" if cursor else "")
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        body = json.loads(response.get_data())
+        took.append((time.perf_counter() - started) * 1000.0)
+        if response.status_code != 200:
+            raise RuntimeError(f"listing failed with HTTP {response.status_code}: {body}")
+        rows += len(body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return took, rows
+
+
+def offset_pages(app, limit, pages, edge_pages):
+    """Per-page ms of LIMIT/OFFSET for the first and last edge_pages pages."""
+    conn = app.db.connect()
+    took = {}
+    for label, numbers in (("first", range(edge_pages)),
+                           ("last", range(pages - edge_pages, pages))):
+        samples = []
+        for number in numbers:
+            started = time.perf_counter()
+            conn.execute(OFFSET_SQL, (limit, number * limit)).fetchall()
+            samples.append((time.perf_counter() - started) * 1000.0)
+        took[label] = samples
+    return took
+
+
+def edges(took, edge_pages):
+    first, last = sorted(took[:edge_pages]), sorted(took[-edge_pages:])
+    return {
+        "first_p50_ms": round(percentile(first, 0.5), 3),
+        "last_p50_ms": round(percentile(last, 0.5), 3),
+        "last_p99_ms": round(percentile(last, 0.99), 3),
+        "ratio": round(statistics.median(last) / statistics.median(first), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--registrations", type=int, default=100000, help="registrations to create")
+    parser.add_argument("--limit", type=int, default=100, help="page size")
+    parser.add_argument("--edge", type=float, default=0.1,
+                        help="share of pages at each end that is compared")
+    parser.add_argument("--max-ratio", type=float, default=2.0,
+                        help="largest allowed last/first page p50 ratio")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = import_app(os.path.join(tmp, "registrations.sqlite"))
+        app.API_TOKEN = TOKEN
+        fill(app, args.registrations)
+        with app.db.transaction() as conn:
+            # Deterministic spread of updates over 2024 with few ties.
+            conn.execute(
+                "UPDATE registrations SET updated_at = "
+                "datetime(1704067200 + (rowid * 7919) % 31536000, 'unixepoch')"
+            )
+        client = app.app.test_client()
+
+        failed = False
+        for name, query in (("all", f"limit={args.limit}"),
+                            ("tenant", "limit=10&tenant=program7/project")):
+            took, rows = walk(client, query)
+            edge_pages = max(1, int(len(took) * args.edge))
+            row = {"walk": name, "pages": len(took), "rows": rows, **edges(took, edge_pages)}
+            if name == "all":
+                offset = offset_pages(app, args.limit, len(took), edge_pages)
+                row["offset_sql_first_p50_ms"] = round(statistics.median(offset["first"]), 3)
+                row["offset_sql_last_p50_ms"] = round(statistics.median(offset["last"]), 3)
+                if rows != args.registrations:
+                    raise AssertionError(f"walk saw {rows} of {args.registrations} rows")
+                failed = row["ratio"] > args.max_ratio
+            print(json.dumps(row), flush=True)
+        app.db.close()
+    if failed:
+        print(f"REGRESSION: deep pages are more than {args.max_ratio}x slower than the first")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
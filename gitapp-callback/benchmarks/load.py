@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Load test of concurrent registration form GETs and POSTs.
+
+Starts the service on a scratch database under each --server in turn: the
+development server ("flask", what the image used to run) and gunicorn with
+gunicorn.conf.py ("gunicorn", --workers x --threads). --clients threads
+then send requests back to back over keep-alive connections for --duration
+seconds. Each request is a form submission (POST /registrations) with
+probability --post-ratio, and otherwise the update form
+(GET /registrations?setup_action=update) of a registration seeded before
+the measurement.
+
+Each server prints one JSON line with throughput, p50/p99 latency and the
+error count (transport failures and 5xx responses).
+
+Usage:
+    python benchmarks/load.py [--server flask --server gunicorn] [--clients 32] [--duration 10]
+    python benchmarks/load.py --server gunicorn --workers 4 --threads 8 --post-ratio 0.5
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from common import percentile, running_server
+
+
+def form_body(installation_id, rng):
+    fields = {
+        "installation_id": installation_id,
+        "defaultBranch": "main",
+        "adminUsers": f"admin{rng.randrange(1000)}@example.com",
+        "readUsers": "viewer@example.com, analyst@example.com",
+        "dataBucket_bucket": f"data-{installation_id}",
+        "dataBucket_accessKey": "AKIAEXAMPLE",
+        "dataBucket_secretKey": "secret",
+        "dataBucket_is_aws": "on",
+    }
+    return urllib.parse.urlencode(fields)
+
+
+def send(conn, method, path, body=None):
+    headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def seed(port, installations):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10.0)
+    rng = random.Random(0)
+    for i in range(installations):
+        status = send(conn, "POST", "/registrations", form_body(str(10000000 + i), rng))
+        if status != 200:
+            raise RuntimeError(f"seeding failed with HTTP {status}")
+    conn.close()
+
+
+def closed_loop(port, clients, duration, post_ratio, installations):
+    """
+    Run clients back-to-back request loops for duration seconds.
+
+    Returns (latencies in ms, status Counter, elapsed seconds). Transport
+    failures count as status "error".
+    """
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def client(index):
+        rng = random.Random(index)
+        conn, done, took = None, Counter(), []
+        while time.perf_counter() < deadline:
+            installation_id = str(10000000 + rng.randrange(installations))
+            started = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10.0)
+                if rng.random() < post_ratio:
+                    status = send(conn, "POST", "/registrations", form_body(installation_id, rng))
+                else:
+                    query = urllib.parse.urlencode(
+                        {"installation_id": installation_id, "setup_action": "update"}
+                    )
+                    status = send(conn, "GET", f"/registrations?{query}")
+                done[status] += 1
+            except (OSError, http.client.HTTPException):
+                done["error"] += 1
+                if conn is not None:
+                    conn.close()
+                conn = None
+            took.append((time.perf_counter() - started) * 1000.0)
+        if conn is not None:
+            conn.close()
+        with lock:
+            statuses.update(done)
+            latencies.extend(took)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - start
+
+
+def run_server(kind, args):
+    env = {"GUNICORN_WORKERS": str(args.workers), "GUNICORN_THREADS": str(args.threads)}
+    with tempfile.TemporaryDirectory() as tmp:
+        env["DB_PATH"] = os.path.join(tmp, "registrations.sqlite")
+        with running_server(kind, **env) as server:
+            seed(server.port, args.installations)
+            if args.warmup:
+                closed_loop(server.port, args.clients, args.warmup, args.post_ratio,
+                            args.installations)
+            latencies, statuses, elapsed = closed_loop(
+                server.port, args.clients, args.duration, args.post_ratio, args.installations
+            )
+    ordered = sorted(latencies)
+    errors = statuses["error"] + sum(
+        count for status, count in statuses.items() if status != "error" and status >= 500
+    )
+    return {
+        "server": kind,
+        "workers": args.workers if kind == "gunicorn" else 1,
+        "threads": args.threads if kind == "gunicorn" else None,
+        "clients": args.clients,
+        "post_ratio": args.post_ratio,
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "errors": errors,
+        "status": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", action="append", choices=["flask", "gunicorn"],
+                        help="server to run, repeatable (default: flask then gunicorn)")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per server")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds per server")
+    parser.add_argument("--post-ratio", type=float, default=0.2,
+                        help="share of requests that submit the form")
+    parser.add_argument("--installations", type=int, default=200,
+                        help="registrations seeded and targeted")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    args = parser.parse_args(argv)
+
+    for kind in args.server or ["flask", "gunicorn"]:
+        print(json.dumps(run_server(kind, args)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
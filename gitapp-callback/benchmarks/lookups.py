@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+User, bucket and tenant lookups over a large registrations database.
+
+Fills a scratch database with --registrations synthetic registrations
+through app.upsert_registration (in batched transactions), then times each
+lookup two ways:
+    indexed  app.installations_for_user / _bucket / _tenant on the side
+             tables and the tenant index
+    scan     reading every row and parsing its JSON, as answering the same
+             question required before the side tables existed
+
+Also times save_registration() at that size, since every save now
+maintains the side tables. Prints one JSON line per lookup and method with
+mean, p50 and p99 latency in ms.
+
+Usage:
+    python benchmarks/lookups.py [--registrations 100000] [--queries 1000] [--scan-queries 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from common import (
+    BUCKETS, TENANTS, USERS, fill, import_app, percentile, synthetic_registration,
+)
+
+
+def scan(app, predicate):
+    """Installation IDs whose registration JSON satisfies predicate, by full scan."""
+    rows = app.db.connect().execute("SELECT installation_id, data FROM registrations")
+    return sorted(installation_id for installation_id, data in rows if predicate(json.loads(data)))
+
+
+def lookups(app):
+    """{name: (indexed(key), scan(key), random key generator)} for every lookup."""
+    def user_key(rng):
+        return f"user{rng.randrange(USERS)}@example.com"
+
+    def bucket_key(rng):
+        return f"bucket{rng.randrange(BUCKETS)}"
+
+    def tenant_key(rng):
+        return f"program{rng.randrange(TENANTS)}/project"
+
+    def uses_bucket(data, bucket):
+        return any((data.get(field) or {}).get("bucket") == bucket for field in app.BUCKET_FIELDS)
+
+    return {
+        "admin_user": (
+            lambda key: app.installations_for_user(key, role="admin"),
+            lambda key: scan(app, lambda data: key in data["adminUsers"]),
+            user_key,
+        ),
+        "any_user": (
+            app.installations_for_user,
+            lambda key: scan(app, lambda data: key in data["adminUsers"] + data["readUsers"]),
+            user_key,
+        ),
+        "bucket": (
+            app.installations_for_bucket,
+            lambda key: scan(app, lambda data: uses_bucket(data, key)),
+            bucket_key,
+        ),
+        "tenant": (
+            app.installations_for_tenant,
+            lambda key: scan(app, lambda data: data.get("tenant") == key),
+            tenant_key,
+        ),
+    }
+
+
+def timed(func, keys):
+    took = []
+    for key in keys:
+        started = time.perf_counter()
+        func(key)
+        took.append((time.perf_counter() - started) * 1000.0)
+    return took
+
+
+def summary(name, method, took):
+    ordered = sorted(took)
+    return {
+        "lookup": name,
+        "method": method,
+        "queries": len(took),
+        "mean_ms": round(statistics.fmean(took), 4),
+        "p50_ms": round(percentile(ordered, 0.50), 4),
+        "p99_ms": round(percentile(ordered, 0.99), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--registrations", type=int, default=100000, help="registrations to create")
+    parser.add_argument("--queries", type=int, default=1000, help="indexed lookups per kind")
+    parser.add_argument("--scan-queries", type=int, default=5, help="full-scan lookups per kind")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = import_app(os.path.join(tmp, "registrations.sqlite"))
+
+        started = time.perf_counter()
+        fill(app, args.registrations)
+        print(json.dumps({"registrations": args.registrations,
+                          "fill_s": round(time.perf_counter() - started, 2)}), flush=True)
+
+        rng = random.Random(1)
+        for name, (indexed, scanned, key) in lookups(app).items():
+            sample = [key(rng) for _ in range(args.scan_queries)]
+            if indexed(sample[0]) != scanned(sample[0]):
+                raise AssertionError(f"{name}: indexed and scanned results differ")
+            keys = [key(rng) for _ in range(args.queries)]
+            print(json.dumps(summary(name, "indexed", timed(indexed, keys))))
+            print(json.dumps(summary(name, "scan", timed(scanned, sample))), flush=True)
+
+        save_rng = random.Random(2)
+        took = timed(
+            lambda i: app.save_registration(str(10000000 + i), synthetic_registration(save_rng, i)),
+            [save_rng.randrange(args.registrations) for _ in range(args.queries)],
+        )
+        print(json.dumps(summary("save_registration", "write", took)))
+        app.db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Cost of a reconciler step as the registrations store grows.
+
+For each --registrations size, fills a scratch database, runs the
+reconciler until it has applied every registration once (the initial sync),
+then saves --changed registrations (half of them with no effect on their
+RepoRegistration) and times the step that picks them up. The change feed is
+read in-process and the client only counts objects, so the timings cover
+the reconciler's own diff and snapshot work. A step's time should depend on
+the number of changes, not on the number of registrations; the run exits 1
+when the largest size's step is more than --max-ratio times the smallest's.
+
+Usage:
+    python benchmarks/reconcile.py [--registrations 10000 --registrations 100000] [--changed 100]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from common import APP_DIR, import_app, synthetic_registration
+
+
+class LocalFeed:
+    """The change feed read straight from app's database."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def poll(self, since, limit, wait=0):
+        changes = [self.app.change_item(*row) for row in self.app.read_changes(since, limit)]
+        return changes, changes[-1]["seq"] if changes else since
+
+
+class CountingClient:
+    def __init__(self):
+        self.applied = self.deleted = 0
+
+    def apply_batch(self, objects, deletions):
+        self.applied += len(objects)
+        self.deleted += len(deletions)
+        return {}
+
+
+def with_repo(registration):
+    registration["repoUrl"] = f"https://github.com/org/repo{registration['installation_id']}.git"
+    return registration
+
+
+def run_size(size, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "registrations.sqlite")
+        app = import_app(path)
+        # The module stays imported across sizes; point it at this size's database.
+        app.DB_PATH = path
+        app.init_db()
+        from reconciler import Reconciler, Snapshot
+
+        rng = random.Random(0)
+        for start in range(0, size, 5000):
+            with app.db.transaction() as conn:
+                for i in range(start, min(size, start + 5000)):
+                    app.upsert_registration(conn, str(10000000 + i),
+                                            with_repo(synthetic_registration(rng, i)))
+
+        client = CountingClient()
+        snapshot = Snapshot(os.path.join(tmp, "snapshot.sqlite"))
+        reconciler = Reconciler(LocalFeed(app), client, snapshot, batch_size=args.batch_size)
+        started = time.perf_counter()
+        while reconciler.step()["changes"]:
+            pass
+        initial_s = time.perf_counter() - started
+
+        picked = rng.sample(range(size), args.changed)
+        for n, i in enumerate(picked):
+            installation_id = str(10000000 + i)
+            registration = app.get_registration(installation_id)
+            if n % 2 == 0:
+                registration["defaultBranch"] = "develop"
+            app.save_registration(installation_id, registration)
+
+        applied_before = client.applied
+        started = time.perf_counter()
+        stats = {"changes": 0}
+        while True:
+            step = reconciler.step()
+            if not step["changes"]:
+                break
+            for key, value in step.items():
+                stats[key] = stats.get(key, 0) + value
+        step_s = time.perf_counter() - started
+        snapshot.close()
+        app.db.close()
+
+    return {
+        "registrations": size,
+        "initial_sync_s": round(initial_s, 2),
+        "changed": args.changed,
+        "step_ms": round(step_s * 1000.0, 2),
+        "applied": client.applied - applied_before,
+        "unchanged": stats.get("unchanged", 0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--registrations", type=int, action="append",
+                        help="store size, repeatable (default: 10000 and 100000)")
+    parser.add_argument("--changed", type=int, default=100, help="registrations changed")
+    parser.add_argument("--batch-size", type=int, default=1000, help="changes per step")
+    parser.add_argument("--max-ratio", type=float, default=3.0,
+                        help="largest allowed step-time ratio, largest vs smallest size")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, APP_DIR)
+    rows = [run_size(size, args) for size in sorted(args.registrations or [10000, 100000])]
+    for row in rows:
+        print(json.dumps(row), flush=True)
+    ratio = rows[-1]["step_ms"] / max(rows[0]["step_ms"], 1e-9)
+    if ratio > args.max_ratio:
+        print(f"REGRESSION: step time grew {ratio:.1f}x with the store size")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
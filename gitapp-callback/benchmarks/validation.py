@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Registration validation throughput over 100k records.
+
+Generates --records synthetic registrations, with --invalid-share of them
+broken in one field each, and checks every record two ways:
+    compiled     app.validate_registration: the rule list compiled from the
+                 RepoRegistration CRD at startup
+    interpreted  walking the CRD's openAPIV3Schema for every record and
+                 matching patterns from their source strings, followed by
+                 the same form rules, as a generic schema validator would
+
+Both must accept and reject the same records. Prints one JSON line per
+method with the total seconds, records/s and the number rejected.
+
+Usage:
+    python benchmarks/validation.py [--records 100000] [--invalid-share 0.05]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from common import import_app, synthetic_registration
+
+# One way to break a record per rule kind.
+CORRUPTIONS = (
+    ("adminUsers", []),
+    ("readUsers", ["not-an-email"]),
+    ("installation_id", "abc"),
+    ("tenant", 7),
+    ("isPublic", "yes"),
+    ("dataBucket", {"bucket": "b", "accessKey": "AK", "is_aws": True}),
+)
+
+TYPES = {
+    "string": str, "boolean": bool, "object": dict, "array": list,
+}
+
+EMAIL = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
+
+
+def interpret(schema, value, name):
+    """Check value against schema by walking it; return an error message or None."""
+    if value is None:
+        return None
+    schema_type = schema.get("type")
+    if schema_type == "integer":
+        if not (isinstance(value, int) or (isinstance(value, str) and value.isascii() and value.isdigit())):
+            return f"{name} must be an integer"
+        if int(value) < schema.get("minimum", int(value)):
+            return f"{name} must be at least {schema['minimum']}"
+    elif schema_type and not isinstance(value, TYPES[schema_type]):
+        return f"{name} must be a {schema_type}"
+    if "pattern" in schema and not re.match(schema["pattern"], value):
+        return f"{name} must match {schema['pattern']}"
+    if schema.get("format") == "email" and not re.match(EMAIL, value):
+        return f"Invalid email address: {value}"
+    for key, child in (schema.get("properties") or {}).items():
+        error = interpret(child, value.get(key), f"{name}.{key}")
+        if error:
+            return error
+    for item in value if schema_type == "array" else ():
+        error = interpret(schema.get("items") or {}, item, name)
+        if error:
+            return error
+    return None
+
+
+def interpreted_validator(app, schema):
+    """A validate(record) that walks schema per call, then applies the app's extra rules."""
+    extra = app.REGISTRATION_VALIDATOR.rules[-1 - len(app.BUCKET_FIELDS):]
+
+    def validate(record):
+        if not str(record.get("installation_id") or "").strip():
+            raise ValueError("installation_id is required")
+        for key, child in schema["properties"].items():
+            field = "installation_id" if key == "installationId" else key
+            error = interpret(child, record.get(field), field)
+            if error:
+                raise ValueError(error)
+        for rule in extra:
+            error = rule(record)
+            if error:
+                raise ValueError(error)
+    return validate
+
+
+def run(validate, records):
+    rejected = []
+    started = time.perf_counter()
+    for record in records:
+        try:
+            validate(record)
+        except ValueError:
+            rejected.append(record["installation_id"])
+    return time.perf_counter() - started, rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000, help="records to validate")
+    parser.add_argument("--invalid-share", type=float, default=0.05,
+                        help="share of records broken in one field")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    records = []
+    for i in range(args.records):
+        record = synthetic_registration(rng, i)
+        if rng.random() < args.invalid_share:
+            field, value = rng.choice(CORRUPTIONS)
+            record[field] = value
+        records.append(record)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = import_app(os.path.join(tmp, "registrations.sqlite"))
+        methods = {
+            "compiled": app.validate_registration,
+            "interpreted": interpreted_validator(app, app.load_crd_schema(app.CRD_PATH)),
+        }
+        results = {}
+        for method, validate in methods.items():
+            took, rejected = run(validate, records)
+            results[method] = rejected
+            print(json.dumps({
+                "method": method,
+                "records": args.records,
+                "seconds": round(took, 3),
+                "records_per_s": round(args.records / took),
+                "rejected": len(rejected),
+            }), flush=True)
+        app.db.close()
+    if results["compiled"] != results["interpreted"]:
+        raise AssertionError("compiled and interpreted validation disagree")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
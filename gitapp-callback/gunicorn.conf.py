@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the gitapp-callback image.
+
+preload_app imports app.py once in the master before forking: the schema
+migration in init_db() runs a single time per pod, and the compiled
+templates and regular expressions are shared by every worker. Each worker
+thread then opens its own SQLite connection on first use.
+"""
+
+import os
+
+bind = [addr.strip() for addr in os.environ.get("BIND", "0.0.0.0:8080").split(",") if addr.strip()]
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = True
+accesslog = "-"
+# Worker heartbeat files; /tmp may not be writable with readOnlyRootFilesystem.
+worker_tmp_dir = os.environ.get("GUNICORN_WORKER_TMP_DIR", "/dev/shm")
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Reconcile RepoRegistration custom resources with the registrations store.
+
+Follows gitapp-callback's change feed (GET /api/changes) and, for every
+installation that changed, builds the RepoRegistration object it should
+have in the cluster. That object is compared with a local snapshot of what
+was last applied, and only the objects that differ are applied or deleted,
+a batch at a time, through a pluggable client. The snapshot is an SQLite
+file holding one digest per object and the feed position, updated in the
+same transaction, so each step costs O(changed registrations) however many
+registrations exist, and a restarted reconciler resumes where it stopped.
+
+Usage:
+    API_TOKEN=... CALLBACK_URL=http://gitapp-callback:8080 python reconciler.py
+    python reconciler.py --once    # apply what is pending, then exit
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import logging
+import os
+import sqlite3
+import ssl
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+from registration_schema import CRD_PATH, is_decimal, load_crd_schema, spec_validator
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+CALLBACK_URL = os.environ.get("CALLBACK_URL", "http://localhost:8080")
+API_TOKEN = os.environ.get("API_TOKEN", "")
+NAMESPACE = os.environ.get("RECONCILER_NAMESPACE", "argo-stack")
+SNAPSHOT_PATH = os.environ.get("RECONCILER_SNAPSHOT_PATH", "reconciler-snapshot.sqlite")
+BATCH_SIZE = int(os.environ.get("RECONCILER_BATCH_SIZE", "100"))
+# Long-poll wait for new changes (at most the API's 30 seconds), and the
+# pause before retrying after an error.
+WAIT_SECONDS = float(os.environ.get("RECONCILER_WAIT_SECONDS", "30"))
+RETRY_SECONDS = 5.0
+
+SERVICE_ACCOUNT_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+
+GROUP = "platform.calypr.io"
+VERSION = "v1alpha1"
+PLURAL = "reporegistrations"
+FIELD_MANAGER = "gitapp-callback-reconciler"
+MANAGED_BY = "gitapp-callback"
+INSTALLATION_LABEL = f"{GROUP}/installation-id"
+
+
+def object_name(installation_id):
+    """Name of an installation's RepoRegistration."""
+    return f"installation-{installation_id}"
+
+
+def spec_from_registration(schema, installation_id, registration):
+    """
+    RepoRegistration spec for a stored registration.
+
+    Keeps only the fields the CRD declares, including within bucket objects,
+    so bucket credentials never reach the cluster.
+
+    Args:
+        schema: Spec schema from load_crd_schema()
+        installation_id: The GitHub installation ID
+        registration: The registration as returned by the change feed
+    """
+    spec = {}
+    for name, field_schema in schema["properties"].items():
+        value = registration.get(name)
+        if value is None:
+            continue
+        if field_schema.get("type") == "object" and isinstance(value, dict):
+            declared = field_schema.get("properties") or {}
+            value = {key: v for key, v in value.items() if key in declared and v is not None}
+        spec[name] = value
+    spec["installationId"] = (
+        int(installation_id) if is_decimal(str(installation_id)) else installation_id
+    )
+    return spec
+
+
+def desired_object(schema, installation_id, registration, namespace=NAMESPACE):
+    """The RepoRegistration object an installation's registration should have."""
+    return {
+        "apiVersion": f"{GROUP}/{VERSION}",
+        "kind": "RepoRegistration",
+        "metadata": {
+            "name": object_name(installation_id),
+            "namespace": namespace,
+            "labels": {
+                "app.kubernetes.io/managed-by": MANAGED_BY,
+                INSTALLATION_LABEL: str(installation_id),
+            },
+        },
+        "spec": spec_from_registration(schema, installation_id, registration),
+    }
+
+
+def digest(obj):
+    """Stable digest of an object's content, for comparison with the snapshot."""
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+class Snapshot:
+    """
+    What the reconciler last applied: one digest per object and the feed position.
+
+    Args:
+        path: SQLite file to keep the snapshot in
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS applied (name TEXT PRIMARY KEY, digest TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS position (id INTEGER PRIMARY KEY CHECK (id = 1), "
+            "since INTEGER NOT NULL)"
+        )
+
+    @property
+    def since(self):
+        """Sequence number of the last change fully reconciled."""
+        row = self.conn.execute("SELECT since FROM position").fetchone()
+        return row[0] if row else 0
+
+    def digest(self, name):
+        """Digest of the object last applied under name, or None."""
+        row = self.conn.execute("SELECT digest FROM applied WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, applied, deleted, since=None):
+        """
+        Record applied objects, deleted names and optionally a new position atomically.
+
+        Args:
+            applied: (name, digest) pairs now in the cluster
+            deleted: Names no longer in the cluster
+            since: New feed position, or None to keep the current one
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT INTO applied (name, digest) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET digest = excluded.digest",
+                applied,
+            )
+            self.conn.executemany("DELETE FROM applied WHERE name = ?", [(n,) for n in deleted])
+            if since is not None:
+                self.conn.execute(
+                    "INSERT INTO position (id, since) VALUES (1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET since = excluded.since",
+                    (since,),
+                )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()
+
+
+class ChangeFeed:
+    """
+    Client of gitapp-callback's change feed.
+
+    Args:
+        base_url: Root URL of the gitapp-callback service
+        token: Its API_TOKEN
+    """
+
+    def __init__(self, base_url=CALLBACK_URL, token=API_TOKEN):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+
+    def poll(self, since, limit, wait=0):
+        """
+        Changes after since, waiting up to wait seconds for the first one.
+
+        Returns:
+            tuple: (list of change items, next_since)
+        """
+        query = urllib.parse.urlencode({"since": since, "limit": limit, "wait": wait})
+        req = urllib.request.Request(
+            f"{self.base_url}/api/changes?{query}",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+        with urllib.request.urlopen(req, timeout=wait + 30) as response:
+            body = json.load(response)
+        return body["changes"], body["next_since"]
+
+
+class KubernetesClient:
+    """
+    Applies RepoRegistration objects with server-side apply.
+
+    Keeps one connection to the API server open across a batch. Defaults
+    to the pod's service account.
+
+    Args:
+        server: API server URL
+        token: Bearer token
+        ca_file: CA bundle to verify the server with (None: system default)
+    """
+
+    def __init__(self, server=None, token=None, ca_file=None):
+        if server is None:
+            host = os.environ.get("KUBERNETES_SERVICE_HOST", "kubernetes.default.svc")
+            port = os.environ.get("KUBERNETES_SERVICE_PORT", "443")
+            server = f"https://{host}:{port}"
+        if token is None:
+            with open(os.path.join(SERVICE_ACCOUNT_DIR, "token")) as f:
+                token = f.read().strip()
+            ca_file = ca_file or os.path.join(SERVICE_ACCOUNT_DIR, "ca.crt")
+        self.url = urllib.parse.urlsplit(server)
+        self.token = token
+        self.ca_file = ca_file
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            if self.url.scheme == "https":
+                context = ssl.create_default_context(cafile=self.ca_file)
+                self._conn = http.client.HTTPSConnection(
+                    self.url.hostname, self.url.port, context=context, timeout=30
+                )
+            else:
+                self._conn = http.client.HTTPConnection(self.url.hostname, self.url.port,
+                                                        timeout=30)
+        return self._conn
+
+    def _request(self, method, path, body=None, content_type=None):
+        headers = {"Authorization": f"Bearer {self.token}", "Accept": "application/json"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        try:
+            conn = self._connection()
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        return response.status, payload
+
+    @staticmethod
+    def _path(namespace, name):
+        return (f"/apis/{GROUP}/{VERSION}/namespaces/{namespace}/{PLURAL}/"
+                f"{urllib.parse.quote(name)}")
+
+    def apply(self, obj):
+        """Create or update obj, taking ownership of the fields it sets."""
+        metadata = obj["metadata"]
+        query = urllib.parse.urlencode({"fieldManager": FIELD_MANAGER, "force": "true"})
+        status, payload = self._request(
+            "PATCH", f"{self._path(metadata['namespace'], metadata['name'])}?{query}",
+            json.dumps(obj), "application/apply-patch+yaml",
+        )
+        if status >= 300:
+            raise RuntimeError(f"apply {metadata['name']}: HTTP {status} {payload[:300]!r}")
+
+    def delete(self, namespace, name):
+        """Delete an object; one that is already gone counts as deleted."""
+        status, payload = self._request("DELETE", self._path(namespace, name))
+        if status >= 300 and status != 404:
+            raise RuntimeError(f"delete {name}: HTTP {status} {payload[:300]!r}")
+
+    def apply_batch(self, objects, deletions):
+        """
+        Apply objects and delete (namespace, name) pairs.
+
+        Returns:
+            dict: {name: error} for every object that failed; the others
+            were applied
+        """
+        failures = {}
+        for obj in objects:
+            try:
+                self.apply(obj)
+            except (OSError, RuntimeError, http.client.HTTPException) as e:
+                failures[obj["metadata"]["name"]] = e
+        for namespace, name in deletions:
+            try:
+                self.delete(namespace, name)
+            except (OSError, RuntimeError, http.client.HTTPException) as e:
+                failures[name] = e
+        return failures
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Reconciler:
+    """
+    Applies registration changes to the cluster, one feed batch per step.
+
+    Args:
+        feed: Source of changes with poll(since, limit, wait), e.g. ChangeFeed
+        client: Target with apply_batch(objects, deletions), e.g. KubernetesClient
+        snapshot: Snapshot of what was applied
+        namespace: Namespace of the RepoRegistration objects
+        batch_size: Changes read and applied per step
+        crd_path: CRD the objects are built and checked against
+    """
+
+    def __init__(self, feed, client, snapshot, namespace=NAMESPACE, batch_size=BATCH_SIZE,
+                 crd_path=CRD_PATH):
+        self.feed = feed
+        self.client = client
+        self.snapshot = snapshot
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.schema = load_crd_schema(crd_path)
+        self.validator = spec_validator(crd_path)
+
+    def plan(self, changes):
+        """
+        Objects to apply and delete for a batch of changes.
+
+        Each change item carries its registration's current state, so only
+        the last change per installation counts. An invalid registration is
+        never applied. If an object was applied for it before, that object is
+        left in place but no longer matches the store, so it is reported as
+        drift rather than invalid.
+
+        Returns:
+            tuple: ([(object, digest)], [(namespace, name)],
+            {installation_id: error} invalid, {installation_id: error} drift)
+        """
+        latest = {}
+        for change in changes:
+            latest[change["installation_id"]] = change["registration"]
+        upserts, deletions, invalid, drift = [], [], {}, {}
+        for installation_id, registration in latest.items():
+            name = object_name(installation_id)
+            current = self.snapshot.digest(name)
+            if registration is None:
+                if current is not None:
+                    deletions.append((self.namespace, name))
+                continue
+            obj = desired_object(self.schema, installation_id, registration, self.namespace)
+            error = self.validator.check(obj["spec"])
+            if error is not None:
+                # Leave whatever was applied before in place.
+                (invalid if current is None else drift)[installation_id] = error
+                continue
+            obj_digest = digest(obj)
+            if obj_digest != current:
+                upserts.append((obj, obj_digest))
+        return upserts, deletions, invalid, drift
+
+    def step(self, wait=0):
+        """
+        Reconcile the next batch of changes.
+
+        The feed position only advances when the whole batch was applied;
+        objects applied before a failure are recorded, so the retry skips
+        them.
+
+        Returns:
+            dict: Counts of changes read, objects applied, deleted,
+            unchanged, invalid and drift
+
+        Raises:
+            RuntimeError: If some objects could not be applied
+        """
+        changes, next_since = self.feed.poll(self.snapshot.since, self.batch_size, wait)
+        if not changes:
+            return {"changes": 0}
+        upserts, deletions, invalid, drift = self.plan(changes)
+        for installation_id, error in invalid.items():
+            logger.warning(f"Skipping installation {installation_id}: {error}")
+        for installation_id, error in drift.items():
+            logger.error(
+                f"Installation {installation_id} is no longer valid ({error}); "
+                f"{object_name(installation_id)} keeps its last applied spec"
+            )
+
+        failures = self.client.apply_batch([obj for obj, _ in upserts], deletions)
+        applied = [(obj["metadata"]["name"], d) for obj, d in upserts
+                   if obj["metadata"]["name"] not in failures]
+        deleted = [name for _, name in deletions if name not in failures]
+        self.snapshot.record(applied, deleted, None if failures else next_since)
+        if failures:
+            raise RuntimeError(
+                f"{len(failures)} object(s) failed: "
+                + "; ".join(f"{name}: {error}" for name, error in sorted(failures.items())[:5])
+            )
+        stats = {
+            "changes": len(changes),
+            "applied": len(applied),
+            "deleted": len(deleted),
+            "unchanged": len({c["installation_id"] for c in changes}) - len(upserts)
+            - len(deletions) - len(invalid) - len(drift),
+            "invalid": len(invalid),
+            "drift": len(drift),
+        }
+        logger.info(f"Reconciled through change {next_since}: {stats}")
+        return stats
+
+    def run(self, wait=WAIT_SECONDS, once=False):
+        """
+        Reconcile until stopped, or with once until no changes are pending.
+
+        Errors are logged and the batch is retried after RETRY_SECONDS.
+        """
+        while True:
+            try:
+                stats = self.step(0 if once else wait)
+            except Exception:
+                if once:
+                    raise
+                logger.exception("Reconcile step failed; retrying")
+                time.sleep(RETRY_SECONDS)
+                continue
+            if once and not stats["changes"]:
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="apply pending changes and exit")
+    parser.add_argument("--kube-server", default=os.environ.get("KUBE_API_SERVER"),
+                        help="API server URL (default: in-cluster)")
+    parser.add_argument("--kube-token-file", default=os.environ.get("KUBE_TOKEN_FILE"),
+                        help="bearer token file (default: service account)")
+    parser.add_argument("--kube-ca-file", default=os.environ.get("KUBE_CA_FILE"),
+                        help="CA bundle for the API server")
+    args = parser.parse_args(argv)
+
+    token = None
+    if args.kube_token_file:
+        with open(args.kube_token_file) as f:
+            token = f.read().strip()
+    client = KubernetesClient(args.kube_server, token, args.kube_ca_file)
+    snapshot = Snapshot()
+    try:
+        Reconciler(ChangeFeed(), client, snapshot).run(once=args.once)
+    finally:
+        client.close()
+        snapshot.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
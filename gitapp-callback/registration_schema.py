@@ -0,0 +1,285 @@
+"""
+Registration validation compiled from the RepoRegistration CRD schema.
+
+The CRD in helm/argo-stack/crds/repo-registration-crd.yaml is the source of
+truth for what a registration may contain. compile_schema() turns the
+spec's openAPIV3Schema into a flat list of rules, each a closure with its
+field lookup, bounds and regular expression resolved up front, so checking
+a record is one pass over that list with no schema walking or pattern
+compilation per call.
+
+The same compiled form checks both shapes a registration takes:
+    stored  the registration JSON that gitapp-callback saves, where the
+            installation ID is the "installation_id" string and repoUrl is
+            optional
+    spec    a RepoRegistration spec as applied to the cluster
+"""
+
+import os
+import re
+
+import yaml
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CRD_FILE = "repo-registration-crd.yaml"
+
+
+def default_crd_path():
+    """The CRD in the source tree, or the copy the image ships in crds/."""
+    source_tree = os.path.join(APP_DIR, "..", "helm", "argo-stack", "crds", CRD_FILE)
+    if os.path.exists(source_tree):
+        return os.path.normpath(source_tree)
+    return os.path.join(APP_DIR, "crds", CRD_FILE)
+
+
+CRD_PATH = os.environ.get("REGISTRATION_CRD_PATH") or default_crd_path()
+
+# Regular expressions for the string formats the CRD uses.
+FORMATS = {
+    "email": re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"),
+    "date-time": re.compile(
+        r"^\d{4}-\d{2}-\d{2}[Tt]\d{2}:\d{2}:\d{2}(\.\d+)?([Zz]|[+-]\d{2}:\d{2})$"
+    ),
+}
+
+# Decimal strings accepted for integer fields. str.isdigit() would also let
+# through digits such as "²" that int() rejects.
+_DECIMAL = re.compile(r"[0-9]+")
+
+_TYPES = {
+    "string": (str,),
+    "boolean": (bool,),
+    "object": (dict,),
+    "array": (list,),
+    "number": (int, float),
+}
+
+
+def load_crd_schema(path=CRD_PATH):
+    """
+    The openAPIV3Schema of the RepoRegistration spec.
+
+    Args:
+        path: CRD manifest to read
+
+    Returns:
+        dict: Schema of the storage version's spec
+    """
+    with open(path) as f:
+        crd = yaml.safe_load(f)
+    versions = crd["spec"]["versions"]
+    version = next((v for v in versions if v.get("storage")), versions[0])
+    return version["schema"]["openAPIV3Schema"]["properties"]["spec"]
+
+
+def is_decimal(value):
+    """True if value is a string of ASCII digits, ignoring surrounding whitespace."""
+    return isinstance(value, str) and _DECIMAL.fullmatch(value.strip()) is not None
+
+
+def _type_check(schema_type, integer_strings):
+    """Predicate for values of a schema type."""
+    if schema_type == "integer":
+        if integer_strings:
+            return lambda value: (
+                (isinstance(value, int) and not isinstance(value, bool))
+                or is_decimal(value)
+            )
+        return lambda value: isinstance(value, int) and not isinstance(value, bool)
+    types = _TYPES[schema_type]
+    if schema_type == "number":
+        return lambda value: isinstance(value, types) and not isinstance(value, bool)
+    return lambda value: isinstance(value, types)
+
+
+def _item_rule(label, items):
+    """Check for every element of an array, or None if items need no checks."""
+    item_type = items.get("type")
+    pattern = items.get("pattern") and re.compile(items["pattern"])
+    fmt = items.get("format") and FORMATS.get(items["format"])
+    if item_type == "string" and fmt is FORMATS["email"]:
+        match = fmt.match
+
+        def check(values):
+            for value in values:
+                if not isinstance(value, str) or not match(value):
+                    return f"Invalid email address: {value}"
+        return check
+    is_type = _type_check(item_type, False) if item_type else None
+    matchers = [m.match for m in (pattern, fmt) if m]
+    if is_type is None and not matchers:
+        return None
+
+    def check(values):
+        for value in values:
+            if is_type is not None and not is_type(value):
+                return f"{label} items must be of type {item_type}"
+            if matchers and isinstance(value, str):
+                for match in matchers:
+                    if not match(value):
+                        return f"Invalid {label} item: {value}"
+    return check
+
+
+def _field_rules(key, label, schema, integer_strings):
+    """
+    Flattened rules for one property of an object.
+
+    The rules of a nested object's own properties are compiled into one
+    list that runs against the nested object, looked up once.
+    """
+    def get(record):
+        return record.get(key)
+
+    rules = []
+    schema_type = schema.get("type")
+    if schema_type:
+        is_type = _type_check(schema_type, integer_strings)
+        article = "an" if schema_type[0] in "aeiou" else "a"
+        if schema_type == "array":
+            type_message = f"{label} must be a list"
+        else:
+            type_message = f"{label} must be {article} {schema_type}"
+
+        def check_type(record):
+            value = get(record)
+            if value is not None and not is_type(value):
+                return type_message
+        rules.append(check_type)
+
+    if "pattern" in schema:
+        pattern_match = re.compile(schema["pattern"]).match
+        pattern_message = f"{label} must match {schema['pattern']}"
+
+        def check_pattern(record):
+            value = get(record)
+            if isinstance(value, str) and not pattern_match(value):
+                return pattern_message
+        rules.append(check_pattern)
+
+    fmt = schema.get("format") and FORMATS.get(schema["format"])
+    if fmt is not None and schema_type == "string":
+        format_match = fmt.match
+        format_message = f"{label} must be a valid {schema['format']}"
+
+        def check_format(record):
+            value = get(record)
+            if isinstance(value, str) and not format_match(value):
+                return format_message
+        rules.append(check_format)
+
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+        minimum_message = f"{label} must be at least {minimum}"
+
+        def check_minimum(record):
+            value = get(record)
+            if is_decimal(value):
+                value = int(value)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) \
+                    and value < minimum:
+                return minimum_message
+        rules.append(check_minimum)
+
+    if schema_type == "array" and schema.get("items"):
+        check_items = _item_rule(label, schema["items"])
+        if check_items is not None:
+            def check_array(record):
+                value = get(record)
+                if isinstance(value, list):
+                    return check_items(value)
+            rules.append(check_array)
+
+    child_rules = tuple(
+        rule
+        for name, child in (schema.get("properties") or {}).items()
+        for rule in _field_rules(name, f"{label}.{name}", child, integer_strings)
+    )
+    if child_rules:
+        def check_properties(record):
+            value = get(record)
+            if isinstance(value, dict):
+                for rule in child_rules:
+                    error = rule(value)
+                    if error is not None:
+                        return error
+        rules.append(check_properties)
+    return rules
+
+
+class Validator:
+    """A compiled schema: rules run in order, each returning an error message or None."""
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+
+    def check(self, record):
+        """
+        First rule the record breaks.
+
+        Returns:
+            str: The error message, or None if the record is valid
+        """
+        for rule in self.rules:
+            error = rule(record)
+            if error is not None:
+                return error
+        return None
+
+    def validate(self, record):
+        """
+        Check a record.
+
+        Raises:
+            ValueError: Describing the first rule the record breaks
+        """
+        error = self.check(record)
+        if error is not None:
+            raise ValueError(error)
+
+
+def compile_schema(schema, field_names=None, required=None, integer_strings=False,
+                   extra_rules=()):
+    """
+    Compile an object schema into a Validator.
+
+    Optional fields may be absent or None. Unknown fields are allowed, as
+    the CRD does not forbid them.
+
+    Args:
+        schema: openAPIV3Schema of an object, e.g. from load_crd_schema()
+        field_names: {schema property: record key} for top-level fields a
+            record names differently
+        required: Properties that must be present (default: the schema's own
+            required list)
+        integer_strings: Accept decimal strings for integer fields, as
+            submitted by HTML forms
+        extra_rules: Further rules, appended after the schema's
+
+    Returns:
+        Validator
+    """
+    field_names = field_names or {}
+    if required is None:
+        required = schema.get("required", ())
+    rules = []
+    for name in required:
+        key = field_names.get(name, name)
+        message = f"{key} is required"
+
+        def check_required(record, key=key, message=message):
+            value = record.get(key)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                return message
+        rules.append(check_required)
+    for name, child in (schema.get("properties") or {}).items():
+        key = field_names.get(name, name)
+        rules.extend(_field_rules(key, key, child, integer_strings))
+    rules.extend(extra_rules)
+    return Validator(rules)
+
+
+def spec_validator(path=CRD_PATH):
+    """Validator for RepoRegistration specs, with the CRD's own rules."""
+    return compile_schema(load_crd_schema(path))
@@ -7,6 +7,7 @@ import pytest
 import sys
 import os
 import tempfile
+import threading
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -300,7 +301,7 @@ def test_database_persistence_install(client):
     
     # Submit registration
     response = client.post('/registrations', data={
-        'installation_id': 'test-install-123',
+        'installation_id': '12300001',
         'defaultBranch': 'develop',
         'adminUsers': 'admin@example.com'
     }, headers={'Accept': 'application/json'})
@@ -310,9 +311,9 @@ def test_database_persistence_install(client):
     assert json_data['success'] is True
     
     # Verify it was saved to database
-    saved_data = get_registration('test-install-123')
+    saved_data = get_registration('12300001')
     assert saved_data is not None
-    assert saved_data['installation_id'] == 'test-install-123'
+    assert saved_data['installation_id'] == '12300001'
     assert saved_data['defaultBranch'] == 'develop'
     assert 'admin@example.com' in saved_data['adminUsers']
 
@@ -323,18 +324,18 @@ def test_database_persistence_update(client):
     
     # Create initial registration
     initial_data = {
-        'installation_id': 'test-update-456',
+        'installation_id': '45600001',
         'defaultBranch': 'main',
         'adminUsers': ['admin@example.com'],
         'readUsers': [],
         'dataBucket': None,
         'artifactBucket': None
     }
-    save_registration('test-update-456', initial_data)
+    save_registration('45600001', initial_data)
     
     # Update the registration
     response = client.post('/registrations', data={
-        'installation_id': 'test-update-456',
+        'installation_id': '45600001',
         'defaultBranch': 'production',
         'adminUsers': 'admin@example.com,lead@example.com'
     }, headers={'Accept': 'application/json'})
@@ -344,7 +345,7 @@ def test_database_persistence_update(client):
     assert json_data['success'] is True
     
     # Verify the update
-    updated_data = get_registration('test-update-456')
+    updated_data = get_registration('45600001')
     assert updated_data is not None
     assert updated_data['defaultBranch'] == 'production'
     assert len(updated_data['adminUsers']) == 2
@@ -437,3 +438,754 @@ def test_missing_setup_action_defaults_to_install(client):
     
     assert response.status_code == 200
     assert b'Complete Repository Registration' in response.data
+
+
+def test_db_connection_reused_per_thread(client):
+    """Test that a thread reuses one tuned connection across calls."""
+    from app import db
+
+    conn = db.connect()
+    assert db.connect() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    # synchronous=NORMAL is 1
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_db_transaction_rolls_back_on_error(client):
+    """Test that a failed write transaction leaves no partial changes."""
+    from app import db, get_registration, upsert_registration
+
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            upsert_registration(conn, '55500001', {'tenant': 'x'})
+            raise RuntimeError('boom')
+
+    assert get_registration('55500001') is None
+    assert not db.connect().in_transaction
+
+
+def test_concurrent_saves_and_reads(client):
+    """Test that concurrent writers and readers do not hit lock errors."""
+    from app import save_registration, get_registration
+
+    errors = []
+
+    def writer(n):
+        try:
+            for i in range(25):
+                save_registration(f'{n}-{i % 5}', {'tenant': f't{n}', 'round': i})
+                get_registration(f'{(n + 1) % 8}-{i % 5}')
+        except Exception as e:  # noqa: BLE001 - collected for the assertion
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    for n in range(8):
+        assert get_registration(f'{n}-4')['round'] == 24
+
+
+def test_group_commit_batches_concurrent_saves(client):
+    """Test that concurrent saves are committed together and each is acknowledged."""
+    from app import GroupCommitWriter, get_registration, read_changes
+
+    writer = GroupCommitWriter(max_batch=16, window_ms=50)
+    barrier = threading.Barrier(16)
+
+    def submit(n):
+        barrier.wait()
+        writer.submit(f'7770{n:02d}', {'tenant': f'g{n}'})
+
+    threads = [threading.Thread(target=submit, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert writer.writes == 16
+    assert writer.batches < 16
+    for n in range(16):
+        assert get_registration(f'7770{n:02d}') == {'tenant': f'g{n}'}
+    assert len(read_changes(0, 100)) == 16
+
+
+def test_group_commit_isolates_failing_write(client):
+    """Test that a failing write in a batch fails alone and the rest are committed."""
+    from app import GroupCommitWriter, get_registration, read_changes
+
+    writer = GroupCommitWriter(max_batch=8, window_ms=50)
+    barrier = threading.Barrier(3)
+    errors = {}
+
+    def submit(installation_id, data):
+        barrier.wait()
+        try:
+            writer.submit(installation_id, data)
+        except Exception as e:  # noqa: BLE001 - collected for the assertion
+            errors[installation_id] = e
+
+    threads = [
+        threading.Thread(target=submit, args=('88800001', {'tenant': 'ok'})),
+        threading.Thread(target=submit, args=('88800002', {'tenant': object()})),
+        threading.Thread(target=submit, args=('88800003', {'tenant': 'ok'})),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert list(errors) == ['88800002']
+    assert get_registration('88800001') == {'tenant': 'ok'}
+    assert get_registration('88800002') is None
+    assert get_registration('88800003') == {'tenant': 'ok'}
+    assert sorted(c[1] for c in read_changes(0, 100)) == ['88800001', '88800003']
+
+
+def test_init_db_records_schema_version_and_is_idempotent(client):
+    """Test that init_db applies migrations once and keeps existing data."""
+    from app import db, save_registration, get_registration, SCHEMA_MIGRATIONS
+
+    save_registration('66600001', {'tenant': 'kept'})
+    init_db()
+
+    version = db.connect().execute('PRAGMA user_version').fetchone()[0]
+    assert version == len(SCHEMA_MIGRATIONS)
+    assert get_registration('66600001') == {'tenant': 'kept'}
+
+
+def test_concurrent_process_startup_initializes_db_once():
+    """Test that several workers importing the app at once all start cleanly."""
+    import subprocess
+
+    app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'registrations.sqlite')
+        env = dict(os.environ, DB_PATH=db_path)
+        workers = [
+            subprocess.Popen(
+                [sys.executable, '-c', 'import app'],
+                cwd=app_dir, env=env, stderr=subprocess.PIPE,
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            _, stderr = worker.communicate(timeout=30)
+            assert worker.returncode == 0, stderr.decode()
+
+        import sqlite3
+        from app import SCHEMA_MIGRATIONS
+        conn = sqlite3.connect(db_path)
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(SCHEMA_MIGRATIONS)
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        conn.close()
+
+
+def test_lookup_helpers_follow_saved_registrations(client):
+    """Test that user, bucket and tenant lookups track saves and updates."""
+    from app import (
+        save_registration, installations_for_user, installations_for_bucket,
+        installations_for_tenant,
+    )
+
+    save_registration('70000001', {
+        'tenant': 'ohsu/lung',
+        'adminUsers': ['Alice@example.com'],
+        'readUsers': ['bob@example.com', 'alice@example.com'],
+        'dataBucket': {'bucket': 'shared-data', 'is_aws': True},
+        'artifactBucket': None,
+    })
+    save_registration('70000002', {
+        'tenant': 'ohsu/lung',
+        'adminUsers': ['bob@example.com'],
+        'readUsers': [],
+        'dataBucket': None,
+        'artifactBucket': {'bucket': 'shared-data', 'hostname': 'https://minio.example.com'},
+    })
+
+    assert installations_for_user('alice@example.com') == ['70000001']
+    assert installations_for_user('ALICE@example.com', role='admin') == ['70000001']
+    assert installations_for_user('bob@example.com') == ['70000001', '70000002']
+    assert installations_for_user('bob@example.com', role='admin') == ['70000002']
+    assert installations_for_bucket('shared-data') == ['70000001', '70000002']
+    assert installations_for_tenant('ohsu/lung') == ['70000001', '70000002']
+
+    # An update replaces the installation's lookup rows.
+    save_registration('70000001', {
+        'tenant': 'ohsu/brain',
+        'adminUsers': ['carol@example.com'],
+        'readUsers': [],
+        'dataBucket': {'bucket': 'brain-data', 'is_aws': True},
+    })
+    assert installations_for_user('alice@example.com') == []
+    assert installations_for_user('bob@example.com') == ['70000002']
+    assert installations_for_bucket('shared-data') == ['70000002']
+    assert installations_for_bucket('brain-data') == ['70000001']
+    assert installations_for_tenant('ohsu/lung') == ['70000002']
+
+
+def test_lookups_use_indexes(client):
+    """Test that the lookup queries are index searches, not table scans."""
+    from app import (
+        db, SELECT_USER_ROLE_INSTALLATIONS_SQL, SELECT_BUCKET_INSTALLATIONS_SQL,
+        SELECT_TENANT_INSTALLATIONS_SQL,
+    )
+
+    conn = db.connect()
+    for sql, params in [
+        (SELECT_USER_ROLE_INSTALLATIONS_SQL, ('a@example.com', 'admin')),
+        (SELECT_BUCKET_INSTALLATIONS_SQL, ('bucket',)),
+        (SELECT_TENANT_INSTALLATIONS_SQL, ('tenant',)),
+    ]:
+        plan = ' '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        assert 'USING' in plan and 'INDEX' in plan, plan
+
+
+def test_migration_backfills_lookup_tables(client):
+    """Test that upgrading a pre-index database fills the lookup tables."""
+    import json
+    import sqlite3
+    import app as app_module
+
+    # Rebuild the database as the first schema version with one row in it.
+    os.unlink(app_module.DB_PATH)
+    conn = sqlite3.connect(app_module.DB_PATH)
+    for statement in app_module.SCHEMA_MIGRATIONS[0]:
+        conn.execute(statement)
+    conn.execute('PRAGMA user_version = 1')
+    conn.execute(
+        'INSERT INTO registrations (installation_id, data) VALUES (?, ?)',
+        ('80000001', json.dumps({
+            'tenant': 'legacy',
+            'adminUsers': ['old@example.com'],
+            'readUsers': ['reader@example.com'],
+            'dataBucket': {'bucket': 'legacy-data'},
+            'artifactBucket': None,
+        })),
+    )
+    conn.commit()
+    conn.close()
+
+    init_db()
+
+    assert app_module.installations_for_user('old@example.com', role='admin') == ['80000001']
+    assert app_module.installations_for_user('reader@example.com', role='read') == ['80000001']
+    assert app_module.installations_for_bucket('legacy-data') == ['80000001']
+    assert app_module.installations_for_tenant('legacy') == ['80000001']
+    assert [row[1] for row in app_module.read_changes(0, 10)] == ['80000001']
+
+
+@pytest.fixture
+def api_client(client):
+    """Test client with the JSON API enabled."""
+    import app as app_module
+
+    app_module.API_TOKEN = 'test-token'
+    yield client
+    app_module.API_TOKEN = ''
+
+
+API_HEADERS = {'Authorization': 'Bearer test-token'}
+
+
+def seed_listing(count):
+    """Save count registrations with distinct, increasing updated_at values."""
+    from app import db, save_registration
+
+    for i in range(count):
+        save_registration(f'9000{i:04d}', {
+            'tenant': 'even' if i % 2 == 0 else 'odd',
+            'adminUsers': [f'admin{i % 3}@example.com'],
+            'readUsers': [],
+            'dataBucket': {'bucket': 'b', 'accessKey': 'AK', 'secretKey': 'SK', 'is_aws': True},
+        })
+        with db.transaction() as conn:
+            conn.execute(
+                'UPDATE registrations SET updated_at = ? WHERE installation_id = ?',
+                (f'2024-01-01 00:00:{59 - i:02d}', f'9000{i:04d}'),
+            )
+
+
+def list_all(client, query):
+    """Follow next_cursor through every page and return the installation IDs."""
+    ids, cursor = [], None
+    while True:
+        url = f'/api/registrations?{query}' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get(url, headers=API_HEADERS).get_json()
+        ids.extend(item['installation_id'] for item in body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+
+def test_api_requires_token(client):
+    """Test that the JSON API is disabled without API_TOKEN and checks the token."""
+    import app as app_module
+
+    response = client.get('/api/registrations')
+    assert response.status_code == 403
+
+    app_module.API_TOKEN = 'test-token'
+    try:
+        response = client.get('/api/registrations', headers={'Authorization': 'Bearer wrong'})
+        assert response.status_code == 401
+        response = client.get('/api/registrations', headers=API_HEADERS)
+        assert response.status_code == 200
+    finally:
+        app_module.API_TOKEN = ''
+
+
+def test_list_registrations_pages_in_update_order(api_client):
+    """Test keyset pagination over all registrations without secrets."""
+    seed_listing(7)
+
+    response = api_client.get('/api/registrations?limit=3', headers=API_HEADERS)
+    body = response.get_json()
+    assert response.status_code == 200
+    # Later i were given earlier updated_at values.
+    assert [item['installation_id'] for item in body['items']] == [
+        '90000006', '90000005', '90000004'
+    ]
+    assert body['items'][0]['updated_at'] == '2024-01-01T00:00:53Z'
+    assert 'secretKey' not in body['items'][0]['registration']['dataBucket']
+    assert body['items'][0]['registration']['dataBucket']['accessKey'] == 'AK'
+    assert body['next_cursor']
+
+    assert list_all(api_client, 'limit=3') == [f'9000{i:04d}' for i in reversed(range(7))]
+
+
+def test_list_registrations_filters(api_client):
+    """Test the tenant, user, role and updated_since filters."""
+    seed_listing(7)
+
+    assert list_all(api_client, 'limit=2&tenant=even') == [
+        '90000006', '90000004', '90000002', '90000000'
+    ]
+    assert list_all(api_client, 'limit=2&user=ADMIN1@example.com') == ['90000004', '90000001']
+    assert list_all(api_client, 'user=admin1@example.com&role=read') == []
+    assert list_all(api_client, 'limit=2&updated_since=2024-01-01T00:00:57Z') == [
+        '90000002', '90000001', '90000000'
+    ]
+
+
+def test_list_registrations_rejects_bad_parameters(api_client):
+    """Test that malformed listing parameters return 400."""
+    for query in ['limit=0', 'limit=abc', 'cursor=not-a-cursor', 'updated_since=yesterday',
+                  'role=owner']:
+        response = api_client.get(f'/api/registrations?{query}', headers=API_HEADERS)
+        assert response.status_code == 400, query
+        assert response.get_json()['success'] is False
+
+
+def test_changes_poll_returns_saves_in_order(api_client):
+    """Test that every save is appended to the change feed."""
+    from app import save_registration
+
+    save_registration('91000001', {'adminUsers': ['a@example.com'],
+                                   'dataBucket': {'bucket': 'b', 'secretKey': 'SK'}})
+    save_registration('91000002', {'adminUsers': ['b@example.com']})
+    save_registration('91000001', {'adminUsers': ['c@example.com']})
+
+    body = api_client.get('/api/changes', headers=API_HEADERS).get_json()
+    assert [c['installation_id'] for c in body['changes']] == ['91000001', '91000002', '91000001']
+    assert [c['seq'] for c in body['changes']] == [1, 2, 3]
+    assert body['next_since'] == 3
+    # Changes carry the registration's current, redacted state.
+    assert body['changes'][0]['registration']['adminUsers'] == ['c@example.com']
+
+    body = api_client.get('/api/changes?since=2&limit=5', headers=API_HEADERS).get_json()
+    assert [c['seq'] for c in body['changes']] == [3]
+
+    body = api_client.get('/api/changes?since=3', headers=API_HEADERS).get_json()
+    assert body == {'changes': [], 'next_since': 3}
+
+
+def test_changes_long_poll_wakes_on_save(api_client):
+    """Test that a waiting long-poll returns as soon as a save commits."""
+    import time
+    from app import save_registration
+
+    timer = threading.Timer(0.2, save_registration, args=('92000001', {'adminUsers': []}))
+    timer.start()
+    started = time.monotonic()
+    body = api_client.get('/api/changes?since=0&wait=10', headers=API_HEADERS).get_json()
+    timer.join()
+
+    assert time.monotonic() - started < 5
+    assert [c['installation_id'] for c in body['changes']] == ['92000001']
+
+
+def test_changes_rejected_writes_are_not_logged(api_client):
+    """Test that a rolled-back write leaves no change behind."""
+    from app import db, upsert_registration
+
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            upsert_registration(conn, '93000001', {'adminUsers': []})
+            raise RuntimeError('boom')
+
+    assert api_client.get('/api/changes', headers=API_HEADERS).get_json()['changes'] == []
+
+
+def test_changes_stream_resumes_from_last_event_id(api_client):
+    """Test the server-sent event stream and its Last-Event-ID resume."""
+    import app as app_module
+
+    for i in range(3):
+        app_module.save_registration(f'9400000{i}', {'adminUsers': []})
+
+    app_module.CHANGE_STREAM_MAX_SECONDS = 0.3
+    try:
+        response = api_client.get(
+            '/api/changes/stream', headers={**API_HEADERS, 'Last-Event-ID': '1'}
+        )
+        text = response.get_data(as_text=True)
+        response.close()
+    finally:
+        app_module.CHANGE_STREAM_MAX_SECONDS = 300
+
+    assert response.mimetype == 'text/event-stream'
+    events = [block for block in text.split('\n\n') if block.startswith('id:')]
+    assert [event.splitlines()[0] for event in events] == ['id: 2', 'id: 3']
+    assert 'event: upsert' in events[0]
+    assert '"installation_id": "94000001"' in events[0]
+
+
+def test_changes_subscribers_are_bounded(api_client):
+    """Test that waiting polls and streams past the subscriber limit get 503."""
+    import app as app_module
+
+    held = [app_module._change_subscribers.acquire(blocking=False)
+            for _ in range(app_module.CHANGE_MAX_SUBSCRIBERS)]
+    assert all(held)
+    try:
+        response = api_client.get('/api/changes?wait=5', headers=API_HEADERS)
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+        assert api_client.get('/api/changes/stream', headers=API_HEADERS).status_code == 503
+        # A poll that does not wait holds no thread and is always served.
+        assert api_client.get('/api/changes', headers=API_HEADERS).status_code == 200
+    finally:
+        for _ in held:
+            app_module._change_subscribers.release()
+
+    # Finished polls and closed streams give their slots back.
+    app_module.CHANGE_STREAM_MAX_SECONDS = 0.1
+    try:
+        for _ in range(app_module.CHANGE_MAX_SUBSCRIBERS + 1):
+            api_client.get('/api/changes/stream', headers=API_HEADERS).close()
+            assert api_client.get('/api/changes?wait=0.1',
+                                  headers=API_HEADERS).status_code == 200
+    finally:
+        app_module.CHANGE_STREAM_MAX_SECONDS = 300
+
+
+def test_changes_rejects_bad_parameters(api_client):
+    """Test that malformed change-feed parameters return 400."""
+    for query in ['since=-1', 'since=x', 'limit=0', 'wait=31', 'wait=x']:
+        response = api_client.get(f'/api/changes?{query}', headers=API_HEADERS)
+        assert response.status_code == 400, query
+
+
+def bulk_record(installation_id, **overrides):
+    """A registration record valid under the form's rules."""
+    record = {
+        'installation_id': installation_id,
+        'defaultBranch': 'main',
+        'adminUsers': ['admin@example.com'],
+        'readUsers': [],
+        'dataBucket': {'bucket': 'data', 'accessKey': 'AK', 'secretKey': 'SK', 'is_aws': True},
+        'artifactBucket': None,
+    }
+    record.update(overrides)
+    return record
+
+
+def test_export_import_round_trip(api_client):
+    """Test that an export with secrets imports back unchanged."""
+    import json
+    import app as app_module
+
+    originals = [bulk_record(f'9500000{i}', tenant=f't{i}') for i in range(5)]
+    for record in originals:
+        app_module.save_registration(record['installation_id'], record)
+
+    response = api_client.get('/api/registrations/export?include_secrets=1', headers=API_HEADERS)
+    assert response.mimetype == 'application/x-ndjson'
+    exported = response.get_data(as_text=True)
+    assert [json.loads(line) for line in exported.splitlines()] == originals
+
+    # Default exports omit bucket secrets.
+    redacted = api_client.get('/api/registrations/export', headers=API_HEADERS)
+    assert 'secretKey' not in redacted.get_data(as_text=True)
+
+    # Import into a fresh database, two records per transaction.
+    os.unlink(app_module.DB_PATH)
+    init_db()
+    result = app_module.import_registrations(exported.splitlines(), batch_size=2)
+    assert result == {'imported': 5, 'rejected': 0, 'errors': []}
+    for record in originals:
+        assert app_module.get_registration(record['installation_id']) == record
+    assert app_module.installations_for_tenant('t3') == ['95000003']
+    assert len(app_module.read_changes(0, 100)) == 5
+
+
+def test_import_rejects_records_breaking_form_rules(api_client):
+    """Test that import validates every record like the form does."""
+    import json
+    from app import get_registration
+
+    lines = [
+        json.dumps(bulk_record('96000001')),
+        '{not json',
+        json.dumps(bulk_record('96000002', adminUsers=[])),
+        json.dumps(bulk_record('96000003', readUsers=['not-an-email'])),
+        json.dumps(bulk_record('96000004', dataBucket={'bucket': 'd', 'accessKey': 'AK',
+                                                       'is_aws': True})),
+        json.dumps(bulk_record('96000005', artifactBucket={
+            'bucket': 'a', 'accessKey': 'AK', 'secretKey': 'SK', 'is_aws': False,
+            'hostname': 'http://minio.example.com', 'region': 'r'})),
+        '',
+        json.dumps(['not', 'an', 'object']),
+        json.dumps(bulk_record(96000006)),
+    ]
+    response = api_client.post(
+        '/api/registrations/import', data='\n'.join(lines) + '\n', headers=API_HEADERS,
+        content_type='application/x-ndjson',
+    )
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert body['success'] is False
+    assert (body['imported'], body['rejected']) == (2, 6)
+    errors = {error['line']: error['error'] for error in body['errors']}
+    assert sorted(errors) == [2, 3, 4, 5, 6, 8]
+    assert 'admin user' in errors[3]
+    assert 'Invalid email' in errors[4]
+    assert 'access key and secret key' in errors[5]
+    assert 'https://' in errors[6]
+    assert get_registration('96000001') is not None
+    assert get_registration('96000006')['installation_id'] == '96000006'
+    assert get_registration('96000002') is None
+
+
+def test_update_form_carries_version_and_rejects_stale_submission(client):
+    """Test that a form update based on an outdated version gets a 409."""
+    from app import save_registration, get_registration
+
+    save_registration('97000001', bulk_record('97000001'))
+
+    response = client.get('/registrations?installation_id=97000001&setup_action=update')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+    assert b'name="version" value="1"' in response.data
+
+    form = {'installation_id': '97000001', 'adminUsers': 'first@example.com', 'version': '1'}
+    response = client.post('/registrations', data=form, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+    assert response.headers['ETag'] == '"2"'
+
+    # A second editor who loaded the same form submits afterwards.
+    form = {'installation_id': '97000001', 'adminUsers': 'second@example.com', 'version': '1'}
+    response = client.post('/registrations', data=form, headers={'Accept': 'application/json'})
+    assert response.status_code == 409
+    assert response.get_json()['current_version'] == 2
+    assert get_registration('97000001')['adminUsers'] == ['first@example.com']
+
+    # Without a version the form still saves unconditionally.
+    form = {'installation_id': '97000001', 'adminUsers': 'third@example.com'}
+    response = client.post('/registrations', data=form, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 3
+
+
+def test_api_put_with_if_match(api_client):
+    """Test conditional replacement of a registration through the JSON API."""
+    record = bulk_record('97000002')
+
+    response = api_client.get('/api/registrations/97000002', headers=API_HEADERS)
+    assert response.status_code == 404
+
+    response = api_client.put('/api/registrations/97000002', json=record, headers=API_HEADERS)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+
+    response = api_client.get('/api/registrations/97000002', headers=API_HEADERS)
+    assert response.get_json()['version'] == 1
+    assert 'secretKey' not in response.get_json()['registration']['dataBucket']
+    etag = response.headers['ETag']
+
+    record['defaultBranch'] = 'develop'
+    response = api_client.put('/api/registrations/97000002', json=record,
+                              headers={**API_HEADERS, 'If-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+
+    response = api_client.put('/api/registrations/97000002', json=record,
+                              headers={**API_HEADERS, 'If-Match': etag})
+    assert response.status_code == 409
+    assert response.headers['ETag'] == '"2"'
+
+    response = api_client.put('/api/registrations/97000003', json=bulk_record('97000003'),
+                              headers={**API_HEADERS, 'If-Match': '"1"'})
+    assert response.status_code == 409
+    assert response.get_json()['current_version'] is None
+
+    response = api_client.put('/api/registrations/97000002', json=record,
+                              headers={**API_HEADERS, 'If-Match': 'W/"x", *'})
+    assert response.status_code == 400
+
+    response = api_client.put('/api/registrations/97000002', json=record,
+                              headers={**API_HEADERS, 'If-Match': '"\u00b2"'})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Invalid version')
+
+    items = api_client.get('/api/registrations', headers=API_HEADERS).get_json()['items']
+    assert [item['version'] for item in items] == [2]
+
+
+def test_api_put_if_match_any_version(api_client):
+    """Test that If-Match: * replaces an existing registration at any version."""
+    record = bulk_record('97000005')
+
+    response = api_client.put('/api/registrations/97000005', json=record,
+                              headers={**API_HEADERS, 'If-Match': '*'})
+    assert response.status_code == 409
+    assert response.get_json()['current_version'] is None
+
+    api_client.put('/api/registrations/97000005', json=record, headers=API_HEADERS)
+    api_client.put('/api/registrations/97000005', json=record, headers=API_HEADERS)
+    response = api_client.put('/api/registrations/97000005', json=record,
+                              headers={**API_HEADERS, 'If-Match': ' * '})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"3"'
+
+    response = api_client.post('/registrations', data={
+        'installation_id': '97000006',
+        'adminUsers': 'admin@example.com',
+        'version': '*',
+    }, headers={'Accept': 'application/json'})
+    assert response.status_code == 409
+
+
+def test_api_put_weak_if_match_fails_precondition(api_client):
+    """Test that weak If-Match tags never match under the strong comparison."""
+    from app import get_versioned_registration
+
+    record = bulk_record('97000007')
+    api_client.put('/api/registrations/97000007', json=record, headers=API_HEADERS)
+
+    response = api_client.put('/api/registrations/97000007', json=record,
+                              headers={**API_HEADERS, 'If-Match': 'W/"1"'})
+    assert response.status_code == 412
+    assert 'weak' in response.get_json()['error']
+
+    response = api_client.post('/registrations', data={
+        'installation_id': '97000007',
+        'adminUsers': 'admin@example.com',
+    }, headers={'Accept': 'application/json', 'If-Match': 'W/"1"'})
+    assert response.status_code == 412
+    assert get_versioned_registration('97000007')[1] == 1
+
+
+def test_form_update_keeps_fields_it_does_not_collect(api_client):
+    """Test that a form update keeps fields set through the API."""
+    from app import get_registration, installations_for_tenant
+
+    record = bulk_record('97000004', repoUrl='https://github.com/org/repo.git',
+                         tenant='ohsu/brain')
+    response = api_client.put('/api/registrations/97000004', json=record, headers=API_HEADERS)
+    assert response.status_code == 200
+
+    form = {'installation_id': '97000004', 'adminUsers': 'new@example.com',
+            'defaultBranch': 'develop', 'version': '1'}
+    response = api_client.post('/registrations', data=form,
+                               headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+
+    stored = get_registration('97000004')
+    assert stored['adminUsers'] == ['new@example.com']
+    assert stored['defaultBranch'] == 'develop'
+    assert stored['repoUrl'] == 'https://github.com/org/repo.git'
+    assert stored['tenant'] == 'ohsu/brain'
+    # The form owns the buckets: leaving them empty clears them.
+    assert stored['dataBucket'] is None
+    assert installations_for_tenant('ohsu/brain') == ['97000004']
+
+
+def test_form_sets_repo_url_and_tenant(client):
+    """Test that the form saves, checks and prefills repoUrl and tenant."""
+    from app import get_registration
+
+    form = {'installation_id': '97000009', 'adminUsers': 'admin@example.com',
+            'repoUrl': ' https://github.com/org/repo.git ', 'tenant': 'ohsu/lung'}
+    response = client.post('/registrations', data=form, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    stored = get_registration('97000009')
+    assert stored['repoUrl'] == 'https://github.com/org/repo.git'
+    assert stored['tenant'] == 'ohsu/lung'
+
+    response = client.get('/registrations?installation_id=97000009&setup_action=update')
+    assert b'value="https://github.com/org/repo.git"' in response.data
+    assert b'value="ohsu/lung"' in response.data
+
+    response = client.post('/registrations', data=dict(form, repoUrl='github.com/org/repo'),
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 400
+    assert 'repoUrl' in response.get_json()['error']
+    assert get_registration('97000009')['repoUrl'] == 'https://github.com/org/repo.git'
+
+
+def test_version_checked_inside_write_transaction(client):
+    """Test that a save racing past the pre-check still fails without writing."""
+    from app import (
+        ANY_VERSION, db, upsert_registration, get_registration, read_changes, VersionConflict,
+    )
+
+    with db.transaction() as conn:
+        assert upsert_registration(conn, '97000004', {'tenant': 'a'}) == 1
+    with pytest.raises(VersionConflict):
+        with db.transaction() as conn:
+            upsert_registration(conn, '97000004', {'tenant': 'b'}, expected_version=2)
+    with pytest.raises(VersionConflict):
+        with db.transaction() as conn:
+            upsert_registration(conn, '97000008', {'tenant': 'b'}, expected_version=ANY_VERSION)
+
+    assert get_registration('97000004') == {'tenant': 'a'}
+    assert get_registration('97000008') is None
+    assert len(read_changes(0, 100)) == 1
+
+
+def test_submissions_checked_against_crd_schema(api_client):
+    """Test that form, import and API writes apply the CRD's field rules."""
+    import app as app_module
+
+    response = api_client.post('/registrations', data={
+        'installation_id': 'not-a-number',
+        'adminUsers': 'admin@example.com',
+    })
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'installation_id must be an integer'
+
+    result = app_module.import_registrations([
+        '{"installation_id": "98000001", "adminUsers": ["a@example.com"], "tenant": 7}',
+        '{"installation_id": "98000002", "adminUsers": ["a@example.com"], "isPublic": "no"}',
+    ])
+    assert [error['error'] for error in result['errors']] == [
+        'tenant must be a string', 'isPublic must be a boolean',
+    ]
+
+    response = api_client.put('/api/registrations/0', json=bulk_record('0'), headers=API_HEADERS)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'installation_id must be at least 1'
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Tests for the RepoRegistration reconciler, against the service's change feed
+and a local fake Kubernetes API server
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ['TESTING'] = '1'
+
+import app as app_module
+from reconciler import (
+    ChangeFeed, KubernetesClient, Reconciler, Snapshot, desired_object, object_name,
+)
+from registration_schema import load_crd_schema
+from werkzeug.serving import make_server
+
+
+class FakeKubernetes(BaseHTTPRequestHandler):
+    """RepoRegistration endpoints of an API server, kept in server.objects."""
+
+    def _name(self):
+        parts = self.path.split('?')[0].split('/')
+        assert parts[1:6] == ['apis', 'platform.calypr.io', 'v1alpha1', 'namespaces',
+                              parts[5]]
+        assert parts[6] == 'reporegistrations'
+        return parts[5], parts[7]
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_PATCH(self):
+        namespace, name = self._name()
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(('PATCH', name, self.headers['Content-Type'],
+                                     self.headers['Authorization']))
+        if name in self.server.failing:
+            return self._reply(500, {'message': 'injected failure'})
+        self.server.objects[(namespace, name)] = body
+        self._reply(200, body)
+
+    def do_DELETE(self):
+        namespace, name = self._name()
+        self.server.requests.append(('DELETE', name, None, self.headers['Authorization']))
+        if self.server.objects.pop((namespace, name), None) is None:
+            return self._reply(404, {'message': 'not found'})
+        self._reply(200, {})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def kube():
+    """A fake Kubernetes API server on a local port."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeKubernetes)
+    server.objects, server.requests, server.failing = {}, [], set()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05},
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def callback():
+    """The service on a temporary database, served over HTTP with the API enabled."""
+    temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite')
+    temp_db.close()
+    app_module.DB_PATH = temp_db.name
+    app_module.init_db()
+    app_module.API_TOKEN = 'test-token'
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05},
+                              daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    app_module.API_TOKEN = ''
+    os.unlink(temp_db.name)
+
+
+@pytest.fixture
+def reconciler(callback, kube, tmp_path):
+    client = KubernetesClient(f'http://127.0.0.1:{kube.server_port}', 'kube-token')
+    snapshot = Snapshot(str(tmp_path / 'snapshot.sqlite'))
+    yield Reconciler(ChangeFeed(callback, 'test-token'), client, snapshot,
+                     namespace='wf', batch_size=50)
+    client.close()
+    snapshot.close()
+
+
+def registration(installation_id, **overrides):
+    record = {
+        'installation_id': installation_id,
+        'repoUrl': f'https://github.com/org/repo-{installation_id}.git',
+        'defaultBranch': 'main',
+        'tenant': 'program/project',
+        'adminUsers': ['admin@example.com'],
+        'readUsers': [],
+        'dataBucket': {'bucket': 'data', 'accessKey': 'AK', 'secretKey': 'SK', 'is_aws': True},
+        'artifactBucket': None,
+    }
+    record.update(overrides)
+    return record
+
+
+def test_desired_object_keeps_only_crd_fields():
+    """Test that specs carry CRD fields only, so no credentials reach the cluster."""
+    obj = desired_object(load_crd_schema(), '42', registration('42'), 'wf')
+
+    assert obj['metadata']['name'] == object_name('42') == 'installation-42'
+    assert obj['metadata']['namespace'] == 'wf'
+    assert obj['spec'] == {
+        'repoUrl': 'https://github.com/org/repo-42.git',
+        'defaultBranch': 'main',
+        'tenant': 'program/project',
+        'installationId': 42,
+        'dataBucket': {'bucket': 'data'},
+        'adminUsers': ['admin@example.com'],
+        'readUsers': [],
+    }
+
+
+def test_desired_object_keeps_non_ascii_installation_id_as_string():
+    """Test that an installation ID of Unicode digits is left for the validator to reject."""
+    obj = desired_object(load_crd_schema(), '4\u00b2', registration('4\u00b2'), 'wf')
+    assert obj['spec']['installationId'] == '4\u00b2'
+
+
+def test_reconciler_applies_only_what_changed(reconciler, kube):
+    """Test that each step applies the changed registrations and nothing else."""
+    for i in range(3):
+        app_module.save_registration(f'5000000{i}', registration(f'5000000{i}'))
+    # Without a repoUrl no valid RepoRegistration can be built.
+    app_module.save_registration('50000009', registration('50000009', repoUrl=None))
+
+    stats = reconciler.step()
+    assert (stats['changes'], stats['applied'], stats['invalid']) == (4, 3, 1)
+    assert sorted(name for _, name in kube.objects) == [
+        'installation-50000000', 'installation-50000001', 'installation-50000002',
+    ]
+    spec = kube.objects[('wf', 'installation-50000001')]['spec']
+    assert spec['installationId'] == 50000001
+    assert 'secretKey' not in spec['dataBucket']
+    assert kube.requests[0][2:] == ('application/apply-patch+yaml', 'Bearer kube-token')
+    assert reconciler.step() == {'changes': 0}
+
+    # One real change and one save that leaves the object as it was.
+    kube.requests.clear()
+    app_module.save_registration('50000000', registration('50000000', defaultBranch='dev'))
+    app_module.save_registration('50000001', registration('50000001'))
+    stats = reconciler.step()
+    assert (stats['changes'], stats['applied'], stats['unchanged']) == (2, 1, 1)
+    assert [request[:2] for request in kube.requests] == [('PATCH', 'installation-50000000')]
+    assert kube.objects[('wf', 'installation-50000000')]['spec']['defaultBranch'] == 'dev'
+
+
+def test_reconciler_follows_form_edits_and_reports_drift(callback, reconciler, kube):
+    """Test that form edits are applied and a registration turned invalid counts as drift."""
+    app_module.save_registration('80000001', registration('80000001'))
+    assert reconciler.step()['applied'] == 1
+
+    # Left blank, the form's repoUrl and tenant keep their stored values.
+    form = urllib.parse.urlencode({'installation_id': '80000001', 'defaultBranch': 'dev',
+                                   'adminUsers': 'admin@example.com'}).encode()
+    request = urllib.request.Request(f'{callback}/registrations', data=form,
+                                     headers={'Accept': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+    stats = reconciler.step()
+    assert (stats['applied'], stats['invalid'], stats['drift']) == (1, 0, 0)
+    assert kube.objects[('wf', 'installation-80000001')]['spec']['defaultBranch'] == 'dev'
+
+    app_module.save_registration('80000001', registration('80000001', repoUrl=None))
+    stats = reconciler.step()
+    assert (stats['applied'], stats['invalid'], stats['drift']) == (0, 0, 1)
+    assert kube.objects[('wf', 'installation-80000001')]['spec']['repoUrl']
+
+
+def test_reconciler_applies_registration_created_with_form(callback, reconciler, kube):
+    """Test that a registration entered only through the form becomes a RepoRegistration."""
+    form = urllib.parse.urlencode({
+        'installation_id': '80000002',
+        'repoUrl': 'https://github.com/org/from-form.git',
+        'tenant': 'ohsu/lung',
+        'adminUsers': 'admin@example.com',
+    }).encode()
+    request = urllib.request.Request(f'{callback}/registrations', data=form,
+                                     headers={'Accept': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+
+    stats = reconciler.step()
+    assert (stats['applied'], stats['invalid']) == (1, 0)
+    spec = kube.objects[('wf', 'installation-80000002')]['spec']
+    assert spec['repoUrl'] == 'https://github.com/org/from-form.git'
+    assert spec['tenant'] == 'ohsu/lung'
+    assert spec['installationId'] == 80000002
+
+
+def test_reconciler_retries_failed_objects_only(reconciler, kube):
+    """Test that a failed batch keeps its position and the retry skips what succeeded."""
+    for i in range(3):
+        app_module.save_registration(f'6000000{i}', registration(f'6000000{i}'))
+    kube.failing.add('installation-60000001')
+
+    with pytest.raises(RuntimeError, match='installation-60000001'):
+        reconciler.step()
+    assert reconciler.snapshot.since == 0
+    assert len(kube.objects) == 2
+
+    kube.failing.clear()
+    kube.requests.clear()
+    stats = reconciler.step()
+    assert stats['applied'] == 1
+    assert [request[:2] for request in kube.requests] == [('PATCH', 'installation-60000001')]
+    assert reconciler.snapshot.since == 3
+
+
+def test_reconciler_deletes_removed_registrations(reconciler, kube):
+    """Test that a registration gone from the store is deleted from the cluster."""
+    app_module.save_registration('70000001', registration('70000001'))
+    reconciler.step()
+    assert ('wf', 'installation-70000001') in kube.objects
+
+    with app_module.db.transaction() as conn:
+        conn.execute("DELETE FROM registrations WHERE installation_id = '70000001'")
+        conn.execute(app_module.INSERT_CHANGE_SQL, ('70000001', 'delete'))
+    stats = reconciler.step()
+    assert stats['deleted'] == 1
+    assert kube.objects == {}
+    assert reconciler.snapshot.digest('installation-70000001') is None
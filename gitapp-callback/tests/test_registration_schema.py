@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the validator compiled from the RepoRegistration CRD schema
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from registration_schema import CRD_PATH, compile_schema, load_crd_schema, spec_validator
+
+
+def valid_spec(**overrides):
+    spec = {
+        'repoUrl': 'https://github.com/org/repo.git',
+        'installationId': 12345678,
+        'defaultBranch': 'main',
+        'tenant': 'program/project',
+        'adminUsers': ['admin@example.com'],
+        'readUsers': [],
+        'dataBucket': {'bucket': 'data', 'region': 'us-west-2', 'pathStyle': False},
+        'isPublic': False,
+    }
+    spec.update(overrides)
+    return spec
+
+
+def test_load_crd_schema_reads_spec_of_storage_version():
+    """Test that the spec schema comes from the CRD in the source tree."""
+    schema = load_crd_schema()
+    assert os.path.exists(CRD_PATH)
+    assert schema['required'] == ['repoUrl', 'installationId']
+    assert 'dataBucket' in schema['properties']
+
+
+@pytest.mark.parametrize('overrides, error', [
+    ({'repoUrl': None}, 'repoUrl is required'),
+    ({'installationId': None}, 'installationId is required'),
+    ({'repoUrl': 'git@github.com:org/repo.git'}, 'repoUrl must match'),
+    ({'installationId': 0}, 'installationId must be at least 1'),
+    ({'installationId': '12345678'}, 'installationId must be an integer'),
+    ({'installationId': True}, 'installationId must be an integer'),
+    ({'tenant': 7}, 'tenant must be a string'),
+    ({'isPublic': 'yes'}, 'isPublic must be a boolean'),
+    ({'dataBucket': 'data'}, 'dataBucket must be an object'),
+    ({'dataBucket': {'bucket': 'data', 'pathStyle': 'true'}},
+     'dataBucket.pathStyle must be a boolean'),
+    ({'adminUsers': 'admin@example.com'}, 'adminUsers must be a list'),
+    ({'readUsers': ['reader@example.com', 'bob']}, 'Invalid email address: bob'),
+])
+def test_spec_validator_applies_crd_rules(overrides, error):
+    """Test each kind of rule compiled from the CRD."""
+    validator = spec_validator()
+    assert validator.check(valid_spec()) is None
+    message = validator.check(valid_spec(**overrides))
+    assert message is not None and message.startswith(error)
+    with pytest.raises(ValueError):
+        validator.validate(valid_spec(**overrides))
+
+
+def test_compile_schema_options():
+    """Test field renaming, required overrides, integer strings and extra rules."""
+    validator = compile_schema(
+        load_crd_schema(),
+        field_names={'installationId': 'installation_id'},
+        required=('installationId',),
+        integer_strings=True,
+        extra_rules=[lambda record: 'no tenant' if 'tenant' not in record else None],
+    )
+    assert validator.check({'installation_id': '42', 'tenant': 't'}) is None
+    assert validator.check({'installation_id': ' ', 'tenant': 't'}) == 'installation_id is required'
+    assert validator.check({'installation_id': '0', 'tenant': 't'}).startswith('installation_id')
+    assert validator.check({'installation_id': 'abc', 'tenant': 't'}) == (
+        'installation_id must be an integer'
+    )
+    assert validator.check({'installation_id': '42'}) == 'no tenant'
+    # Only ASCII digits: int() rejects other Unicode digits.
+    for value in ('\u00b2', '4\u00b2', '\u0664\u0662'):
+        assert validator.check({'installation_id': value, 'tenant': 't'}) == (
+            'installation_id must be an integer'
+        )
+
+
+def test_validator_follows_crd_changes(tmp_path):
+    """Test that rules come from the CRD file rather than being hard-coded."""
+    with open(CRD_PATH) as f:
+        crd = f.read()
+    pattern = "pattern: '^https://.+\\.git$'"
+    assert pattern in crd
+    changed = tmp_path / 'crd.yaml'
+    changed.write_text(crd.replace(pattern, "pattern: '^https://github\\.com/.+\\.git$'"))
+
+    spec = valid_spec(repoUrl='https://gitlab.com/org/repo.git')
+    assert spec_validator().check(spec) is None
+    assert spec_validator(str(changed)).check(spec).startswith('repoUrl must match')
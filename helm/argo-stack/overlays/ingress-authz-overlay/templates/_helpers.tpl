@@ -50,11 +50,17 @@ app.kubernetes.io/instance: {{ .Release.Name }}
 
 {{/*
 Create the auth-url for NGINX ingress external auth.
+In sidecar mode the host is the name of an NGINX upstream that points at the
+adapter's Unix domain socket; NGINX resolves upstream names before DNS.
 */}}
 {{- define "ingress-authz-overlay.authUrl" -}}
 {{- $adapter := .Values.ingressAuthzOverlay.authzAdapter -}}
+{{- if and $adapter.sidecar $adapter.sidecar.enabled -}}
+http://{{ $adapter.sidecar.upstreamName | default "authz_adapter_uds" }}{{ $adapter.path }}
+{{- else -}}
 http://{{ $adapter.serviceName }}.{{ $adapter.namespace }}.svc.cluster.local:{{ $adapter.port }}{{ $adapter.path }}
 {{- end }}
+{{- end }}
 
 {{/*
 Create common ingress annotations for NGINX external auth.
@@ -69,4 +75,10 @@ nginx.ingress.kubernetes.io/auth-snippet: |
   proxy_set_header X-Original-URI $request_uri;
   proxy_set_header X-Original-Method $request_method;
   proxy_set_header X-Forwarded-Host $host;
+  proxy_set_header X-Real-IP $remote_addr;
+{{- if .Values.ingressAuthzOverlay.authzAdapter.accessLogTiming.enabled }}
+nginx.ingress.kubernetes.io/configuration-snippet: |
+  auth_request_set $authz_server_timing $upstream_http_server_timing;
+  auth_request_set $authz_cache $upstream_http_x_authz_cache;
+{{- end }}
 {{- end }}
@@ -70,3 +70,12 @@ Feature: Authz ingress overlay
     When I send 10 concurrent GET requests to "https://calypr-demo.ddns.net/workflows"
     Then all responses should have status 200
     And the average response time should be less than 500ms
+
+  Scenario: Sidecar mode authorizes over the Unix domain socket
+    Given the overlay is installed with "ingressAuthzOverlay.authzAdapter.sidecar.enabled=true"
+    And the ingress-nginx controller runs the authz-adapter sidecar
+    Then every ingress should have auth-url "http://authz_adapter_uds/check"
+    And the socket "/var/run/authz-adapter/adapter.sock" should exist in the controller pod
+    Given I am authenticated
+    When I send a GET request to "https://calypr-demo.ddns.net/workflows"
+    Then the response status should be 200